@@ -6,7 +6,11 @@ AUTH_TOKENS = settings.AUTH_TOKENS
 AWS_ID = AUTH_TOKENS.get("AWS_ACCESS_KEY_ID", None)
 AWS_KEY = AUTH_TOKENS.get("AWS_SECRET_ACCESS_KEY", None)
 
+# "s3", or "local" to store in COURSE_EXPORT_PLUGIN_STORAGE_DIR, which must be shared by workers and web servers
 COURSE_EXPORT_PLUGIN_STORAGE_TYPE = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_STORAGE_TYPE", "s3")
+COURSE_EXPORT_PLUGIN_STORAGE_DIR = ENV_TOKENS.get(
+    "COURSE_EXPORT_PLUGIN_STORAGE_DIR", "/edx/var/openedx_export_plugins/storage"
+)
 COURSE_EXPORT_PLUGIN_BUCKET = ENV_TOKENS.get(
     "COURSE_EXPORT_PLUGIN_BUCKET",
     AUTH_TOKENS.get('AWS_STORAGE_BUCKET_NAME', None)
@@ -14,6 +18,12 @@ COURSE_EXPORT_PLUGIN_BUCKET = ENV_TOKENS.get(
 COURSE_EXPORT_PLUGIN_STORAGE_PREFIX = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_STORAGE_PREFIX", "course_exports")
 COURSE_EXPORT_PLUGIN_STORAGE_OVERWRITE = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_STORAGE_OVERWRITE", False)
 COURSE_EXPORT_PLUGIN_TASK_NOTIFY_ON_ERROR = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_TASK_NOTIFY_ON_ERROR", ())
+# seconds the signed S3 URLs export job artifacts are downloaded from stay valid
+COURSE_EXPORT_PLUGIN_JOB_DOWNLOAD_URL_EXPIRES = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_JOB_DOWNLOAD_URL_EXPIRES", 300)
+# seconds without progress after which pending or running export jobs, whose task was lost, are failed
+COURSE_EXPORT_PLUGIN_JOB_STALE_AFTER = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_JOB_STALE_AFTER", 6 * 3600)
+# seconds after their last change that finished export jobs are deleted with their artifacts (0 to keep them)
+COURSE_EXPORT_PLUGIN_JOB_EXPIRES = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_JOB_EXPIRES", 7 * 24 * 3600)
 COURSE_EXPORT_PLUGIN_TASK_QUEUE = ENV_TOKENS.get(
     "COURSE_EXPORT_PLUGIN_TASK_QUEUE",
     getattr(settings, "HIGH_MEM_QUEUE", settings.DEFAULT_PRIORITY_QUEUE)
@@ -26,6 +36,100 @@ COURSE_EXPORT_PLUGIN_TASK_SCHEDULE = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_TASK_S
     "month_of_year": "*",
 })
 COURSE_EXPORT_PLUGIN_SCHEDULED_PLUGINS = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_SCHEDULED_PLUGINS", ())
+# scheduled exports serialize each course to OLX once for all plugins that only post-process the OLX export,
+# instead of once per plugin; not used with COURSE_EXPORT_PLUGIN_TASK_FANOUT, INCREMENTAL, RUN_JOURNAL or more
+# than one EXPORT_WORKERS, which shared exports don't support
+COURSE_EXPORT_PLUGIN_SHARED_OLX = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_SHARED_OLX", False)
+# run scheduled exports as a subtask per course and a final task archiving their outputs, at most
+# CONCURRENCY courses at a time, collecting the outputs in a directory shared by the queue's workers
+COURSE_EXPORT_PLUGIN_TASK_FANOUT = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_TASK_FANOUT", False)
+COURSE_EXPORT_PLUGIN_TASK_FANOUT_CONCURRENCY = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_TASK_FANOUT_CONCURRENCY", 4)
+COURSE_EXPORT_PLUGIN_TASK_FANOUT_DIR = ENV_TOKENS.get(
+    "COURSE_EXPORT_PLUGIN_TASK_FANOUT_DIR", "/edx/var/openedx_export_plugins/fanout"
+)
+# seconds after which output directories left under FANOUT_DIR by fanned out exports that never finished are removed
+COURSE_EXPORT_PLUGIN_TASK_FANOUT_MAX_AGE = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_TASK_FANOUT_MAX_AGE", 2 * 24 * 3600)
+# times a course subtask is retried on unexpected errors, and seconds between the tries
+COURSE_EXPORT_PLUGIN_TASK_FANOUT_RETRIES = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_TASK_FANOUT_RETRIES", 2)
+COURSE_EXPORT_PLUGIN_TASK_FANOUT_RETRY_DELAY = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_TASK_FANOUT_RETRY_DELAY", 60)
+# times a course subtask is redelivered after its worker was lost before the course is left out of the archive
+COURSE_EXPORT_PLUGIN_TASK_FANOUT_REDELIVERIES = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_TASK_FANOUT_REDELIVERIES", 2)
+# archive of scheduled exports: "tar" or "zip"
+COURSE_EXPORT_PLUGIN_TASK_ARCHIVE_FORMAT = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_TASK_ARCHIVE_FORMAT", "tar")
+# compression of stored tar archives: "gzip", "xz", "zstd" (requires the zstandard package) or "none";
+# the level defaults to the codec's, more than one thread compresses in parallel
+COURSE_EXPORT_PLUGIN_ARCHIVE_COMPRESSION = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_ARCHIVE_COMPRESSION", "gzip")
+COURSE_EXPORT_PLUGIN_ARCHIVE_COMPRESSION_LEVEL = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_ARCHIVE_COMPRESSION_LEVEL", None)
+COURSE_EXPORT_PLUGIN_ARCHIVE_COMPRESSION_THREADS = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_ARCHIVE_COMPRESSION_THREADS", 1)
+
+# write the intermediate OLX export to a RAM-backed (tmpfs) filesystem instead of disk
+COURSE_EXPORT_PLUGIN_MEMORY_FS = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_MEMORY_FS", False)
+COURSE_EXPORT_PLUGIN_MEMORY_FS_ROOT = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_MEMORY_FS_ROOT", "/dev/shm")
+
+# how XSLT transforms walk the course tree: 'dynamic' (document() lookups from the stylesheet),
+# 'assembled' (tree assembled in Python, plain XSLT pass) or 'compare' (run both, log differences)
+COURSE_EXPORT_PLUGIN_COURSE_TREE_MODE = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_COURSE_TREE_MODE", "dynamic")
+
+# write Markdown exports one chapter at a time to bound peak memory
+COURSE_EXPORT_PLUGIN_MARKDOWN_STREAMING = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_MARKDOWN_STREAMING", False)
+
+# number of processes transforming the chapters of a Markdown export in parallel, or threads in daemonic
+# processes like Celery's prefork pool workers; 1 transforms serially
+COURSE_EXPORT_PLUGIN_MARKDOWN_TRANSFORM_WORKERS = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_MARKDOWN_TRANSFORM_WORKERS", 1)
+
+# normalize all HTML fragments of an export to XHTML before the transform: 0 normalizes lazily during
+# the transform, 1 in bulk serially, more in a pool of that many "thread" or "process" workers
+COURSE_EXPORT_PLUGIN_HTML_NORMALIZE_WORKERS = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_HTML_NORMALIZE_WORKERS", 0)
+COURSE_EXPORT_PLUGIN_HTML_NORMALIZE_POOL = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_HTML_NORMALIZE_POOL", "thread")
+
+# number of courses multi-course exports export concurrently, in a pool of "process" or "thread" workers;
+# 1 exports them one at a time
+COURSE_EXPORT_PLUGIN_EXPORT_WORKERS = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_EXPORT_WORKERS", 1)
+COURSE_EXPORT_PLUGIN_EXPORT_POOL = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_EXPORT_POOL", "process")
+# bytes of scratch space concurrent course exports may use before new ones wait for running ones; 0 is unbounded.
+# Only applies with more than one EXPORT_WORKERS: serial exports hold one course's scratch space at a time
+COURSE_EXPORT_PLUGIN_SCRATCH_DISK_BUDGET = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_SCRATCH_DISK_BUDGET", 0)
+# order of courses in multi-course export tar files with concurrent exports: "course" or "completion"
+COURSE_EXPORT_PLUGIN_EXPORT_ORDER = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_EXPORT_ORDER", "course")
+
+# scheduled exports reuse the previous output of courses unchanged since, kept in a directory per plugin
+COURSE_EXPORT_PLUGIN_INCREMENTAL = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_INCREMENTAL", False)
+COURSE_EXPORT_PLUGIN_INCREMENTAL_DIR = ENV_TOKENS.get(
+    "COURSE_EXPORT_PLUGIN_INCREMENTAL_DIR", "/edx/var/openedx_export_plugins/incremental"
+)
+
+# scheduled exports journal each finished course of a run, keeping its output in a directory per plugin and
+# run, so a run interrupted by a killed worker resumes from its first unfinished course when restarted
+COURSE_EXPORT_PLUGIN_RUN_JOURNAL = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_RUN_JOURNAL", False)
+COURSE_EXPORT_PLUGIN_RUN_JOURNAL_DIR = ENV_TOKENS.get(
+    "COURSE_EXPORT_PLUGIN_RUN_JOURNAL_DIR", "/edx/var/openedx_export_plugins/runs"
+)
+# seconds without a course finishing after which a run is no longer considered in progress, and may be resumed
+# by another process; a run whose process died on the same host may be resumed at once
+COURSE_EXPORT_PLUGIN_RUN_JOURNAL_LOCK_TIMEOUT = ENV_TOKENS.get(
+    "COURSE_EXPORT_PLUGIN_RUN_JOURNAL_LOCK_TIMEOUT", 6 * 3600
+)
+
+# export each course in a child process of its own, killed, logged and skipped once its peak RSS exceeds
+# ISOLATION_MAX_RSS bytes or it runs longer than ISOLATION_TIMEOUT seconds (0 for no limit); children forked
+# by one of several EXPORT_WORKERS threads may wait forever on a lock held by another thread at the fork,
+# so they keep a time limit
+COURSE_EXPORT_PLUGIN_ISOLATION = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_ISOLATION", False)
+COURSE_EXPORT_PLUGIN_ISOLATION_MAX_RSS = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_ISOLATION_MAX_RSS", 0)
+COURSE_EXPORT_PLUGIN_ISOLATION_TIMEOUT = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_ISOLATION_TIMEOUT", 3600)
+
+# cache course export outputs by course version, plugin and stylesheets: None (off), "local" or "s3",
+# evicting the least recently used beyond the size bound
+COURSE_EXPORT_PLUGIN_RESULT_CACHE = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_RESULT_CACHE", None)
+COURSE_EXPORT_PLUGIN_RESULT_CACHE_DIR = ENV_TOKENS.get(
+    "COURSE_EXPORT_PLUGIN_RESULT_CACHE_DIR", "/edx/var/openedx_export_plugins/cache"
+)
+COURSE_EXPORT_PLUGIN_RESULT_CACHE_MAX_BYTES = ENV_TOKENS.get(
+    "COURSE_EXPORT_PLUGIN_RESULT_CACHE_MAX_BYTES", 10 * 1024 ** 3
+)
+
+# engine converting HTML content to Markdown: "xsl" (html_to_markdown_2.xsl) or "python" (html_markdown module)
+COURSE_EXPORT_PLUGIN_MARKDOWN_ENGINE = ENV_TOKENS.get("COURSE_EXPORT_PLUGIN_MARKDOWN_ENGINE", "xsl")
 
 # url settings for xsl transformers
 SCHEME = "https://" if settings.HTTPS == "on" else "http://"
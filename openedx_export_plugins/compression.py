@@ -0,0 +1,364 @@
+"""
+Incremental compression of streamed and stored export files.
+
+Compressors take data piece by piece with compress(), can be flushed so
+everything passed so far can be decompressed (except xz ones), and end
+their stream with finish().  gzip and xz compressors given more than one thread compress
+blocks of the input in a thread pool, zstd ones use the multi-threaded
+compression of the zstandard package.  close() releases a compressor's
+threads without ending its stream, e.g. when the export fails; finish()
+releases them too.
+"""
+
+import collections
+import lzma
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# size of the input blocks compressed in parallel; xz needs larger blocks to compress well
+GZIP_BLOCK_SIZE = 1024 * 1024
+XZ_BLOCK_SIZE = 8 * 1024 * 1024
+# window of preceding data priming the compression of each gzip block
+GZIP_DICT_SIZE = 32 * 1024
+
+
+class GzipStreamCompressor(object):
+    """
+    Compress a stream of bytes to the gzip format piece by piece.
+    """
+    name = "gzip"
+    content_type = "application/gzip"
+    filename_extension = "gz"
+
+    def __init__(self, level=None, threads=1):
+        self.level = 6 if level is None else level
+        self._compressor = zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        """
+        Compress data, returning whatever compressed bytes are ready, possibly none.
+        """
+        return self._compressor.compress(data)
+
+    def flush(self):
+        """
+        Return the compressed bytes of all data passed so far, keeping the stream open.
+        """
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        """
+        Return the remaining compressed bytes and end the stream.
+        """
+        return self._compressor.flush(zlib.Z_FINISH)
+
+    def close(self):
+        """
+        Release the compressor, which holds no threads of its own.
+        """
+
+
+class _BlockParallelCompressor(object):
+    """
+    Compress blocks of the input in a thread pool, returning the compressed blocks in input order.
+
+    zlib and lzma release the GIL while compressing, so the blocks are
+    compressed truly in parallel.  At most two blocks per thread are in
+    flight; compress() waits for the oldest when that many are.
+    """
+    block_size = None
+
+    def __init__(self, threads):
+        self.threads = threads
+        self._executor = ThreadPoolExecutor(max_workers=threads)
+        self._block = bytearray()
+        self._in_flight = collections.deque()
+
+    def compress(self, data):
+        """
+        Compress data, returning whatever compressed bytes are ready, possibly none.
+        """
+        self._block += data
+        while len(self._block) >= self.block_size:
+            block = bytes(self._block[:self.block_size])
+            del self._block[:self.block_size]
+            self._submit(block)
+        return self._collect(wait=False)
+
+    def flush(self):
+        """
+        Return the compressed bytes of all data passed so far, keeping the stream open.
+        """
+        if self._block:
+            self._submit(bytes(self._block))
+            self._block = bytearray()
+        return self._collect(wait=True)
+
+    def finish(self):
+        """
+        Return the remaining compressed bytes and end the stream.
+        """
+        try:
+            return self.flush() + self._end()
+        finally:
+            self._executor.shutdown()
+
+    def close(self):
+        """
+        Drop the blocks not compressed yet and shut the thread pool down, without ending the stream.
+        """
+        while self._in_flight:
+            self._in_flight.popleft().cancel()
+        self._executor.shutdown()
+
+    def _submit(self, block):
+        self._in_flight.append(self._executor.submit(*self._block_task(block)))
+
+    def _collect(self, wait):
+        compressed = []
+        while self._in_flight and (wait or self._in_flight[0].done() or len(self._in_flight) > self.threads * 2):
+            compressed.append(self._in_flight.popleft().result())
+        return b''.join(compressed)
+
+    def _block_task(self, block):
+        """
+        Get the function and arguments compressing a block.
+        """
+        raise NotImplementedError
+
+    def _end(self):
+        return b''
+
+
+class ParallelGzipStreamCompressor(_BlockParallelCompressor):
+    """
+    Compress a stream of bytes to a single gzip member, compressing blocks in parallel like pigz.
+
+    Each block is a run of raw deflate data primed with the preceding 32 KiB
+    of input and ended at a byte boundary, so the blocks join up to one
+    deflate stream.  The CRC is computed as the data is passed.
+    """
+    name = GzipStreamCompressor.name
+    content_type = GzipStreamCompressor.content_type
+    filename_extension = GzipStreamCompressor.filename_extension
+    block_size = GZIP_BLOCK_SIZE
+
+    # gzip header: magic, deflate, no flags, no mtime, no extra flags, unknown OS
+    HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+
+    def __init__(self, level=None, threads=2):
+        super(ParallelGzipStreamCompressor, self).__init__(threads)
+        self.level = 6 if level is None else level
+        self._crc = 0
+        self._size = 0
+        self._dictionary = b''
+        self._header = self.HEADER
+
+    def compress(self, data):
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        return self._with_header(super(ParallelGzipStreamCompressor, self).compress(data))
+
+    def flush(self):
+        return self._with_header(super(ParallelGzipStreamCompressor, self).flush())
+
+    def _with_header(self, compressed):
+        if self._header and compressed:
+            compressed, self._header = self._header + compressed, b''
+        return compressed
+
+    def _block_task(self, block):
+        dictionary, self._dictionary = self._dictionary, block[-GZIP_DICT_SIZE:]
+        return _deflate_block, block, self.level, dictionary
+
+    def _end(self):
+        final_block = zlib.compressobj(self.level, zlib.DEFLATED, -zlib.MAX_WBITS).flush(zlib.Z_FINISH)
+        return self._header + final_block + struct.pack('<LL', self._crc & 0xffffffff, self._size & 0xffffffff)
+
+
+def _deflate_block(block, level, dictionary):
+    if dictionary:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS, zdict=dictionary)
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(block) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+class XzStreamCompressor(object):
+    """
+    Compress a stream of bytes to the xz format piece by piece.
+    """
+    name = "xz"
+    content_type = "application/x-xz"
+    filename_extension = "xz"
+
+    def __init__(self, level=None, threads=1):
+        self.level = 6 if level is None else level
+        self._compressor = lzma.LZMACompressor(preset=self.level)
+
+    def compress(self, data):
+        """
+        Compress data, returning whatever compressed bytes are ready, possibly none.
+        """
+        return self._compressor.compress(data)
+
+    def flush(self):
+        """
+        Return nothing: xz streams can't be flushed midway, their data comes as buffers fill and at finish().
+        """
+        return b''
+
+    def finish(self):
+        """
+        Return the remaining compressed bytes and end the stream.
+        """
+        return self._compressor.flush()
+
+    def close(self):
+        """
+        Release the compressor, which holds no threads of its own.
+        """
+
+
+class ParallelXzStreamCompressor(_BlockParallelCompressor):
+    """
+    Compress a stream of bytes to concatenated xz streams, one per block, compressed in parallel.
+
+    xz tools and the lzma module read concatenated streams as one.
+    """
+    name = XzStreamCompressor.name
+    content_type = XzStreamCompressor.content_type
+    filename_extension = XzStreamCompressor.filename_extension
+    block_size = XZ_BLOCK_SIZE
+
+    def __init__(self, level=None, threads=2):
+        super(ParallelXzStreamCompressor, self).__init__(threads)
+        self.level = 6 if level is None else level
+        self._empty = True
+
+    def _block_task(self, block):
+        self._empty = False
+        return lzma.compress, block, lzma.FORMAT_XZ, -1, self.level
+
+    def _end(self):
+        # an empty input still needs a stream
+        return lzma.compress(b'', preset=self.level) if self._empty else b''
+
+
+class ZstdStreamCompressor(object):
+    """
+    Compress a stream of bytes to the Zstandard format piece by piece.
+
+    Requires the zstandard package.
+    """
+    name = "zstd"
+    content_type = "application/zstd"
+    filename_extension = "zst"
+
+    def __init__(self, level=None, threads=1):
+        self.level = 3 if level is None else level
+        self._compressor = zstandard.ZstdCompressor(
+            level=self.level, threads=threads if threads > 1 else 0
+        ).compressobj()
+
+    def compress(self, data):
+        """
+        Compress data, returning whatever compressed bytes are ready, possibly none.
+        """
+        return self._compressor.compress(data)
+
+    def flush(self):
+        """
+        Return the compressed bytes of all data passed so far, keeping the stream open.
+        """
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self):
+        """
+        Return the remaining compressed bytes and end the stream.
+        """
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+
+    def close(self):
+        """
+        Release the compressor; the threads of the zstandard package end with it.
+        """
+
+
+STREAM_COMPRESSORS = {
+    GzipStreamCompressor.name: GzipStreamCompressor,
+    ZstdStreamCompressor.name: ZstdStreamCompressor,
+    XzStreamCompressor.name: XzStreamCompressor,
+}
+
+PARALLEL_STREAM_COMPRESSORS = {
+    ParallelGzipStreamCompressor.name: ParallelGzipStreamCompressor,
+    ParallelXzStreamCompressor.name: ParallelXzStreamCompressor,
+}
+
+
+def available_stream_compressions():
+    """
+    Get the names of the stream compressions usable in this environment, preferred first.
+    """
+    names = [GzipStreamCompressor.name, XzStreamCompressor.name]
+    if zstandard is not None:
+        names.insert(0, ZstdStreamCompressor.name)
+    return names
+
+
+def available_streamed_compressions():
+    """
+    Get the names of the compressions usable for streamed responses, preferred first.
+
+    xz is left out: its compressors can't be flushed, so nothing of a
+    streamed course would reach the client before the buffers fill.
+    """
+    return [name for name in available_stream_compressions() if name != XzStreamCompressor.name]
+
+
+def get_stream_compressor(name, level=None, threads=1):
+    """
+    Get a new compressor for the named compression, or None if it is not available.
+
+    level defaults to the codec's default level.  With more than one thread
+    the compressor compresses in parallel.
+    """
+    if name not in available_stream_compressions():
+        return None
+    if threads > 1 and name in PARALLEL_STREAM_COMPRESSORS:
+        return PARALLEL_STREAM_COMPRESSORS[name](level=level, threads=threads)
+    return STREAM_COMPRESSORS[name](level=level, threads=threads)
+
+
+class CompressedFile(object):
+    """
+    Write-only file object compressing what is written to it into another file object.
+
+    Closing it ends the compressed stream but leaves the underlying file open.
+    """
+    def __init__(self, fileobj, compressor):
+        self.fileobj = fileobj
+        self.compressor = compressor
+        self.closed = False
+
+    def write(self, data):
+        compressed = self.compressor.compress(data)
+        if compressed:
+            self.fileobj.write(compressed)
+        return len(data)
+
+    def flush(self):
+        self.fileobj.flush()
+
+    def close(self):
+        if not self.closed:
+            self.fileobj.write(self.compressor.finish())
+            self.closed = True
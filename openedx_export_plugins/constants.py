@@ -4,3 +4,5 @@ Constants for openedx_export_plugins Django app.
 
 EXPORT_FILENAME_FORMAT_MULTIPLE = "all_courses_as_{}_{}.tar"
 EXPORT_FILENAME_FORMAT_MULTIPLE_NO_DATE = "all_courses_as_{}.tar"
+EXPORT_FILENAME_FORMAT_MULTIPLE_ZIP = "all_courses_as_{}_{}.zip"
+EXPORT_FILENAME_FORMAT_MULTIPLE_ZIP_NO_DATE = "all_courses_as_{}.zip"
@@ -2,26 +2,80 @@
 Core export functionality.
 """
 
+import collections
+import contextlib
 import datetime
 import io
 import logging
+import multiprocessing
 import os
+import pickle
+import select
 import shutil
+import signal
 import tarfile
+import tempfile
+import threading
+import time
+import traceback
+import zipfile
+from concurrent import futures
 
-from django.core.exceptions import PermissionDenied
+from django import db
+from django.core.exceptions import ImproperlyConfigured, PermissionDenied
 
 from xmodule.contentstore.django import contentstore
 from xmodule.exceptions import SerializationError
-from xmodule.modulestore.django import modulestore
+from xmodule.modulestore.django import clear_existing_modulestores, modulestore
 
+from openedx.core.djangoapps.content.course_overviews.models import CourseOverview
 from student.auth import has_course_author_access
+from student.models import CourseAccessRole
+from student.roles import CourseInstructorRole, CourseStaffRole, GlobalStaff
 
-from . import exceptions
+from . import app_settings, compression, exceptions, export_cache, utils
+from .exporters import base, xslt
 
 
 logger = logging.getLogger(__name__)
 
+# size of the pieces course export files are streamed in
+TAR_STREAM_CHUNK_SIZE = 64 * 1024
+
+# files from this size on are written as ZIP64 members, leaving room for deflate's worst-case expansion
+ZIP64_THRESHOLD = zipfile.ZIP64_LIMIT - zipfile.ZIP64_LIMIT // 100
+
+# seconds between checks of the memory use and run time of isolated course exports
+ISOLATION_POLL_INTERVAL = 0.1
+
+# prefix of the keys of CCX courses, which can't be exported as Studio gives nobody author access to them
+CCX_KEY_PREFIX = 'ccx-v1:'
+
+# process id of the pool process the modulestore was last reset in, see _do_course_export_in_process
+_export_process_pid = None
+
+# held from creating the pipe to a forked child until its write end is closed in this process, so children
+# forked by other threads don't inherit the write end and keep the pipe from reaching end of file
+_fork_lock = threading.Lock()
+
+# database connections inherited by a forked child, kept referenced so they're never closed under the parent
+_inherited_db_connections = []
+
+
+def get_course_keys(orgs=None, modified_since=None):
+    """
+    Get the keys of all courses, optionally only those of the given orgs or modified since a datetime.
+
+    Keys are read from the course overviews, without loading any course from the modulestore.
+    CCX courses are left out.
+    """
+    overviews = CourseOverview.objects.exclude(id__startswith=CCX_KEY_PREFIX)
+    if orgs:
+        overviews = overviews.filter(org__in=orgs)
+    if modified_since is not None:
+        overviews = overviews.filter(modified__gte=modified_since)
+    return list(overviews.order_by('id').values_list('id', flat=True))
+
 
 def export_course_single(user, plugin_class, tempdir, course_key):
     """
@@ -30,40 +84,501 @@ def export_course_single(user, plugin_class, tempdir, course_key):
     if not has_course_author_access(user, course_key):
         raise PermissionDenied()
 
-    (outfilepath, out_fn) = _do_course_export(plugin_class, tempdir, course_key)
+    (outfilepath, out_fn) = _export_course(plugin_class, tempdir, course_key)
     return (outfilepath, out_fn)
 
 
-def export_courses_multiple(user, plugin_class, course_keys, tempdir, outfilename, stream=False, check_author_perms=True):
+def export_courses_multiple(user, plugin_class, course_keys, tempdir, outfilename, stream=False,
+                            check_author_perms=True, compressor=None, export_record=None, run_journal=None,
+                            archive_format='tar', progress=None):
     """
     Build a tar file from multi-course export and either yield its bytes to stream
-    or yield a finished gzipped tar file.
+    or yield a finished tar file, compressed as COURSE_EXPORT_PLUGIN_ARCHIVE_COMPRESSION
+    configures (gzip by default).
+
+    When streaming, the bytes are compressed with compressor if one is given
+    (see the compression module), flushing them after each course.
+
+    With an export_record (see the incremental module) courses whose kept
+    output is current are not exported again, and fresh outputs are kept.
+
+    With a run_journal (see the journal module) courses finished earlier in
+    the run are not exported again, and each course is journaled as it
+    finishes.
+
+    With archive_format 'zip' a ZIP file with individually deflated members
+    is built instead, and compressor is not used.
+
+    progress, if given, is called with the number of courses exported so far
+    and the number of courses to export, first with none exported and then
+    as each course is.  Courses that fail to export aren't counted.
+    """
+    if check_author_perms:
+        course_keys = _permitted_course_keys(user, course_keys)
+    if progress is not None:
+        course_keys = list(course_keys)
+        progress(0, len(course_keys))
+
+    if run_journal is not None:
+        course_outputs = _export_courses_resumably(plugin_class, tempdir, course_keys, run_journal, export_record)
+    elif export_record is not None:
+        course_outputs = _export_courses_incrementally(plugin_class, tempdir, course_keys, export_record)
+    else:
+        course_outputs = _export_courses(plugin_class, tempdir, course_keys)
+    if progress is not None:
+        course_outputs = _reported_course_outputs(course_outputs, len(course_keys), progress)
+    course_outputs = _archived_course_outputs(course_outputs, tempdir)
+
+    if archive_format == 'zip':
+        archive = _zip_courses(course_outputs, tempdir, outfilename, stream)
+    else:
+        archive = _tar_courses(course_outputs, tempdir, outfilename, stream, compressor)
+    for archive_data in archive:
+        yield archive_data
+
+
+def export_course_part(plugin_class, course_key, parts_dir):
+    """
+    Export a course and move the output into parts_dir, to be archived later by archive_course_parts.
+
+    Raises ExportPluginsCourseExportError if the course can't be exported.
+    """
+    with utils.TemporaryDirectory() as tempdir:
+        output_filepath, __ = _export_course(plugin_class, tempdir, course_key)
+        part_path = _get_part_path(plugin_class, course_key, parts_dir)
+        shutil.move(output_filepath, part_path + '.tmp')
+        os.replace(part_path + '.tmp', part_path)
+    return part_path
+
+
+def archive_course_parts(plugin_class, course_keys, parts_dir, tempdir, outfilename, archive_format='tar'):
+    """
+    Build an archive of the course outputs exported to parts_dir by export_course_part, in course order.
+
+    Courses without an output are left out.  Yields the finished archive
+    like export_courses_multiple does when not streaming.
+    """
+    course_outputs = (
+        (_get_part_path(plugin_class, course_key, parts_dir),
+         _get_output_filename(course_key, plugin_class.filename_extension))
+        for course_key in course_keys
+        if os.path.exists(_get_part_path(plugin_class, course_key, parts_dir))
+    )
+    if archive_format == 'zip':
+        return _zip_courses(course_outputs, tempdir, outfilename, stream=False)
+    return _tar_courses(course_outputs, tempdir, outfilename, stream=False, compressor=None)
+
+
+def export_courses_shared(plugin_classes, course_keys, tempdir):
+    """
+    Export courses to the formats of several plugins, serializing each course to OLX once for all of them.
+
+    The plugins must share OLX exports (see exporters.base.shares_olx_export).
+    Returns the parts directory of each plugin, by name, holding its course
+    outputs for archive_course_parts.  Courses that fail to export are
+    skipped.
+    """
+    parts_dirs = {
+        plugin_class.name: tempfile.mkdtemp(prefix='{}-'.format(plugin_class.name), dir=tempdir)
+        for plugin_class in plugin_classes
+    }
+    for course_key in course_keys:
+        try:
+            if app_settings.COURSE_EXPORT_PLUGIN_ISOLATION:
+                _run_isolated(course_key, export_course_shared, plugin_classes, tempdir, course_key, parts_dirs)
+            else:
+                export_course_shared(plugin_classes, tempdir, course_key, parts_dirs)
+        except exceptions.ExportPluginsCourseExportError:
+            continue
+    return parts_dirs
+
+
+def export_course_shared(plugin_classes, tempdir, course_key, parts_dirs):
+    """
+    Export a course to the formats of several plugins with one OLX export, moving the outputs into their parts dirs.
+
+    Plugins with a cached output of the course (see COURSE_EXPORT_PLUGIN_RESULT_CACHE)
+    use it, and the course isn't serialized at all if all of them have one.
+    Raises ExportPluginsCourseExportError if the course can't be exported.
+    """
+    store = modulestore()
+    target_dir = _get_target_dir(course_key)
+    output_paths = {}
+    cache_keys = {}
+    for plugin_class in plugin_classes:
+        part_path = _get_part_path(plugin_class, course_key, parts_dirs[plugin_class.name])
+        cache, key = _get_export_cache_key(store, plugin_class, course_key)
+        if key is not None and _fetch_cached_export(cache, key, part_path, plugin_class, course_key):
+            continue
+        output_paths[plugin_class.name] = part_path
+        cache_keys[plugin_class.name] = cache, key
+    if not output_paths:
+        return
+
+    exporter = base.SharedOLXCourseExportManager(
+        store, contentstore(), course_key, tempdir, target_dir,
+        [plugin_class for plugin_class in plugin_classes if plugin_class.name in output_paths], output_paths
+    )
+    try:
+        exporter.export()
+    except SerializationError as e:
+        logger.warn('Could not export {} due to core OLX export error {}. Skipping.'.format(course_key, e.message))
+        raise exceptions.ExportPluginsCourseExportError(e.message)
+    finally:
+        shutil.rmtree(os.path.join(tempdir, target_dir), ignore_errors=True)
+
+    for plugin_class in plugin_classes:
+        # plugins that failed to post-process the course left no output
+        if plugin_class.name in output_paths and os.path.exists(output_paths[plugin_class.name]):
+            cache, key = cache_keys[plugin_class.name]
+            if key is not None:
+                _store_cached_export(cache, key, output_paths[plugin_class.name], course_key)
+
+
+def _get_part_path(plugin_class, course_key, parts_dir):
+    return os.path.join(parts_dir, "{}.{}".format(_get_target_dir(course_key), plugin_class.filename_extension))
+
+
+def _reported_course_outputs(course_outputs, courses_total, progress):
+    for courses_done, course_output in enumerate(course_outputs, 1):
+        progress(courses_done, courses_total)
+        yield course_output
+
+
+def _archived_course_outputs(course_outputs, tempdir):
     """
-    if not stream:
-        outfilename += ".gz"
+    Yield the output file path and name of each course, removing its working directory once it's archived.
+    """
+    for course_key, output_filepath, out_fn in course_outputs:
+        yield output_filepath, out_fn
+        # the output is in the archive now, free the scratch space of the course for the ones to come
+        shutil.rmtree(os.path.join(tempdir, _get_target_dir(course_key)), ignore_errors=True)
+
 
+def _tar_courses(course_outputs, tempdir, outfilename, stream, compressor):
+    """
+    Build a tar file of the course outputs, yielding its bytes if streaming or the finished tar file.
+
+    The compressor, or the one of stored archives, is closed if the tar
+    file can't be built, so its threads don't outlive the export.
+    """
+    if stream:
+        try:
+            with tarfile.open(os.path.join(tempdir, outfilename), "w:") as out_tar:
+                for output_filepath, out_fn in course_outputs:
+                    for tar_bytes in _compressed(_course_tar_bytes(out_tar, output_filepath, out_fn), compressor):
+                        yield tar_bytes
+                for tar_bytes in _compressed([_get_tar_end_padding_bytes()], compressor, end=True):
+                    yield tar_bytes
+        finally:
+            if compressor is not None:
+                compressor.close()
+        shutil.rmtree(tempdir)  # clean up the temp files as they won't be otherwise when streaming
+        return
+
+    archive_compressor = _get_archive_compressor()
+    if archive_compressor is not None:
+        outfilename += ".{}".format(archive_compressor.filename_extension)
     tarf = os.path.join(tempdir, outfilename)
-    write_method = "w:" if stream else "w:gz"
-    with tarfile.open(tarf, write_method) as out_tar:
+    with open(tarf, "wb") as out_file, contextlib.ExitStack() as stack:
+        tar_file = out_file
+        if archive_compressor is not None:
+            stack.callback(archive_compressor.close)
+            tar_file = compression.CompressedFile(out_file, archive_compressor)
+        with tarfile.open(tarf, "w|", fileobj=tar_file) as out_tar:
+            for output_filepath, out_fn in course_outputs:
+                out_tar.add(output_filepath, out_fn)
+            yield out_tar
+        if archive_compressor is not None:
+            tar_file.close()  # end the compressed stream once the tar file is complete
+
+
+def _get_archive_compressor():
+    """
+    Get a compressor for stored archives as configured, or None for uncompressed archives.
+    """
+    name = app_settings.COURSE_EXPORT_PLUGIN_ARCHIVE_COMPRESSION
+    if name == 'none':
+        return None
+    compressor = compression.get_stream_compressor(
+        name,
+        level=app_settings.COURSE_EXPORT_PLUGIN_ARCHIVE_COMPRESSION_LEVEL,
+        threads=app_settings.COURSE_EXPORT_PLUGIN_ARCHIVE_COMPRESSION_THREADS,
+    )
+    if compressor is None:
+        raise ImproperlyConfigured("Archive compression {} is not available".format(name))
+    return compressor
+
+
+def _zip_courses(course_outputs, tempdir, outfilename, stream):
+    if stream:
+        zip_stream = _ZipStream()
+        with zipfile.ZipFile(zip_stream, 'w', zipfile.ZIP_DEFLATED) as out_zip:
+            for output_filepath, out_fn in course_outputs:
+                for zip_bytes in _course_zip_bytes(out_zip, zip_stream, output_filepath, out_fn):
+                    yield zip_bytes
+        yield zip_stream.drain()  # the central directory
+        shutil.rmtree(tempdir)  # clean up the temp files as they won't be otherwise when streaming
+    else:
+        with zipfile.ZipFile(os.path.join(tempdir, outfilename), 'w', zipfile.ZIP_DEFLATED) as out_zip:
+            for output_filepath, out_fn in course_outputs:
+                out_zip.write(output_filepath, out_fn)
+            yield out_zip
+
+
+class _ZipStream(object):
+    """
+    Unseekable file object collecting what a ZipFile writes, to be drained as it is streamed.
+    """
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _permitted_course_keys(user, course_keys):
+    course_keys = list(course_keys)
+    author_course_keys = _get_author_course_keys(user, course_keys)
+    for course_key in course_keys:
+        if course_key not in author_course_keys:
+            logger.warn('User {} has no access to export {}'.format(user, course_key))
+            continue
+        yield course_key
+
+
+def _get_author_course_keys(user, course_keys):
+    """
+    Get the set of the course keys the user has course author access to, as has_course_author_access tells.
+
+    Rather than checking roles course by course, the user's instructor and
+    staff roles, on courses or whole organizations, are fetched in one query.
+    Nobody has author access to CCX courses.
+    """
+    course_keys = [course_key for course_key in course_keys if not str(course_key).startswith(CCX_KEY_PREFIX)]
+    if GlobalStaff().has_user(user):
+        return set(course_keys)
+    if not (user.is_authenticated and user.is_active):
+        return set()
+    roles = CourseAccessRole.objects.filter(
+        user=user, role__in=(CourseInstructorRole.ROLE, CourseStaffRole.ROLE)
+    ).values_list('org', 'course_id')
+    role_course_keys = set()
+    role_orgs = set()
+    for org, course_id in roles:
+        if course_id:
+            role_course_keys.add(course_id)
+        elif org:
+            role_orgs.add(org)
+    return {
+        course_key for course_key in course_keys
+        if course_key in role_course_keys or course_key.org in role_orgs
+    }
+
+
+def _export_courses(plugin_class, tempdir, course_keys):
+    """
+    Export courses, yielding the key, output file path and name of each course that exported.
+
+    With COURSE_EXPORT_PLUGIN_EXPORT_WORKERS above 1 the courses are
+    exported concurrently.  Courses that fail to export are skipped.
+    """
+    workers = app_settings.COURSE_EXPORT_PLUGIN_EXPORT_WORKERS
+    if workers > 1:
+        return _export_courses_concurrently(plugin_class, tempdir, course_keys, workers)
+    return _export_courses_serially(plugin_class, tempdir, course_keys)
+
+
+def _export_courses_serially(plugin_class, tempdir, course_keys):
+    for course_key in course_keys:
+        try:
+            yield (course_key,) + _export_course(plugin_class, tempdir, course_key)
+        except exceptions.ExportPluginsCourseExportError:
+            continue
+
+
+def _export_courses_concurrently(plugin_class, tempdir, course_keys, workers):
+    """
+    Export courses in a pool of workers, yielding results in course order or, if configured, completion order.
+
+    At most two courses per worker are in flight at a time, so finished
+    exports waiting for their turn in course order don't pile up.  While
+    the scratch space in tempdir exceeds COURSE_EXPORT_PLUGIN_SCRATCH_DISK_BUDGET
+    no more exports are started.
+    """
+    in_completion_order = app_settings.COURSE_EXPORT_PLUGIN_EXPORT_ORDER == 'completion'
+    disk_budget = app_settings.COURSE_EXPORT_PLUGIN_SCRATCH_DISK_BUDGET
+    course_keys = list(course_keys)  # run the permission checks before the pool is set up
+    executor, export = _get_export_executor(workers)
+    in_flight = collections.deque()
+    with executor:
         for course_key in course_keys:
-            if check_author_perms:
-                if not has_course_author_access(user, course_key):
-                    logger.warn('User {} has no access to export {}'.format(user, course_key))
-                    continue
+            while in_flight and (len(in_flight) >= workers * 2 or _over_disk_budget(tempdir, disk_budget)):
+                result = _next_course_export(in_flight, in_completion_order)
+                if result is not None:
+                    yield result
+            in_flight.append((course_key, executor.submit(export, plugin_class, tempdir, course_key)))
+        while in_flight:
+            result = _next_course_export(in_flight, in_completion_order)
+            if result is not None:
+                yield result
+
+
+def _over_disk_budget(tempdir, disk_budget):
+    """
+    Tell whether the files in tempdir, other than the tar file being built, take up more than disk_budget bytes.
+    """
+    if not disk_budget:
+        return False
+    used = 0
+    for entry in os.scandir(tempdir):
+        if entry.is_dir(follow_symlinks=False):
+            used += _disk_usage(entry.path)
+    if used > disk_budget:
+        logger.info('Course exports use {} bytes of scratch space, waiting for running ones to finish'.format(used))
+        return True
+    return False
+
+
+def _disk_usage(path):
+    used = 0
+    for dirpath, __, filenames in os.walk(path):
+        for filename in filenames:
             try:
-                if stream:
-                    for tar_bytes in _course_tar_bytes(user, plugin_class, tempdir, course_key, out_tar):
-                        yield tar_bytes
-                else:
-                    output_filepath, out_fn = _do_course_export(plugin_class, tempdir, course_key)
-                    out_tar.add(output_filepath, out_fn)
-            except exceptions.ExportPluginsCourseExportError:
-                continue
-        if stream:
-            yield _get_tar_end_padding_bytes()
-            shutil.rmtree(tempdir)  # clean up the temp files as they won't be otherwise when streaming
-        else:
-            yield out_tar
+                used += os.lstat(os.path.join(dirpath, filename)).st_size
+            except OSError:
+                pass  # removed meanwhile
+    return used
+
+
+def _export_courses_incrementally(plugin_class, tempdir, course_keys, export_record):
+    """
+    Yield the kept outputs of courses that haven't changed and export the others, keeping their outputs.
+
+    Outputs are yielded in course order, see _in_course_order.
+    """
+    course_keys = list(course_keys)
+    reused_outputs = {}
+    stale_course_keys = []
+    for course_key in course_keys:
+        output_filepath = export_record.reusable_output(course_key)
+        if output_filepath is None:
+            stale_course_keys.append(course_key)
+            continue
+        reused_outputs[course_key] = (
+            output_filepath, _get_output_filename(course_key, plugin_class.filename_extension)
+        )
+    course_outputs = _export_courses(plugin_class, tempdir, stale_course_keys)
+    for course_key, output_filepath, out_fn in _in_course_order(course_keys, reused_outputs, course_outputs):
+        if course_key not in reused_outputs:
+            export_record.record(course_key, output_filepath)
+        yield course_key, output_filepath, out_fn
+    export_record.save()
+
+
+def _export_courses_resumably(plugin_class, tempdir, course_keys, run_journal, export_record):
+    """
+    Yield the outputs of courses finished earlier in the run and export the others, journaling them.
+
+    Outputs are yielded in course order, see _in_course_order.
+    """
+    course_keys = list(course_keys)
+    finished_outputs = {}
+    unfinished_course_keys = []
+    for course_key in course_keys:
+        finished_output = run_journal.finished_output(course_key)
+        if finished_output is None:
+            unfinished_course_keys.append(course_key)
+            continue
+        finished_outputs[course_key] = finished_output
+    if export_record is not None:
+        course_outputs = _export_courses_incrementally(plugin_class, tempdir, unfinished_course_keys, export_record)
+    else:
+        course_outputs = _export_courses(plugin_class, tempdir, unfinished_course_keys)
+    for course_key, output_filepath, out_fn in _in_course_order(course_keys, finished_outputs, course_outputs):
+        if course_key not in finished_outputs:
+            run_journal.record(course_key, output_filepath, out_fn)
+        yield course_key, output_filepath, out_fn
+
+
+def _in_course_order(course_keys, ready_outputs, course_outputs):
+    """
+    Yield the outputs of courses in ready_outputs, by course key, and those of course_outputs, in course order.
+
+    course_outputs yields the key, output file path and name of the other
+    courses in course order, leaving out those that failed to export.  With
+    COURSE_EXPORT_PLUGIN_EXPORT_ORDER set to "completion" the ready outputs,
+    being done already, are yielded first and course_outputs as they come.
+    """
+    if app_settings.COURSE_EXPORT_PLUGIN_EXPORT_ORDER == 'completion':
+        for course_key in course_keys:
+            if course_key in ready_outputs:
+                yield (course_key,) + tuple(ready_outputs[course_key])
+        for course_output in course_outputs:
+            yield course_output
+        return
+
+    course_outputs = iter(course_outputs)
+    next_output = None
+    for course_key in course_keys:
+        if course_key in ready_outputs:
+            yield (course_key,) + tuple(ready_outputs[course_key])
+            continue
+        if next_output is None:
+            next_output = next(course_outputs, None)
+        if next_output is not None and next_output[0] == course_key:
+            yield next_output
+            next_output = None
+        # otherwise the course failed to export
+    # run course_outputs to its end, as it may finish up after its last course
+    if next_output is not None:
+        yield next_output
+    for course_output in course_outputs:
+        yield course_output
+
+
+def _get_export_executor(workers):
+    """
+    Get the configured pool for concurrent course exports, and the function to run the exports in it.
+    """
+    if app_settings.COURSE_EXPORT_PLUGIN_ISOLATION:
+        # the exports run in child processes of their own, the pool threads only wait for them
+        return futures.ThreadPoolExecutor(max_workers=workers), _export_course
+    if app_settings.COURSE_EXPORT_PLUGIN_EXPORT_POOL == 'thread':
+        return futures.ThreadPoolExecutor(max_workers=workers), _do_course_export
+    if multiprocessing.current_process().daemon:
+        # daemonic processes, like Celery's prefork pool workers, can't start children
+        logger.warning('Exporting courses in a thread pool, daemonic processes cannot start a process pool')
+        return futures.ThreadPoolExecutor(max_workers=workers), _do_course_export
+    # forked pool processes must open database connections of their own
+    db.connections.close_all()
+    return futures.ProcessPoolExecutor(max_workers=workers), _do_course_export_in_process
+
+
+def _next_course_export(in_flight, in_completion_order):
+    """
+    Wait for the next course export from the in-flight ones and return its key and result, or None if it failed.
+    """
+    if in_completion_order:
+        done, __ = futures.wait([future for __, future in in_flight], return_when=futures.FIRST_COMPLETED)
+        entry = next(entry for entry in in_flight if entry[1] in done)
+        in_flight.remove(entry)
+    else:
+        entry = in_flight.popleft()
+    course_key, future = entry
+    try:
+        return (course_key,) + future.result()
+    except exceptions.ExportPluginsCourseExportError:
+        return None
 
 
 def _get_tar_end_padding_bytes():
@@ -73,53 +588,313 @@ def _get_tar_end_padding_bytes():
     return pad_data.getvalue()
 
 
-def _course_tar_bytes(user, plugin_class, tempdir, course_key, out_tar):
+def _compressed(chunks, compressor, end=False):
     """
-    Generate tarball data from multiple course exports
+    Compress streamed chunks, flushing the compressor after them or, with end, finishing its stream.
     """
+    if compressor is None:
+        for chunk in chunks:
+            yield chunk
+        return
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.finish() if end else compressor.flush()
 
-    def _get_tar_record_bytes(tarinfo, src_file_path):
-        tar_header = tarinfo.tobuf(out_tar.format, out_tar.encoding, out_tar.errors)
 
-        # replicating behavior of TarFile.add
-        tar_data = io.BytesIO()
-        with open(src_file_path, "rb") as src:
-            shutil.copyfileobj(src, tar_data, length=tarinfo.size)
-            blocks, remainder = divmod(tarinfo.size, tarfile.BLOCKSIZE)
-            if remainder > 0:
-                tar_data.write(tarfile.NUL * (tarfile.BLOCKSIZE - remainder))
+def _get_tar_record_padding_bytes(size):
+    """tar file members are padded with zeros to a whole number of blocks."""
+    __, remainder = divmod(size, tarfile.BLOCKSIZE)
+    return tarfile.NUL * (tarfile.BLOCKSIZE - remainder) if remainder else b''
 
-        return (tar_header, tar_data.getvalue())
-
-    (outfilepath, out_fn) = _do_course_export(plugin_class, tempdir, course_key)
 
+def _course_tar_bytes(out_tar, outfilepath, out_fn):
+    """
+    Generate tarball data for a course export output file, reading the file in chunks
+    """
     tarinfo = out_tar.gettarinfo(name=outfilepath, arcname=out_fn)
-    (tar_hd, tar_data) = _get_tar_record_bytes(tarinfo, outfilepath)
-    yield tar_hd
-    yield tar_data
+    yield tarinfo.tobuf(out_tar.format, out_tar.encoding, out_tar.errors)
+
+    # replicating behavior of TarFile.add, without holding the file in memory
+    remaining = tarinfo.size
+    with open(outfilepath, "rb") as src:
+        while remaining:
+            chunk = src.read(min(TAR_STREAM_CHUNK_SIZE, remaining))
+            if not chunk:
+                raise IOError("{} shrank while it was being added to the tar file".format(outfilepath))
+            remaining -= len(chunk)
+            yield chunk
+    padding = _get_tar_record_padding_bytes(tarinfo.size)
+    if padding:
+        yield padding
+
+
+def _course_zip_bytes(out_zip, zip_stream, outfilepath, out_fn):
+    """
+    Generate ZIP file data for a course export output file, reading the file in chunks
+    """
+    zinfo = zipfile.ZipInfo(out_fn, date_time=time.localtime(os.path.getmtime(outfilepath))[:6])
+    zinfo.compress_type = zipfile.ZIP_DEFLATED
+    force_zip64 = os.path.getsize(outfilepath) >= ZIP64_THRESHOLD
+    with open(outfilepath, "rb") as src, out_zip.open(zinfo, 'w', force_zip64=force_zip64) as dest:
+        for chunk in iter(lambda: src.read(TAR_STREAM_CHUNK_SIZE), b''):
+            dest.write(chunk)
+            zip_bytes = zip_stream.drain()
+            if zip_bytes:
+                yield zip_bytes
+    yield zip_stream.drain()  # the rest of the member and its data descriptor
 
 
 def _do_course_export(plugin_class, tempdir, course_key):
     """
     Run the actual export transformation.
+
+    With COURSE_EXPORT_PLUGIN_RESULT_CACHE set, an output cached for the
+    same published course version and plugin is used instead.
     """
     # TODO: clean up the temporary directory if possible.
     # Since it needs to exist until we wrap and return the file for 
     # HTTP responses, not sure how to handle this
-    course_key_normalized = str(course_key).replace('/', '+')
-    target_dir = os.path.normpath(course_key_normalized)
-    exporter = plugin_class(modulestore(), contentstore(), course_key, tempdir, target_dir)
+    target_dir = _get_target_dir(course_key)
+    store = modulestore()
+    exporter = plugin_class(store, contentstore(), course_key, tempdir, target_dir)
     fn_ext = exporter.filename_extension
+    output_filepath = os.path.join(tempdir, target_dir, "output.{}".format(fn_ext))
+    output_filename = _get_output_filename(course_key, fn_ext)
+
+    cache, key = _get_export_cache_key(store, plugin_class, course_key)
+    if key is not None and _fetch_cached_export(cache, key, output_filepath, plugin_class, course_key):
+        return (output_filepath, output_filename)
+
     try:
         exporter.export()
     except SerializationError as e:
         logger.warn('Could not export {} due to core OLX export error {}. Skipping.'.format(course_key, e.message))
         raise exceptions.ExportPluginsCourseExportError(e.message)
+    _remove_intermediates(os.path.join(tempdir, target_dir), output_filepath)
 
-    output_filepath = os.path.join(tempdir, target_dir, "output.{}".format(fn_ext))
-    out_fn = "{}_{}.{}".format(
-        course_key_normalized,
+    if key is not None:
+        _store_cached_export(cache, key, output_filepath, course_key)
+    return (output_filepath, output_filename)
+
+
+def _fetch_cached_export(cache, key, output_filepath, plugin_class, course_key):
+    try:
+        if cache.fetch(key, output_filepath):
+            logger.info('Using cached export of {} as {}'.format(course_key, plugin_class.name))
+            return True
+    except Exception as e:  # pylint: disable=broad-except
+        logger.warning('Could not read cached export of {}: {}'.format(course_key, e))
+    return False
+
+
+def _store_cached_export(cache, key, output_filepath, course_key):
+    try:
+        cache.store(key, output_filepath)
+    except Exception as e:  # pylint: disable=broad-except
+        logger.warning('Could not cache export of {}: {}'.format(course_key, e))
+
+
+def _get_export_cache_key(store, plugin_class, course_key):
+    """
+    Get the configured export cache and the key of the course's export in it, or Nones.
+    """
+    try:
+        cache = export_cache.get_export_cache()
+        if cache is None:
+            return None, None
+        return cache, export_cache.cache_key(store, plugin_class, course_key)
+    except Exception as e:  # pylint: disable=broad-except
+        # an unavailable cache shouldn't fail the export
+        logger.warning('Could not use the export cache for {}: {}'.format(course_key, e))
+        return None, None
+
+
+def _get_target_dir(course_key):
+    return os.path.normpath(str(course_key).replace('/', '+'))
+
+
+def _remove_intermediates(export_dir, output_filepath):
+    """
+    Remove everything the export left in its directory but the output file.
+    """
+    for entry in os.scandir(export_dir):
+        if entry.path == output_filepath:
+            continue
+        if entry.is_dir(follow_symlinks=False):
+            shutil.rmtree(entry.path, ignore_errors=True)
+        else:
+            os.remove(entry.path)
+
+
+def _get_output_filename(course_key, fn_ext):
+    return "{}_{}.{}".format(
+        str(course_key).replace('/', '+'),
         datetime.datetime.now().strftime('%Y-%m-%d'),
         fn_ext
     )
-    return (output_filepath, out_fn)
+
+
+def _do_course_export_in_process(plugin_class, tempdir, course_key):
+    """
+    Run the export in a pool process.
+
+    The modulestore and its connections are inherited from the parent
+    process when the pool process is forked, so they are set up anew the
+    first time the process exports a course.
+    """
+    global _export_process_pid  # pylint: disable=global-statement
+    if _export_process_pid != os.getpid():
+        clear_existing_modulestores()
+        _export_process_pid = os.getpid()
+    return _do_course_export(plugin_class, tempdir, course_key)
+
+
+def _export_course(plugin_class, tempdir, course_key):
+    """
+    Run the export, in a child process of its own with COURSE_EXPORT_PLUGIN_ISOLATION enabled.
+    """
+    if not app_settings.COURSE_EXPORT_PLUGIN_ISOLATION:
+        return _do_course_export(plugin_class, tempdir, course_key)
+    try:
+        return _run_isolated(course_key, _do_course_export, plugin_class, tempdir, course_key)
+    except exceptions.ExportPluginsCourseExportError:
+        # a killed export leaves its intermediates behind
+        shutil.rmtree(os.path.join(tempdir, _get_target_dir(course_key)), ignore_errors=True)
+        raise
+
+
+def _run_isolated(course_key, func, *args):
+    """
+    Run func(*args) exporting a course in a forked child process, killing it if it exceeds the isolation limits.
+
+    The child is killed once its peak RSS exceeds COURSE_EXPORT_PLUGIN_ISOLATION_MAX_RSS
+    bytes or it runs longer than COURSE_EXPORT_PLUGIN_ISOLATION_TIMEOUT
+    seconds.  Its RSS includes the pages it shares with this process since
+    the fork, and is only watched on Linux.  Returns what func returns, and
+    raises what it raises; raises ExportPluginsCourseExportError if the
+    child is killed or dies.  Safe to call from several threads at once,
+    though a child forked while another thread holds a lock it needs, like
+    the logging module's before Python 3.7, waits on it until the timeout.
+
+    The database connections of this process are left open, so this can be
+    called within a transaction; the child opens its own.
+    """
+    max_rss = app_settings.COURSE_EXPORT_PLUGIN_ISOLATION_MAX_RSS
+    timeout = app_settings.COURSE_EXPORT_PLUGIN_ISOLATION_TIMEOUT
+    with _fork_lock:
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            _run_isolated_child(write_fd, func, args)
+        os.close(write_fd)
+
+    start = time.time()
+    peak_rss = 0
+    exceeded = None
+    data = []
+    status = None
+    try:
+        while True:
+            readable, __, __ = select.select([read_fd], [], [], ISOLATION_POLL_INTERVAL)
+            if readable:
+                chunk = os.read(read_fd, 64 * 1024)
+                if not chunk:
+                    break  # the child is done
+                data.append(chunk)
+                continue
+            peak_rss = max(peak_rss, _peak_rss(pid))
+            if max_rss and peak_rss > max_rss:
+                exceeded = 'memory'
+            elif timeout and time.time() - start > timeout:
+                exceeded = 'time'
+            if exceeded:
+                os.kill(pid, signal.SIGKILL)
+                break
+        __, status, rusage = os.wait4(pid, 0)
+    finally:
+        os.close(read_fd)
+        if status is None:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+    peak_rss = max(peak_rss, rusage.ru_maxrss * 1024)
+    seconds = time.time() - start
+
+    if exceeded or not os.WIFEXITED(status) or not data:
+        if exceeded:
+            reason = 'exceeding its {} limit'.format(exceeded)
+        elif os.WIFSIGNALED(status):
+            reason = 'killed by signal {}'.format(os.WTERMSIG(status))
+        else:
+            reason = 'exiting with status {}'.format(os.WEXITSTATUS(status))
+        msg = 'Skipped export of {} {} after {:.1f}s at a peak RSS of {:.1f} MB'.format(
+            course_key, reason, seconds, peak_rss / 1e6
+        )
+        logger.warning(msg)
+        raise exceptions.ExportPluginsCourseExportError(msg)
+
+    logger.info('Export of {} ran in a child process for {:.1f}s at a peak RSS of {:.1f} MB'.format(
+        course_key, seconds, peak_rss / 1e6
+    ))
+    outcome, value, child_traceback = pickle.loads(b''.join(data))
+    if outcome == 'error':
+        if not isinstance(value, exceptions.ExportPluginsCourseExportError):
+            logger.error('Export of {} failed in its child process:\n{}'.format(course_key, child_traceback))
+        raise value
+    return value
+
+
+def _run_isolated_child(write_fd, func, args):
+    """
+    Run func(*args) in the forked child and send its outcome to the parent, then exit without cleaning up.
+
+    The modulestore and database connections are inherited from the
+    parent, so they are set up anew first.
+    """
+    exit_status = 1
+    try:
+        xslt.reinit_after_fork()  # done at fork already where the os module supports it
+        clear_existing_modulestores()
+        _detach_db_connections()
+        try:
+            outcome = ('result', func(*args), None)
+        except Exception as e:  # pylint: disable=broad-except
+            outcome = ('error', e, traceback.format_exc())
+        try:
+            data = pickle.dumps(outcome)
+        except Exception:  # pylint: disable=broad-except
+            data = pickle.dumps(('error', RuntimeError(str(outcome[1])), outcome[2]))
+        with os.fdopen(write_fd, 'wb') as pipe:
+            pipe.write(data)
+        exit_status = 0
+    finally:
+        os._exit(exit_status)  # pylint: disable=protected-access
+
+
+def _detach_db_connections():
+    """
+    Make the database connections inherited by a forked child connect anew when next used.
+
+    Closing the inherited connections would end the parent's sessions, so
+    they're kept referenced until the child exits without cleaning up.
+    """
+    for connection in db.connections.all():
+        if connection.connection is not None:
+            _inherited_db_connections.append(connection.connection)
+            connection.connection = None
+
+
+def _peak_rss(pid):
+    """
+    Get the peak resident set size of a process in bytes, or 0 where /proc doesn't tell it.
+    """
+    try:
+        with open('/proc/{}/status'.format(pid)) as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except (IOError, OSError, ValueError):
+        pass
+    return 0
@@ -7,3 +7,9 @@ class ExportPluginsCourseExportError(Exception):
     """
     Exception exporting a course.
     """
+
+
+class ExportPluginsRunInProgressError(Exception):
+    """
+    Exception running an all-courses export run that another process is running.
+    """
@@ -0,0 +1,225 @@
+"""
+Content-addressed cache of course export outputs.
+
+An output is stored under a key derived from the course key, the version
+of the published course and its assets, the exporter plugin, a hash of the plugin's
+stylesheets, the package version and the settings the output depends on,
+so a cached output is only ever served for the exact content, code and
+configuration that produced it.  Outputs are kept
+on local disk or in S3, with the least recently used evicted once the
+cache grows beyond COURSE_EXPORT_PLUGIN_RESULT_CACHE_MAX_BYTES.
+"""
+
+import datetime
+import hashlib
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from . import __version__, app_settings, incremental
+
+
+logger = logging.getLogger(__name__)
+
+XSL_DIR = os.path.join(os.path.dirname(__file__), 'exporters', 'xsl')
+
+# seconds between evictions from the S3 cache by a process, each listing the whole cache
+S3_EVICT_INTERVAL = 15 * 60
+
+_stylesheet_hashes = {}
+
+# when this process last evicted from the S3 cache, by prefix
+_s3_evicted = {}
+
+
+def get_export_cache():
+    """
+    Get the configured export cache, or None if caching is off.
+    """
+    cache_type = app_settings.COURSE_EXPORT_PLUGIN_RESULT_CACHE
+    max_bytes = app_settings.COURSE_EXPORT_PLUGIN_RESULT_CACHE_MAX_BYTES
+    if cache_type == 'local':
+        return LocalExportCache(app_settings.COURSE_EXPORT_PLUGIN_RESULT_CACHE_DIR, max_bytes)
+    if cache_type == 's3':
+        return S3ExportCache(app_settings.COURSE_EXPORT_PLUGIN_STORAGE_PREFIX + "/cache", max_bytes)
+    return None
+
+
+def cache_key(store, plugin_class, course_key):
+    """
+    Get the key of a course's export by a plugin, or None if the published version of the course is unknown.
+
+    Besides the course version and the plugin's code, the key covers the
+    settings its output depends on: the Markdown engine, the course tree
+    mode and the LMS root URL links point to.
+    """
+    version = incremental.published_course_version(store, course_key)
+    if version is None:
+        return None
+    parts = (
+        str(course_key), version, plugin_class.name, plugin_stylesheet_hash(plugin_class), __version__,
+        getattr(plugin_class, 'markdown_engine', None) or app_settings.COURSE_EXPORT_PLUGIN_MARKDOWN_ENGINE,
+        app_settings.COURSE_EXPORT_PLUGIN_COURSE_TREE_MODE, app_settings.LMS_ROOT_URL,
+    )
+    return hashlib.sha256('\n'.join(parts).encode('utf-8')).hexdigest()
+
+
+def plugin_stylesheet_hash(plugin_class):
+    """
+    Get a hash of a plugin's stylesheets and the stylesheet files they may import.
+
+    The stylesheets are the plugin class's *_XSL_STYLESHEET attributes,
+    and the files those in the bundled xsl directory and in an xsl
+    directory next to the plugin's module, as third-party plugins may keep
+    theirs.
+    """
+    try:
+        return _stylesheet_hashes[plugin_class]
+    except KeyError:
+        pass
+    digest = hashlib.sha256()
+    for name in sorted(dir(plugin_class)):
+        stylesheet = getattr(plugin_class, name)
+        if name.endswith('_XSL_STYLESHEET') and isinstance(stylesheet, str):
+            digest.update(stylesheet.encode('utf-8'))
+    xsl_dirs = [XSL_DIR]
+    module = sys.modules.get(plugin_class.__module__)
+    module_file = getattr(module, '__file__', None)
+    if module_file is not None:
+        plugin_xsl_dir = os.path.join(os.path.dirname(os.path.abspath(module_file)), 'xsl')
+        if os.path.isdir(plugin_xsl_dir) and plugin_xsl_dir != XSL_DIR:
+            xsl_dirs.append(plugin_xsl_dir)
+    for xsl_dir in xsl_dirs:
+        for filename in sorted(os.listdir(xsl_dir)):
+            path = os.path.join(xsl_dir, filename)
+            if os.path.isfile(path):
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+    _stylesheet_hashes[plugin_class] = digest.hexdigest()
+    return _stylesheet_hashes[plugin_class]
+
+
+def _make_parent_dir(path):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+
+
+class LocalExportCache(object):
+    """
+    Export outputs kept in a local directory, evicting by last access time.
+    """
+    def __init__(self, root_dir, max_bytes):
+        self.root_dir = root_dir
+        self.max_bytes = max_bytes
+        if not os.path.isdir(root_dir):
+            os.makedirs(root_dir)
+
+    def fetch(self, key, dest_path):
+        """
+        Copy the output cached under key to dest_path, returning whether there was one.
+        """
+        path = os.path.join(self.root_dir, key)
+        if not os.path.exists(path):
+            return False
+        try:
+            _make_parent_dir(dest_path)
+            shutil.copyfile(path, dest_path)
+            os.utime(path)  # mark as recently used
+        except (IOError, OSError):
+            return False
+        return True
+
+    def store(self, key, src_path):
+        """
+        Cache the output at src_path under key, then evict outputs until the cache fits its size bound.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=self.root_dir, suffix='.tmp')
+        os.close(fd)
+        shutil.copyfile(src_path, tmp_path)
+        os.replace(tmp_path, os.path.join(self.root_dir, key))
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for entry in os.scandir(self.root_dir):
+            if entry.name.endswith('.tmp'):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue  # evicted by another process meanwhile
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for __, size, __ in entries)
+        for __, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+
+class S3ExportCache(object):
+    """
+    Export outputs kept in the S3 storage bucket, evicting by last access time.
+
+    Each process evicts at most once every S3_EVICT_INTERVAL seconds.
+
+    S3 doesn't track access, so a hit copies the object onto itself to bump
+    its last-modified time.  S3 refuses copies onto the object itself that
+    change nothing, so the copy replaces the object's metadata with its
+    last use time.
+    """
+    def __init__(self, prefix, max_bytes):
+        from . import storage  # requires boto, only imported when configured
+        self.bucket = storage.get_s3_bucket()
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+
+    def fetch(self, key, dest_path):
+        """
+        Copy the output cached under key to dest_path, returning whether there was one.
+        """
+        s3_key = self.bucket.get_key(self._name(key))
+        if s3_key is None:
+            return False
+        _make_parent_dir(dest_path)
+        s3_key.get_contents_to_filename(dest_path)
+        try:
+            # mark as recently used
+            metadata = dict(s3_key.metadata, **{'last-used': datetime.datetime.utcnow().isoformat()})
+            s3_key.copy(self.bucket.name, s3_key.name, metadata=metadata, preserve_acl=True)
+        except Exception as e:  # pylint: disable=broad-except
+            # the output is fetched, it may just be evicted sooner
+            logger.warning('Could not mark cached export {} as recently used: {}'.format(key, e))
+        return True
+
+    def store(self, key, src_path):
+        """
+        Cache the output at src_path under key, then evict outputs until the cache fits its size bound.
+        """
+        self.bucket.new_key(self._name(key)).set_contents_from_filename(src_path)
+        self._evict()
+
+    def _evict(self):
+        # listing the cache takes a request per thousand outputs; between evictions it may outgrow its bound
+        now = time.time()
+        if now - _s3_evicted.get(self.prefix, 0) < S3_EVICT_INTERVAL:
+            return
+        _s3_evicted[self.prefix] = now
+        entries = sorted(
+            (s3_key.last_modified, s3_key.size, s3_key.name) for s3_key in self.bucket.list(prefix=self.prefix + "/")
+        )
+        total = sum(size for __, size, __ in entries)
+        for __, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            self.bucket.delete_key(name)
+            total -= size
+
+    def _name(self, key):
+        return "{}/{}".format(self.prefix, key)
@@ -2,14 +2,23 @@
 Define an Exporter Plugin class providing
 additional options to xmodule lib ExportManager
 """
+import copy
 import datetime
+import logging
+import shutil
+import time
 
 from lxml import etree
 
 from xmodule.modulestore import xml_exporter
 
 from .. import app_settings
-from . import resolvers
+from . import resolvers, xslt
+
+
+logger = logging.getLogger(__name__)
+
+COURSE_TREE_NAMESPACE = "urn:x-openedx-export-plugins:course-tree"
 
 
 class PluggableCourseExportManager(xml_exporter.CourseExportManager):
@@ -68,18 +77,206 @@ class PluggableCourseExportManager(xml_exporter.CourseExportManager):
         except AttributeError:
             raise  # do something more intelligent here, not all exporter plugins may use XSL
 
+    def _get_xsl_transform(self):
+        """
+        Get the compiled XSLT transform, shared by all exports in this process.
+        """
+        return xslt.get_transform(self._load_export_xsl())
+
+    def _get_xsl_resolvers(self, export_fs, cache):
+        """
+        Get the resolvers for document() lookups made during the transform of this export.
+        """
+        return [
+            resolvers.ExportFSResolver(export_fs, cache),
+            resolvers.AssetURLResolver(export_fs, cache),
+        ]
+
+    def _run_xsl_transform(self, root, export_fs, **params):
+        """
+        Run the XSLT transform in the configured course tree mode.
+
+        'dynamic' lets the stylesheet walk the course through document()
+        lookups, 'assembled' assembles the course tree in Python first and
+        applies the plugin's ASSEMBLED_XSL_STYLESHEET, and 'compare' runs both,
+        logs their timings and any difference in output, and returns the
+        dynamic result.
+        """
+        mode = app_settings.COURSE_EXPORT_PLUGIN_COURSE_TREE_MODE
+        cache = self._get_export_cache(export_fs)
+        if mode == 'dynamic' or not hasattr(self, 'ASSEMBLED_XSL_STYLESHEET'):
+            return self._transform_dynamic(root, export_fs, cache, params)
+        if mode == 'assembled':
+            return self._transform_assembled(root, export_fs, cache, params)
+
+        # both passes read the documents of one cache, so each is prepared and read once
+        start = time.time()
+        result_tree = self._transform_dynamic(root, export_fs, cache, params)
+        dynamic_secs = time.time() - start
+        start = time.time()
+        assembled_tree = self._transform_assembled(root, export_fs, cache, params)
+        assembled_secs = time.time() - start
+        if str(result_tree) == str(assembled_tree):
+            logger.info('Course tree modes match for {}: dynamic {:.3f}s, assembled {:.3f}s'.format(
+                self.courselike_key, dynamic_secs, assembled_secs
+            ))
+        else:
+            logger.warning('Course tree modes differ for {}: dynamic {:.3f}s, assembled {:.3f}s'.format(
+                self.courselike_key, dynamic_secs, assembled_secs
+            ))
+        return result_tree
+
+    def _get_export_cache(self, export_fs):
+        """
+        Get a new per-export document cache, with HTML fragments normalized in bulk if configured.
+        """
+        cache = resolvers.ExportFSCache(export_fs)
+        workers = app_settings.COURSE_EXPORT_PLUGIN_HTML_NORMALIZE_WORKERS
+        if workers:
+            report = cache.prepare_html(
+                workers, use_processes=app_settings.COURSE_EXPORT_PLUGIN_HTML_NORMALIZE_POOL == 'process'
+            )
+            logger.info('Normalized {} HTML fragments of {} in {:.3f}s: {} repaired, {} dropped'.format(
+                report.fragments, self.courselike_key, report.seconds, report.fixed, report.dropped
+            ))
+        return cache
+
+    def _transform_dynamic(self, root, export_fs, cache, params):
+        with resolvers.ExportResolverContext(self._get_xsl_resolvers(export_fs, cache)):
+            return self._get_xsl_transform()(root, **params)
+
+    def _transform_assembled(self, root, export_fs, cache, params):
+        course_tree = CourseTreeAssembler(cache).assemble(root)
+        transform = xslt.get_transform(self.ASSEMBLED_XSL_STYLESHEET)
+        with resolvers.ExportResolverContext(self._get_xsl_resolvers(export_fs, cache)):
+            return transform(course_tree, **params)
+
     def _do_xsl_transform(self, root, export_fs):
         """
         Perform XSLT transform of export output using XSL stylesheet.
         """
-        parser = etree.XMLParser(recover=True)  # use a forgiving parser, OLX is messy
-        parser.resolvers.add(resolvers.ExportFSResolver(export_fs))
-        parser.resolvers.add(resolvers.PyLocalXSLResolver())
-        parser.resolvers.add(resolvers.AssetURLResolver(export_fs))
-        xsl_sheet = bytes(self._load_export_xsl(), 'utf-8')
-        xslt_root = etree.XML(xsl_sheet, parser)
-        transform = etree.XSLT(xslt_root)
         dt = datetime.datetime.now()
-        result_tree = transform(root, baseURL="'{}'".format(app_settings.LMS_ROOT_URL), curDateTime="'{}'".format(dt))
+        result_tree = self._run_xsl_transform(
+            root, export_fs, baseURL="'{}'".format(app_settings.LMS_ROOT_URL), curDateTime="'{}'".format(dt)
+        )
         print((str(result_tree)))
         return result_tree
+
+
+def shares_olx_export(plugin_class):
+    """
+    Tell whether a plugin only post-processes the OLX export, so one export can be shared with other plugins.
+    """
+    return issubclass(plugin_class, PluggableCourseExportManager) and all(
+        getattr(plugin_class, name) is getattr(PluggableCourseExportManager, name)
+        for name in ('export', 'process_root', 'process_extra')
+    )
+
+
+class SharedOLXCourseExportManager(xml_exporter.CourseExportManager):
+    """
+    Serialize a course to OLX once and run the post_process of several plugins on it.
+
+    Each plugin's output is moved to its path in output_paths, by plugin
+    name, as soon as the plugin is done, so plugins writing outputs of the
+    same name don't clash.  A plugin failing to post-process the course is
+    logged and skipped, leaving no output, while the others carry on.
+    """
+
+    def __init__(self, modulestore, contentstore, courselike_key, root_dir, target_dir, plugin_classes, output_paths):
+        super(SharedOLXCourseExportManager, self).__init__(
+            modulestore, contentstore, courselike_key, root_dir, target_dir
+        )
+        self.exporters = [
+            plugin_class(modulestore, contentstore, courselike_key, root_dir, target_dir)
+            for plugin_class in plugin_classes
+        ]
+        self.output_paths = output_paths
+
+    def post_process(self, root, export_fs):
+        for exporter in self.exporters:
+            start = time.time()
+            try:
+                exporter.post_process(copy.deepcopy(root), export_fs)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception('Could not post-process shared export of {} as {}. Skipping.'.format(
+                    self.courselike_key, exporter.name
+                ))
+                continue
+            shutil.move(
+                export_fs.getsyspath("output.{}".format(exporter.filename_extension)), self.output_paths[exporter.name]
+            )
+            logger.info('Post-processed shared export of {} as {} in {:.3f}s'.format(
+                self.courselike_key, exporter.name, time.time() - start
+            ))
+
+
+class CourseTreeAssembler(object):
+    """
+    Assemble the OLX course tree of an export into a single document.
+
+    Instead of the stylesheet walking course, chapter, sequential, vertical
+    and component files through document() lookups, every file the course
+    references is read in one pass and added to the tree as an oep:document
+    element keyed by its tmpfs: URL.  The asset URL index is added as
+    oep:asset elements.
+    """
+
+    # pointer elements resolved to their own file when under the given parent
+    POINTER_PARENTS = {
+        'chapter': 'course',
+        'sequential': 'chapter',
+        'vertical': 'sequential',
+    }
+
+    def __init__(self, cache):
+        self.cache = cache
+        self.parser = etree.XMLParser(recover=True)  # use a forgiving parser, OLX is messy
+
+    def assemble(self, root):
+        """
+        Return the assembled course tree for the course root node.
+        """
+        course_tree = etree.Element(self._qname('course-tree'), nsmap={'oep': COURSE_TREE_NAMESPACE})
+        course_root = copy.deepcopy(root)
+        course_root.tail = None
+        course_tree.append(course_root)
+
+        pending = ['tmpfs:course/{}.xml'.format(root.get('url_name'))]
+        assembled = set()
+        while pending:
+            url = pending.pop()
+            if url in assembled:
+                continue
+            assembled.add(url)
+            document = self.cache.document(url)
+            if document is None:
+                continue
+            document_root = etree.fromstring(document, self.parser)
+            if document_root is None:
+                continue  # nothing recovered from a malformed document
+            etree.SubElement(course_tree, self._qname('document'), url=url).append(document_root)
+            if '.html' not in url:
+                pending.extend(self._referenced_urls(document_root))
+
+        for asset_id, asset_url in self.cache.asset_urls().items():
+            etree.SubElement(course_tree, self._qname('asset'), url='/static/' + asset_id, href=asset_url)
+        return course_tree
+
+    def _referenced_urls(self, document_root):
+        """
+        Yield the tmpfs: URLs of the files referenced by pointer nodes in an OLX document.
+        """
+        for element in document_root.iter(tag=etree.Element):
+            name = etree.QName(element).localname
+            parent = element.getparent()
+            parent_name = etree.QName(parent).localname if parent is not None else None
+            url_name = element.get('url_name')
+            if url_name is not None and (parent_name == 'vertical' or self.POINTER_PARENTS.get(name) == parent_name):
+                yield 'tmpfs:{}/{}.xml'.format(name, url_name)
+            if name == 'html' and element.get('filename') is not None:
+                yield 'tmpfs:html/{}.html'.format(element.get('filename'))
+
+    @staticmethod
+    def _qname(name):
+        return etree.QName(COURSE_TREE_NAMESPACE, name).text
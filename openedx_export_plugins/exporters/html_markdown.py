@@ -0,0 +1,452 @@
+"""
+Native Python HTML to Markdown conversion.
+
+A table-driven port of the markdown mode of html_to_markdown_2.xsl (with
+the parameter values md_single_doc.xsl uses: atx headings, Markdown links
+and images, pipe tables) working directly on lxml trees.  Each rule of the
+stylesheet is a method here, chosen by element name and, where the
+stylesheet's match patterns look at parents or ancestors, by the chain of
+ancestor elements, so the output is the same as the stylesheet's.
+
+The Markdown stylesheets call the converter through the
+``md:html-to-markdown`` XPath extension function for HTML documents when
+their ``markdownEngine`` parameter is 'python'.
+"""
+
+import math
+import re
+
+from lxml import etree
+
+from . import resolvers
+
+
+MARKDOWN_FUNCTIONS_NAMESPACE = "urn:x-openedx-export-plugins:markdown"
+
+# a text node directly after one of these starts a new block, see the stylesheet's text() rules
+BLOCK_TAGS = frozenset([
+    'address', 'blockquote', 'div', 'dl', 'fieldset', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'hr', 'noscript', 'ol', 'p', 'pre', 'table', 'ul', 'br',
+])
+EMPHASIS_TAGS = frozenset(['em', 'i', 'b', 'strong'])
+ITALIC_TAGS = frozenset(['em', 'i'])
+BOLD_TAGS = frozenset(['b', 'strong'])
+HEADING_PREFIXES = {
+    'h1': '# ',
+    'h2': '## ',
+    'h3': '### ',
+    'h4': '#### ',
+    'h5': '##### ',
+    'h6': '###### ',
+}
+TABLE_CELL_TAGS = frozenset(['td', 'th'])
+
+XML_WHITESPACE = ' \t\r\n'
+XML_WHITESPACE_RE = re.compile('[ \t\r\n]+')
+# &ensp; &emsp; &thinsp;, removed from emphasized text
+SPACING_CHARACTERS = dict.fromkeys([0x2002, 0x2003, 0x2009])
+XML_NUMBER_RE = re.compile(r'^[ \t\r\n]*(-?)([0-9]+)(?:[eE]([-+]?)([0-9]*))?[ \t\r\n]*$')
+
+
+class _Text(object):
+    """
+    A text node, which lxml keeps as the text or tail of an element.
+
+    ``leading`` is set if it is the first text node of its parent or
+    follows a block level element.
+    """
+    __slots__ = ('value', 'leading')
+
+    def __init__(self, value, leading):
+        self.value = value
+        self.leading = leading
+
+
+class HTMLMarkdownConverter(object):
+    """
+    Convert XHTML element trees to Pandoc Markdown the way html_to_markdown_2.xsl does.
+
+    base_url prefixes asset URLs, like the stylesheet's $baseURL parameter.
+    asset_url is a callable returning the content store URL of a /static/
+    URL, or None if it is unknown.
+    """
+
+    def __init__(self, base_url='', asset_url=None):
+        self.base_url = base_url
+        self.asset_url = asset_url
+        self.rules = {
+            'h1': self._heading,
+            'h2': self._heading,
+            'h3': self._heading,
+            'h4': self._heading,
+            'h5': self._heading,
+            'h6': self._heading,
+            'p': self._paragraph,
+            'br': self._line_break,
+            'hr': self._horizontal_rule,
+            'em': self._italic,
+            'i': self._italic,
+            'strong': self._bold,
+            'b': self._bold,
+            'ul': self._list,
+            'ol': self._list,
+            'li': self._list_item,
+            'a': self._link,
+            'img': self._image,
+            'blockquote': self._blockquote,
+            'code': self._code,
+            'pre': self._children,
+            'table': self._table,
+            'head': self._skip,
+            'style': self._skip,
+            'address': self._unparseable,
+            'dl': self._unparseable,
+            'fieldset': self._unparseable,
+            'form': self._unparseable,
+            'map': self._unparseable,
+            'object': self._unparseable,
+            'script': self._unparseable,
+            'noscript': self._unparseable,
+            'source': self._source,
+        }
+
+    def convert(self, element):
+        """
+        Return the Markdown for the content of an element, not including the element itself.
+        """
+        out = []
+        self._apply(_child_nodes(element), [element.tag], out)
+        return ''.join(out)
+
+    def _apply(self, nodes, stack, out):
+        """
+        Render nodes, given the stack of tags of their ancestors, like xsl:apply-templates.
+        """
+        size = len(nodes)
+        for position, node in enumerate(nodes, 1):
+            if isinstance(node, _Text):
+                self._text(node, stack, out)
+            else:
+                tag = node.tag
+                stack.append(tag)
+                self.rules.get(tag, self._children)(node, stack, out, position, size)
+                stack.pop()
+
+    def _render(self, nodes, stack):
+        out = []
+        self._apply(nodes, stack, out)
+        return ''.join(out)
+
+    # text
+
+    def _text(self, node, stack, out):
+        if stack[-1] == 'code' and len(stack) > 1 and stack[-2] == 'pre':
+            out.append(_indent_lines(node.value))
+        elif any(tag in EMPHASIS_TAGS for tag in stack):
+            out.append(_normalize_space(node.value.translate(SPACING_CHARACTERS)))
+        elif node.leading:
+            if node.value.strip(XML_WHITESPACE):
+                trailing = ' ' if node.value[-1] in XML_WHITESPACE else ''
+                out.append(_escape_number_period_space(_normalize_space(node.value) + trailing))
+        elif not node.value.strip(XML_WHITESPACE):
+            out.append(' ')
+        else:
+            leading = ' ' if node.value[0] in XML_WHITESPACE else ''
+            trailing = ' ' if node.value[-1] in XML_WHITESPACE else ''
+            out.append(_escape_number_period_space(leading + _normalize_space(node.value) + trailing))
+
+    # elements
+
+    def _children(self, element, stack, out, position, size):
+        self._apply(_child_nodes(element), stack, out)
+
+    def _skip(self, element, stack, out, position, size):
+        pass
+
+    def _heading(self, element, stack, out, position, size):
+        out.append(HEADING_PREFIXES[stack[-1]])
+        self._apply(_child_nodes(element), stack, out)
+        out.append('\n\n')
+
+    def _paragraph(self, element, stack, out, position, size):
+        self._apply(_child_nodes(element), stack, out)
+        out.append('\n\n')
+
+    def _line_break(self, element, stack, out, position, size):
+        out.append('  \n')
+
+    def _horizontal_rule(self, element, stack, out, position, size):
+        out.append('---\n\n')
+
+    def _italic(self, element, stack, out, position, size):
+        if stack[-2] in BOLD_TAGS:
+            self._wrap('***', _child_nodes(element), stack, out, '*** ')
+        elif _has_child(element, BOLD_TAGS):
+            self._apply(_child_nodes(element, BOLD_TAGS), stack, out)
+        else:
+            self._wrap('_', _child_nodes(element), stack, out, '_ ')
+
+    def _bold(self, element, stack, out, position, size):
+        if _has_child(element, ITALIC_TAGS):
+            self._apply(_child_nodes(element, ITALIC_TAGS), stack, out)
+        elif stack[-2] in ITALIC_TAGS:
+            self._wrap('***', _child_nodes(element), stack, out, '*** ')
+        else:
+            self._wrap('**', _child_nodes(element), stack, out, '** ')
+
+    def _wrap(self, before, nodes, stack, out, after):
+        out.append(before)
+        self._apply(nodes, stack, out)
+        out.append(after)
+
+    def _list(self, element, stack, out, position, size):
+        nested = _tags(stack, 2) == (stack[-1], 'li')
+        if nested:
+            out.append('\n')
+        self._apply(_child_elements(element), stack, out)
+        if not nested:
+            out.append('\n')
+
+    def _list_item(self, element, stack, out, position, size):
+        list_tag = stack[-2]
+        if list_tag not in ('ul', 'ol'):
+            return self._children(element, stack, out, position, size)
+        marker = '* ' if list_tag == 'ul' else '{}. '.format(position)
+        if _tags(stack, 5) == (list_tag, 'li', list_tag, 'li', list_tag):
+            out.append('        ' + marker)
+        elif _tags(stack, 3) == (list_tag, 'li', list_tag):
+            out.append('    ' + marker)
+        else:
+            self._wrap(marker, _child_nodes(element), stack, out, '\n')
+            return
+        self._apply(_child_nodes(element), stack, out)
+        if position != size:
+            out.append('\n')
+
+    def _link(self, element, stack, out, position, size):
+        if _has_child(element, ('img',)):
+            # Pandoc doesn't support hyperlinked images so output the link afterward as text
+            self._apply(_child_elements(element), stack, out)
+            out.append('\n[link](')
+            out.append(self._href(element.get('href')))
+            out.append(')')
+            return
+        out.append('[')
+        self._apply(_child_nodes(element), stack, out)
+        out.append('](')
+        out.append(self._href(element.get('href')))
+        if element.get('title'):
+            out.append(' "{}"'.format(element.get('title')))
+        out.append(')')
+        if stack[-2] == 'div':
+            out.append('\n\n')
+
+    def _image(self, element, stack, out, position, size):
+        out.append('![')
+        out.append(element.get('alt', ''))
+        out.append('](')
+        out.append(self._href(element.get('src')))
+        if element.get('title'):
+            # use src as title if it comes first
+            title = next(value for name, value in element.items() if name in ('title', 'src'))
+            out.append(' "{}"'.format(title))
+        out.append(')')
+        if element.get('height') is not None or element.get('width') is not None:
+            out.append('{{ height={}px width={}px}}'.format(element.get('height', ''), element.get('width', '')))
+        out.append('\n\n')
+
+    def _blockquote(self, element, stack, out, position, size):
+        content = self._render(_child_nodes(element), stack).rstrip('\r\n')
+        for line in content.split('\n'):
+            out.append('> ')
+            out.append(line)
+            out.append('\n')
+        out.append('\n')
+
+    def _code(self, element, stack, out, position, size):
+        if stack[-2] == 'pre':
+            return self._children(element, stack, out, position, size)
+        out.append('`')
+        out.append(_first_text(element))
+        out.append('`')
+
+    def _table(self, element, stack, out, position, size):
+        for row_position, row in enumerate(element.iter('tr'), 1):
+            cells = [cell for cell in row if cell.tag in TABLE_CELL_TAGS]
+            for cell_position, cell in enumerate(cells, 1):
+                if cell_position == len(cells):
+                    # md-pipe doesn't support multiline cells
+                    cell_stack = stack + _path(element, cell)
+                    out.append(_normalize_space(self._render(_child_nodes(cell), cell_stack)))
+                else:
+                    out.append(_normalize_space(_string_value(cell)))
+                    out.append('|')
+            if row_position == 1:
+                out.append('\n')
+                out.append('|'.join('----' for cell in cells))
+            out.append('\n')
+        out.append('\n')
+
+    def _unparseable(self, element, stack, out, position, size):
+        out.append(_string_value(element))
+        out.append('\n\n')
+
+    def _source(self, element, stack, out, position, size):
+        if stack[-2] != 'video':
+            return self._children(element, stack, out, position, size)
+        src = element.get('src', '')
+        out.append('\n  video source [{}]({}))\n'.format(src, src))
+
+    def _href(self, url):
+        """
+        Transform a non-external asset URL to the full asset URL on the platform.
+        """
+        if url is None:
+            return ''
+        if url.startswith('/static') and '://' not in url and not url.startswith('.'):
+            asset_url = None
+            if self.asset_url is not None and '#' not in url:
+                asset_url = self.asset_url(url)
+            return self.base_url + (asset_url or '')
+        return url
+
+
+def _child_nodes(element, tags=None):
+    """
+    Get the text and element child nodes of an element, optionally only elements with the given tags.
+    """
+    nodes = []
+    first = True
+    after_block = False  # whether the nearest preceding sibling element is block level
+    if element.text:
+        nodes.append(_Text(element.text, True))
+        first = False
+    for child in element:
+        tag = child.tag
+        if isinstance(tag, str):
+            after_block = tag in BLOCK_TAGS
+            if tags is None or tag in tags:
+                nodes.append(child)
+        tail = child.tail
+        if tail:
+            nodes.append(_Text(tail, first or after_block))
+            first = False
+    return nodes
+
+
+def _child_elements(element):
+    return [child for child in element if isinstance(child.tag, str)]
+
+
+def _has_child(element, tags):
+    return any(child.tag in tags for child in element)
+
+
+def _tags(stack, count):
+    """
+    Get the tags of the parents of the current element, outermost first.
+    """
+    return tuple(stack[-count - 1:-1])
+
+
+def _path(ancestor, element):
+    """
+    Get the tags of the elements below ancestor down to element, outermost first.
+    """
+    path = [element.tag]
+    for parent in element.iterancestors():
+        if parent is ancestor:
+            break
+        path.append(parent.tag)
+    return path[::-1]
+
+
+def _first_text(element):
+    if element.text:
+        return element.text
+    for child in element:
+        if child.tail:
+            return child.tail
+    return ''
+
+
+def _string_value(element):
+    return ''.join(element.itertext())
+
+
+def _normalize_space(value):
+    return XML_WHITESPACE_RE.sub(' ', value.strip(XML_WHITESPACE))
+
+
+def _indent_lines(value):
+    """
+    Indent each line of a code block, like the stylesheet's markdown-code-block template.
+    """
+    lines = value.split('\n')
+    if lines[-1] == '':
+        lines.pop()
+    return ''.join('    {}\n'.format(line) for line in lines) + '\n'
+
+
+def _escape_number_period_space(value):
+    """
+    Escape a number-period-space sequence so it isn't read as an ordered list item.
+    """
+    before, period, after = value.partition('.')
+    if not period or not after.startswith(' '):
+        return value
+    number = _xpath_number(before)
+    if not number or math.isnan(number):
+        return value
+    return '{}\\.{}'.format(_format_xpath_number(number), after)
+
+
+def _xpath_number(value):
+    """
+    Get the XPath number() value of a string with no decimal point, or NaN.
+    """
+    match = XML_NUMBER_RE.match(value)
+    if match is None:
+        return float('nan')
+    sign, digits, exponent_sign, exponent = match.groups()
+    number = float(digits)
+    if exponent:
+        try:
+            number *= 10.0 ** (-int(exponent) if exponent_sign == '-' else int(exponent))
+        except OverflowError:
+            number = float('inf')
+    return -number if sign else number
+
+
+def _format_xpath_number(number):
+    """
+    Format a number like XPath string() does in libxml2.
+    """
+    if math.isinf(number):
+        return 'Infinity' if number > 0 else '-Infinity'
+    if -2 ** 31 < number < 2 ** 31 - 1 and number == int(number):
+        return str(int(number))
+    absolute = abs(number)
+    if absolute > 1e9 or absolute < 1e-5:
+        mantissa, exponent = ('%.14e' % number).split('e')
+        return '{}e{}'.format(mantissa.rstrip('0').rstrip('.'), exponent)
+    integer_place = int(math.log10(absolute))
+    fraction_place = 15 - integer_place - 1 if integer_place > 0 else 15 - integer_place
+    return ('%.*f' % (fraction_place, number)).rstrip('0').rstrip('.')
+
+
+def html_to_markdown(context, nodes, base_url=''):
+    """
+    XPath extension function converting the content of HTML elements to Markdown.
+
+    Asset URLs are looked up with the resolvers of the active
+    resolvers.ExportResolverContext.
+    """
+    export_context = resolvers.ExportResolverContext.current()
+    converter = HTMLMarkdownConverter(
+        base_url, export_context.asset_url if export_context is not None else None
+    )
+    return ''.join(converter.convert(node) for node in nodes if isinstance(node.tag, str))
+
+
+etree.FunctionNamespace(MARKDOWN_FUNCTIONS_NAMESPACE)['html-to-markdown'] = html_to_markdown
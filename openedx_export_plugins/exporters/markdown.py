@@ -5,13 +5,22 @@ https://pandoc.org/MANUAL.html#pandocs-markdown
 """
 
 import datetime
-import json
+import io
+import logging
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
+from fs.osfs import OSFS
 from lxml import etree
 
 from .. import app_settings
-from . import base, resolvers
+from . import base, resolvers, xslt
+from . import html_markdown  # pylint: disable=unused-import; registers the XSLT function of the python engine
+
+
+logger = logging.getLogger(__name__)
 
 
 class MarkdownCourseExportManager(base.PluggableCourseExportManager):
@@ -22,48 +31,204 @@ class MarkdownCourseExportManager(base.PluggableCourseExportManager):
     # TODO: allow for alternative xsl via ConfigurationModel storage
     with open(os.path.join(os.path.dirname(__file__), 'xsl', 'md_single_doc.xsl'), 'r') as xslf:
         DEFAULT_XSL_STYLESHEET = xslf.read()
+    with open(os.path.join(os.path.dirname(__file__), 'xsl', 'md_single_doc_assembled.xsl'), 'r') as xslf:
+        ASSEMBLED_XSL_STYLESHEET = xslf.read()
+    with open(os.path.join(os.path.dirname(__file__), 'xsl', 'md_single_doc_chapters.xsl'), 'r') as xslf:
+        CHAPTERS_XSL_STYLESHEET = xslf.read()
 
     name = "markdown"
     http_content_type = "text/markdown"
     filename_extension = "md"
 
+    # engine converting HTML content, 'xsl' or 'python'; COURSE_EXPORT_PLUGIN_MARKDOWN_ENGINE if None
+    markdown_engine = None
+
     def post_process(self, root, export_fs):
         """
         Perform final processing of outputted XML structure to Markdown
         via XSLT.
         """
-        self._build_markdown_document(root, export_fs)
+        workers = app_settings.COURSE_EXPORT_PLUGIN_MARKDOWN_TRANSFORM_WORKERS
+        if workers > 1:
+            self._parallel_markdown_document(root, export_fs, workers)
+        elif app_settings.COURSE_EXPORT_PLUGIN_MARKDOWN_STREAMING:
+            self._stream_markdown_document(root, export_fs)
+        else:
+            self._build_markdown_document(root, export_fs)
 
     def _build_markdown_document(self, root, export_fs):
         transformed = self._do_xsl_transform(root, export_fs)
         output_path = export_fs.getsyspath("output.md")
         transformed.write(output_path, encoding="utf-8", method="text")
 
-    def _do_xsl_transform(self, root, export_fs):
+    def _stream_markdown_document(self, root, export_fs):
         """
-        Perform XSLT transform of export output using XSL stylesheet.
+        Transform and write the document one chapter at a time.
+
+        Each chapter's result tree is written out and released before the
+        next is built, so peak memory follows the largest chapter rather
+        than the whole course.
         """
-        parser = etree.XMLParser(recover=True)  # use a forgiving parser, OLX is messy
-        parser.resolvers.add(resolvers.ExportFSResolver(export_fs))
-        parser.resolvers.add(resolvers.PyLocalXSLResolver())
-        parser.resolvers.add(ExportFSAssetsFileResolver(export_fs))
-        parser.resolvers.add(resolvers.ExportFSPolicyTabsJSONResolver(export_fs))
-        parser.resolvers.add(resolvers.AssetURLResolver(export_fs))
-        parser.resolvers.add(resolvers.ExportFSUpdatesJSONResolver(export_fs))
-
-        xsl_sheet = bytes(self._load_export_xsl(), 'utf-8')
-        xslt_root = etree.XML(xsl_sheet, parser)
-        transform = etree.XSLT(xslt_root)
+        transform = xslt.get_transform(self.CHAPTERS_XSL_STYLESHEET)
+        cache = self._get_export_cache(export_fs)
+        parts = self._get_document_parts(root, export_fs, cache)
+
+        output_path = export_fs.getsyspath("output.md")
+        with open(output_path, "wb") as output:
+            with resolvers.ExportResolverContext(self._get_xsl_resolvers(export_fs, cache)):
+                for part in parts:
+                    transformed = transform(root, **part)
+                    transformed.write(output, encoding="utf-8", method="text")
+                    del transformed
+                    cache.clear_documents()
+
+    def _parallel_markdown_document(self, root, export_fs, workers):
+        """
+        Transform the document's chapters in a pool and write them out in course order.
+
+        The front matter, updates, tabs, handouts and assets are rendered
+        once, as the head and tail parts of the document.  The pool lives
+        for this export only, see _get_transform_pool.  If a pool process
+        dies the document is transformed serially instead.
+        """
+        parts = self._get_document_parts(root, export_fs, resolvers.ExportFSCache(export_fs))
+        export_dir = export_fs.getsyspath("")
+        root_xml = etree.tostring(root)
+
+        try:
+            with _get_transform_pool(workers) as pool:
+                futures = [pool.submit(_transform_document_part, export_dir, root_xml, part) for part in parts]
+                output_path = export_fs.getsyspath("output.md")
+                with open(output_path, "wb") as output:
+                    for future in futures:
+                        output.write(future.result())
+        except BrokenProcessPool:
+            logger.warning('A process transforming {} died, transforming it serially'.format(self.courselike_key))
+            self._stream_markdown_document(root, export_fs)
+
+    def _get_document_parts(self, root, export_fs, cache):
+        """
+        Get the XSL parameters for each part of the document, in order.
+        """
+        params = self._get_xsl_params(export_fs)
+        parts = [dict(part="'head'")]
+        parts += [dict(part="'chapter'", chapter=str(n)) for n in range(1, self._count_chapters(root, cache) + 1)]
+        parts += [dict(part="'tail'")]
+        for part in parts:
+            part.update(params)
+        return parts
+
+    def _count_chapters(self, root, cache):
+        document = cache.document('tmpfs:course/{}.xml'.format(root.get('url_name')))
+        if document is None:
+            return 0
+        course = etree.fromstring(document, etree.XMLParser(recover=True))
+        return len(course.findall('chapter')) if course is not None else 0
+
+    def _get_xsl_resolvers(self, export_fs, cache):
+        """
+        Get the resolvers for document() lookups made by the Markdown stylesheet.
+        """
+        return _markdown_xsl_resolvers(export_fs, cache)
+
+    def _get_xsl_params(self, export_fs):
         dt = datetime.datetime.now()
         course_id = export_fs._sub_dir.replace('/', '')
-        result_tree = transform(
-            root, baseURL="'{}/'".format(app_settings.LMS_ROOT_URL),
-            curDateTime="'{}'".format(dt), courseID="'{}'".format(course_id)
+        return dict(
+            baseURL="'{}/'".format(app_settings.LMS_ROOT_URL),
+            curDateTime="'{}'".format(dt), courseID="'{}'".format(course_id),
+            markdownEngine="'{}'".format(self.markdown_engine or app_settings.COURSE_EXPORT_PLUGIN_MARKDOWN_ENGINE),
         )
+
+    def _do_xsl_transform(self, root, export_fs):
+        """
+        Perform XSLT transform of export output using XSL stylesheet.
+        """
+        result_tree = self._run_xsl_transform(root, export_fs, **self._get_xsl_params(export_fs))
         # print(str(result_tree))
         return result_tree
 
 
+def _markdown_xsl_resolvers(export_fs, cache):
+    return [
+        resolvers.ExportFSResolver(export_fs, cache),
+        ExportFSAssetsFileResolver(export_fs, cache),
+        resolvers.ExportFSPolicyTabsJSONResolver(export_fs, cache),
+        resolvers.AssetURLResolver(export_fs, cache),
+        resolvers.ExportFSUpdatesJSONResolver(export_fs, cache),
+    ]
+
+
+def _get_transform_pool(workers):
+    """
+    Get a new pool transforming document parts, to be shut down once the export is done.
+
+    Daemonic processes, like Celery's prefork pool workers, can't start
+    children, so they transform in a thread pool instead; lxml releases
+    the GIL while it transforms.  The chapters stylesheet is compiled
+    before a process pool is started, so its forked processes inherit it.
+    """
+    if multiprocessing.current_process().daemon:
+        return ThreadPoolExecutor(max_workers=workers)
+    xslt.get_transform(MarkdownCourseExportManager.CHAPTERS_XSL_STYLESHEET)
+    return ProcessPoolExecutor(max_workers=workers)
+
+
+def _transform_document_part(export_dir, root_xml, part):
+    """
+    Transform one part of a Markdown document in a pool worker and return its bytes.
+
+    Each part reads the documents it looks up into a cache of its own.
+    That costs little: the course document is the only one every part
+    looks up, and the streamed transform releases the others after each
+    chapter too.
+    """
+    export_fs = OSFS(export_dir)
+    cache = resolvers.ExportFSCache(export_fs)
+    transform = xslt.get_transform(MarkdownCourseExportManager.CHAPTERS_XSL_STYLESHEET)
+    with resolvers.ExportResolverContext(_markdown_xsl_resolvers(export_fs, cache)):
+        transformed = transform(etree.fromstring(root_xml), **part)
+    output = io.BytesIO()
+    transformed.write(output, encoding="utf-8", method="text")
+    return output.getvalue()
+
+
+ASSET_SUPERTYPES = {
+    'image/png': 'Images',
+    'image/jpeg': 'Images',
+    'image/gif': 'Images',
+    'application/pdf': 'Documents',
+    'application/javascript': 'Code',
+    'text/html': 'Code',
+    'text/css': 'Code',
+}
+
+
+def asset_supertype(content_type):
+    """
+    Get the heading an asset of the given content type is listed under.
+    """
+    return ASSET_SUPERTYPES.get(content_type, 'Other')
+
+
+def assets_markdown(assets):
+    """
+    Format (supertype, name) pairs of course assets as Markdown lists grouped by supertype.
+    """
+    new_dict = dict(Images=[], Documents=[], Code=[], Other=[])
+
+    for supertype, name in assets:
+        new_dict[supertype].append(name)
+
+    ret_str = ""
+    # TODO: this doesn't have to be markdown-specific
+    # if we can make the return string more generic
+    for key in new_dict:
+        ret_str += "\n\n#### {}\n* ".format(key)
+        ret_str += "\n* ".join(sorted(new_dict[key]))
+    return ret_str
+
+
 class ExportFSAssetsFileResolver(resolvers.ExportFSResolver):
     """
     Resolve assets.json file using custom parsing
@@ -73,44 +238,17 @@ class ExportFSAssetsFileResolver(resolvers.ExportFSResolver):
         if not url.startswith('assets:'):
             return None   # move on to next Resolver
 
-        def asset_object_hook(obj):
-            TYPE_LOOKUP = {
-                'image/png': 'Images',
-                'image/jpeg': 'Images',
-                'image/gif': 'Images',
-                'application/pdf': 'Documents',
-                'application/javascript': 'Code',
-                'text/html': 'Code',
-                'text/css': 'Code',
-            }
+        def summarize_asset(obj):
             if 'contentType' in obj:
-                try:
-                    supertype = TYPE_LOOKUP[obj['contentType']]
-                except KeyError:
-                    supertype = 'Other'
-                return dict(supertype=supertype, name=obj['displayname'])
+                return dict(supertype=asset_supertype(obj['contentType']), name=obj['displayname'])
             else:
                 return obj
 
-        def sorted_by_type(assets):
-            new_dict = dict(Images=[], Documents=[], Code=[], Other=[])
-
-            for key, val in assets.items():
-                new_dict[val['supertype']].append(val['name'])
-
-            ret_str = ""
-            # TODO: this resolver doesn't have to be markdown-specific
-            # if we can make the return string more generic
-            for key in new_dict:
-                ret_str += "\n\n#### {}\n* ".format(key)
-                ret_str += "\n* ".join(sorted(new_dict[key]))
-            return ret_str
-
-        path = self.fs.getsyspath(url.replace('assets:', '', 1))
-        if os.path.exists(path):
-            with open(path) as f:
-                assets = json.load(f, object_hook=asset_object_hook)
-                assets_str = sorted_by_type(assets)
-                return self.resolve_string("<xml><![CDATA[{}]]></xml>".format(assets_str), context)
+        path = url.replace('assets:', '', 1)
+        assets_json = self.cache.json(path)
+        if assets_json is not None:
+            assets = [summarize_asset(val) for val in assets_json.values()]
+            assets_str = assets_markdown((val['supertype'], val['name']) for val in assets)
+            return self.resolve_string("<xml><![CDATA[{}]]></xml>".format(assets_str), context)
         else:
             return self.resolve_empty(context)
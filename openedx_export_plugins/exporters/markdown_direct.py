@@ -0,0 +1,251 @@
+"""
+Markdown format exporter rendering directly from the modulestore.
+
+Unlike MarkdownCourseExportManager this does not serialize the course to
+OLX first.  The published course is loaded with a single depth-loaded
+fetch and Markdown is streamed to the output file as the block tree is
+walked.  Heading and component rules follow md_single_doc.xsl, and HTML
+and problem content is rendered with the same stylesheet rules.
+"""
+
+import datetime
+import io
+import os
+
+from lxml import etree
+
+from xblock.fields import Scope
+from xmodule.contentstore.content import StaticContent
+from xmodule.modulestore import ModuleStoreEnum
+from xmodule.modulestore.exceptions import ItemNotFoundError
+
+from .. import app_settings
+from . import resolvers, xslt
+from .markdown import asset_supertype, assets_markdown
+
+
+HEADINGS = {
+    'course': '# ',
+    'chapter': '## ',
+    'sequential': '### ',
+    'vertical': '#### ',
+}
+COMPONENT_HEADING = '##### '
+
+# fields not listed for components rendered from their field values
+IGNORED_FIELDS = ('display_name', 'name', 'url_name', 'xblock-family', 'markdown', 'data', 'xml_attributes')
+
+
+class DirectMarkdownCourseExporter(object):
+    """
+    Manages export of course objects to the Markdown format without an intermediate OLX export.
+    """
+
+    with open(os.path.join(os.path.dirname(__file__), 'xsl', 'md_direct.xsl'), 'r') as xslf:
+        DEFAULT_XSL_STYLESHEET = xslf.read()
+
+    name = "markdown-direct"
+    http_content_type = "text/markdown"
+    filename_extension = "md"
+
+    def __init__(self, modulestore, contentstore, courselike_key, root_dir, target_dir):
+        self.modulestore = modulestore
+        self.contentstore = contentstore
+        self.courselike_key = courselike_key
+        self.root_dir = root_dir
+        self.target_dir = target_dir
+        # use forgiving parsers, content is messy; content is parsed as UTF-8 bytes, as lxml refuses
+        # str with an encoding declaration
+        self.parser = etree.XMLParser(recover=True, encoding='utf-8')
+        self.html_parser = etree.HTMLParser(encoding='utf-8')
+        self.xsl_params = {}
+
+    def export(self):
+        """
+        Render the published course to output.md in the target directory.
+        """
+        output_dir = os.path.join(self.root_dir, self.target_dir)
+        if not os.path.isdir(output_dir):
+            os.makedirs(output_dir)
+
+        self.xsl_params = dict(
+            baseURL="'{}/'".format(app_settings.LMS_ROOT_URL),
+            curDateTime="'{}'".format(datetime.datetime.now()),
+            courseID="'{}'".format(self.target_dir.replace('/', '')),
+            markdownEngine="'{}'".format(app_settings.COURSE_EXPORT_PLUGIN_MARKDOWN_ENGINE),
+        )
+        export_resolvers = [StaticAssetURLResolver(self.courselike_key)]
+
+        with self.modulestore.branch_setting(ModuleStoreEnum.Branch.published_only, self.courselike_key):
+            course = self.modulestore.get_course(self.courselike_key, depth=None)
+            with io.open(os.path.join(output_dir, "output.md"), "w", encoding="utf-8") as output:
+                with resolvers.ExportResolverContext(export_resolvers):
+                    for chunk in self._render_course(course):
+                        output.write(chunk)
+
+    def _render_course(self, course):
+        yield "\n---\ntitle: {}\ndate: Course exported from {}/ at {}\n---\n*{}*\n\n".format(
+            course.display_name, app_settings.LMS_ROOT_URL,
+            self.xsl_params['curDateTime'].strip("'"), self.xsl_params['courseID'].strip("'"),
+        )
+        overview = self._get_html_tree('about', 'overview')
+        if overview is not None:
+            for section in overview.xpath("//section[@class='about']"):
+                yield self._render_fragment(section)
+        short_description = self._get_html_tree('about', 'short_description')
+        if short_description is not None:
+            for section in short_description.xpath("//section"):
+                yield self._render_fragment(section)
+        if overview is not None:
+            for section in overview.xpath("//section[@class='prerequisites']"):
+                yield self._render_fragment(section)
+
+        yield "----\n\n### Course Updates and News\n\n"
+        for chunk in self._render_updates():
+            yield chunk
+
+        for chunk in self._render_block(course):
+            yield chunk
+
+        for chunk in self._render_tabs(course):
+            yield chunk
+
+        yield "----\n\n### Handouts\n\n"
+        handouts = self._get_html_tree('course_info', 'handouts')
+        if handouts is not None:
+            yield self._render_fragment(handouts)
+
+        yield "----\n----\n\n### Assets\n\n"
+        yield self._render_assets()
+
+    def _render_block(self, block):
+        """
+        Yield Markdown for a block and its descendants.
+        """
+        if getattr(block, 'visible_to_staff_only', False):
+            return
+        category = block.location.block_type
+        if category in HEADINGS:
+            yield "{}{}\n".format(HEADINGS[category], block.display_name or "")
+            for child in block.get_children():
+                for chunk in self._render_block(child):
+                    yield chunk
+        elif category == 'html':
+            html_tree = self._parse_html(block.data)
+            if html_tree is not None:
+                yield self._render_fragment(html_tree)
+        elif category == 'problem':
+            problem = self._parse_xml(block.data)
+            if problem is not None:
+                problem.set('display_name', block.display_name or "")
+                yield self._render_fragment(problem)
+        else:
+            # like nonFileComponent, print out the name and field values
+            yield "{}{}\n".format(COMPONENT_HEADING, block.display_name or "")
+            for field_name, field in sorted(block.fields.items()):
+                if field.scope not in (Scope.content, Scope.settings) or field_name in IGNORED_FIELDS:
+                    continue
+                if field.is_set_on(block):
+                    yield "*{}:* {}\n".format(field_name, field.read_from(block))
+            if block.has_children:
+                for child in block.get_children():
+                    for chunk in self._render_block(child):
+                        yield chunk
+
+    def _render_updates(self):
+        updates = self._get_item('course_info', 'updates')
+        items = getattr(updates, 'items', None) or []
+        if items:
+            updates_xml = ""
+            for update in items:
+                if update.get('status') == 'visible':
+                    updates_xml += "<h4>{}</h4>".format(update['date'])
+                    updates_xml += update['content']
+            yield self._render_fragment(etree.fromstring("<xml>{}</xml>".format(updates_xml), self.parser))
+
+    def _render_tabs(self, course):
+        tabs = [
+            tab for tab in course.tabs
+            if getattr(tab, 'url_slug', None) and not getattr(tab, 'course_staff_only', False)
+        ]
+        if not tabs:
+            return
+        tabs_xml = "<h1>Additional Course Pages</h1>"
+        for tab in tabs:
+            static_tab = self._get_item('static_tab', tab.url_slug)
+            tabs_xml += "\n<h2>{}</h2>".format(tab.name) + '\n' + (getattr(static_tab, 'data', None) or "") + "<hr/>"
+        yield self._render_fragment(etree.fromstring("<xml>{}</xml>".format(tabs_xml), self.parser))
+
+    def _render_assets(self):
+        if not self.contentstore:
+            return ""
+        assets, __ = self.contentstore.get_all_content_for_course(self.courselike_key)
+        return assets_markdown(
+            (asset_supertype(asset.get('contentType')), asset['displayname']) for asset in assets
+        )
+
+    def _render_fragment(self, node):
+        """
+        Render an XML or XHTML node with the Markdown stylesheet rules.
+        """
+        if node is None:
+            return ""
+        transform = xslt.get_transform(self.DEFAULT_XSL_STYLESHEET)
+        return str(transform(node, **self.xsl_params))
+
+    def _get_item(self, category, name):
+        try:
+            return self.modulestore.get_item(self.courselike_key.make_usage_key(category, name))
+        except ItemNotFoundError:
+            return None
+
+    def _get_html_tree(self, category, name):
+        item = self._get_item(category, name)
+        return self._parse_html(getattr(item, 'data', None))
+
+    def _parse_html(self, data):
+        """
+        Parse HTML content, or return None if there is none.
+        """
+        if not data:
+            return None
+        return etree.HTML(data.encode('utf-8'), self.html_parser)
+
+    def _parse_xml(self, data):
+        """
+        Parse XML content, or return None if nothing can be recovered from it.
+        """
+        if not data:
+            return None
+        try:
+            return etree.fromstring(data.encode('utf-8'), self.parser)
+        except etree.XMLSyntaxError:
+            return None  # e.g. only whitespace
+
+
+class StaticAssetURLResolver(etree.Resolver):
+    """
+    Resolve asseturl: lookups to content store URLs computed from the course key.
+    """
+    def __init__(self, course_key):
+        self.course_key = course_key
+        super(StaticAssetURLResolver, self).__init__()
+
+    def resolve(self, url, id, context):
+        if not url.startswith('asseturl:'):
+            return None   # move on to next Resolver
+
+        asset_url = self.lookup_asset_url(url.replace('asseturl:', '', 1))
+        if asset_url is None:
+            return self.resolve_empty(context)
+        return self.resolve_string("<xml>{}</xml>".format(asset_url), context)
+
+    def lookup_asset_url(self, url):
+        """
+        Get the content store URL of a /static/ asset URL, or None if it isn't one.
+        """
+        if not url.startswith('/static/'):
+            return None
+        asset_key = StaticContent.compute_location(self.course_key, url.replace('/static/', '', 1))
+        # like the content store filenames in policies/assets.json, which the stylesheet appends to baseURL
+        return str(asset_key)
@@ -2,9 +2,15 @@
 XML Resolvers for lxml.etree
 """
 
+import collections
+import functools
 import json
 import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
+from fs.osfs import OSFS
 from lxml import etree
 
 from django.utils.translation import ugettext as _
@@ -12,6 +18,74 @@ from django.utils.translation import ugettext as _
 from xmodule.contentstore.content import StaticContent
 
 
+_active_contexts = threading.local()
+
+# appended to the path of an HTML fragment for the file prepare_html writes its XHTML to
+PREPARED_HTML_SUFFIX = '.xhtml'
+
+HTMLNormalizationReport = collections.namedtuple(
+    'HTMLNormalizationReport', ['fragments', 'fixed', 'dropped', 'seconds']
+)
+
+
+class ExportResolverContext(object):
+    """
+    Resolvers for a single export, made available to cached compiled stylesheets.
+
+    Use as a context manager around the call to the compiled transform.
+    """
+    def __init__(self, export_resolvers):
+        self.resolvers = list(export_resolvers)
+
+    def __enter__(self):
+        _context_stack().append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _context_stack().pop()
+
+    @classmethod
+    def current(cls):
+        """
+        Return the innermost active context in this thread, or None.
+        """
+        stack = _context_stack()
+        return stack[-1] if stack else None
+
+    def asset_url(self, url):
+        """
+        Get the content store URL of a /static/ asset URL from the first resolver that knows it, or None.
+        """
+        for resolver in self.resolvers:
+            lookup = getattr(resolver, 'lookup_asset_url', None)
+            if lookup is not None:
+                asset_url = lookup(url)
+                if asset_url is not None:
+                    return asset_url
+        return None
+
+
+def _context_stack():
+    if not hasattr(_active_contexts, 'stack'):
+        _active_contexts.stack = []
+    return _active_contexts.stack
+
+
+class ExportContextResolver(etree.Resolver):
+    """
+    Delegate URL lookups to the resolvers of the active ExportResolverContext.
+    """
+    def resolve(self, url, id, context):
+        export_context = ExportResolverContext.current()
+        if export_context is None:
+            return None
+        for resolver in export_context.resolvers:
+            resolved = resolver.resolve(url, id, context)
+            if resolved is not None:
+                return resolved
+        return None   # move on to next Resolver
+
+
 class PyLocalXSLResolver(etree.Resolver):
     """
     Resolve URL lookups relative to this Python module directory.
@@ -28,12 +102,189 @@ class PyLocalXSLResolver(etree.Resolver):
             return self.resolve_empty(context)
 
 
-class ExportFSResolver(etree.Resolver):
+class ExportFSCache(object):
     """
-    Resolve xsl:document() URL lookups to local tempory FS files
+    Per-export cache of documents read from the export filesystem.
+
+    Each file is read at most once per export, and XML documents are not
+    parsed by the cache: they are handed to lxml as read, and parsed by the
+    transform's forgiving parser, once per transform, as libxslt keeps the
+    documents a transform has loaded.  HTML fragments are parsed once as
+    HTML to repair them into XHTML.  Transforms run a chapter at a time
+    parse the documents chapters share once per chapter; the assembled
+    course tree parses every document exactly once.  Missing documents
+    are cached too, as None.  Side JSON files such as policies/assets.json
+    are parsed once and shared by all resolvers of the export.
     """
+    ASSETS_JSON_PATH = "policies/assets.json"
+
     def __init__(self, fs):
         self.fs = fs
+        self._documents = {}
+        self._prepared = {}  # whether each fragment normalized by prepare_html is usable, by URL
+        self._json = {}
+        self._asset_urls = None
+
+    def document(self, url):
+        """
+        Get the XML bytes of a tmpfs: URL, or None if there is no usable document.
+        """
+        try:
+            return self._documents[url]
+        except KeyError:
+            document = self._load_document(url.replace('tmpfs:', '', 1))
+            self._documents[url] = document
+            return document
+
+    def prepare_html(self, workers=1, use_processes=False):
+        """
+        Normalize every HTML fragment in the export to XHTML up front.
+
+        Each fragment's XHTML is written next to it, to the same path with
+        .xhtml appended, and read from there when the fragment is looked up,
+        so the normalized fragments aren't held in memory but cached and
+        released by clear_documents like other documents.  With more than
+        one worker the fragments are normalized in a thread pool, or a
+        process pool if use_processes is set and the export filesystem is
+        on disk; each worker reads and writes the files of its fragments.
+        Returns an HTMLNormalizationReport.
+        """
+        start = time.time()
+        paths = [path.lstrip('/') for path in self.fs.walk.files(filter=['*.html'])]
+        normalize = functools.partial(_normalize_html_file, self.fs)
+        results = None
+        if workers > 1:
+            executor_class = ThreadPoolExecutor
+            if use_processes and self.fs.hassyspath(''):
+                executor_class = ProcessPoolExecutor
+                normalize = functools.partial(_normalize_html_os_file, self.fs.getsyspath(''))
+            try:
+                with executor_class(max_workers=workers) as executor:
+                    results = list(executor.map(normalize, paths))
+            except AssertionError:
+                # daemonic processes, like Celery's prefork pool workers, can't start children
+                results = None
+        if results is None:
+            results = [_normalize_html_file(self.fs, path) for path in paths]
+
+        fixed = dropped = 0
+        for path, (usable, repaired) in zip(paths, results):
+            self._prepared['tmpfs:' + path] = usable
+            if not usable:
+                dropped += 1
+            elif repaired:
+                fixed += 1
+        return HTMLNormalizationReport(len(paths), fixed, dropped, time.time() - start)
+
+    def _load_document(self, path):
+        if not self.fs.exists(path):
+            # component nodes will have url_names even if all information is stored as attributes
+            # on the node so there will be no matching file
+            return None
+        prepared = self._prepared.get('tmpfs:' + path)
+        if prepared is not None:
+            return self.fs.readbytes(path + PREPARED_HTML_SUFFIX) if prepared else None
+        if '.html' in path:
+            return normalize_html(self.fs.readtext(path))
+        # whoever looks the document up parses it, recovering from errors in malformed documents
+        contents = self.fs.readbytes(path)
+        if not contents.strip():
+            return None  # not even a recovering parser takes an empty document
+        return contents
+
+    def clear_documents(self):
+        """
+        Release the cached documents, e.g. once a part of the course they belong to is done.
+        """
+        self._documents.clear()
+
+    def json(self, path):
+        """
+        Get the parsed contents of a JSON file, or None if it doesn't exist.
+
+        The returned object is shared; callers must not modify it.
+        """
+        try:
+            return self._json[path]
+        except KeyError:
+            contents = json.loads(self.fs.readtext(path)) if self.fs.exists(path) else None
+            self._json[path] = contents
+            return contents
+
+    def asset_urls(self):
+        """
+        Get the index of course asset ids to content store URLs.
+        """
+        if self._asset_urls is None:
+            assets = self.json(self.ASSETS_JSON_PATH) or {}
+            self._asset_urls = {
+                key: val['filename'] for key, val in assets.items()
+                if isinstance(val, dict) and 'filename' in val
+            }
+        return self._asset_urls
+
+    def asset_url(self, asset_id):
+        """
+        Get the content store URL of a course asset, or None if it is unknown.
+        """
+        return self.asset_urls().get(asset_id)
+
+
+def normalize_html(contents):
+    """
+    Turn an HTML fragment into well-formed XHTML bytes, or None if nothing usable is left.
+    """
+    return _normalize_html_fragment(contents)[0]
+
+
+def _normalize_html_file(fs, path):
+    """
+    Normalize the HTML fragment at path and write its XHTML next to it, as prepare_html reads it.
+
+    Returns whether anything usable was left, and whether the HTML parser
+    had to recover from errors in the fragment.
+    """
+    document, repaired = _normalize_html_fragment(fs.readtext(path))
+    if document is not None:
+        fs.writebytes(path + PREPARED_HTML_SUFFIX, document)
+    return document is not None, repaired
+
+
+def _normalize_html_os_file(root_dir, path):
+    """
+    Normalize an HTML fragment of an export on disk in a pool process, like _normalize_html_file.
+    """
+    with OSFS(root_dir) as fs:
+        return _normalize_html_file(fs, path)
+
+
+def _normalize_html_fragment(contents):
+    """
+    Normalize an HTML fragment, also reporting whether the HTML parser had to recover from errors in it.
+    """
+    # we have to turn it into proper XHTML
+    # mostly they are invalid fragments without enclosing <html>
+    parser = etree.HTMLParser()
+    try:
+        html_tree = etree.HTML(contents, parser)
+    except etree.ParseError:
+        return None, True
+    if html_tree is None:
+        return None, True
+    return etree.tostring(html_tree), len(parser.error_log) > 0
+
+
+class ExportFSResolver(etree.Resolver):
+    """
+    Resolve xsl:document() URL lookups to files in the export filesystem.
+
+    Files are read through the filesystem API rather than by system path,
+    so this works with OS and in-memory export filesystems alike.  Resolvers
+    for the same export should share one ExportFSCache.
+    """
+    def __init__(self, fs, cache=None):
+        self.fs = fs
+        self.cache = cache if cache is not None else ExportFSCache(fs)
         super(ExportFSResolver, self).__init__()
 
     def resolve(self, url, id, context):
@@ -41,30 +292,10 @@ class ExportFSResolver(etree.Resolver):
         if not url.startswith('tmpfs:'):
             return None   # move on to next Resolver
 
-        path = self.fs.getsyspath(url.replace('tmpfs:', '', 1))
-        if os.path.exists(path):
-            # TODO: maybe move this into some error handling code
-            try:
-                if '.html' in path:
-                    # we have to turn it into proper XHTML
-                    # mostly they are invalid fragments without enclosing <html>
-                    with open(path) as f:
-                        contents = f.read()
-                        html_tree = etree.HTML(contents)
-                        if html_tree is not None:
-                            return self.resolve_string(etree.tostring(html_tree), context)
-                        else:
-                            return self.resolve_empty(context)
-                else:
-                        etree.parse(path)  # validate parseability
-                        return self.resolve_filename(path, context)
-            except etree.ParseError as e:
-                # print("Refusing to load a malformed document {} with error {}.  Returning empty document".format(url, e.message))
-                return self.resolve_empty(context)
-        else:
-            # component nodes will have url_names even if all information is stored as attributes
-            # on the node so this resolver will not find a matching file
+        document = self.cache.document(url)
+        if document is None:
             return self.resolve_empty(context)
+        return self.resolve_string(document, context, base_url=url)
 
 
 class ExportFSPolicyTabsJSONResolver(ExportFSResolver):
@@ -75,29 +306,26 @@ class ExportFSPolicyTabsJSONResolver(ExportFSResolver):
         if not url.startswith('tabs:'):
             return None   # move on to next Resolver
 
-        path = self.fs.getsyspath(url.replace('tabs:', '', 1))
+        path = url.replace('tabs:', '', 1)
 
-        if os.path.exists(path):
-            with open(path) as f:
-                policy_json = json.load(f)
-                try:
-                    # we only care about tabs that have a url_name and aren't course staff only
-                    policy_tabs = policy_json['course/course']['tabs']
-                    print(policy_tabs)
-                    tabs = [tab for tab in policy_tabs if 'url_slug' in tab and not tab['course_staff_only']]
-                except KeyError:
-                    return self.resolve_empty(context)
-                if tabs:
-                    # resolver can't return multiple filenames out of
-                    #  policy.json so we have to call another resolver on each
-                    tabs_xml = _("<h1>Additional Course Pages</h1>")
-                    for tab in tabs:
-                        # docs_xsl += "<xsl:apply-templates select=\"document('tmpfs:tabs/{}.html')\"/>".format(tab['url_slug'])
-                        with open(os.path.join(self.fs.getsyspath('tabs'), '{}.html'.format(tab['url_slug']))) as html:
-                            tabs_xml += "\n<h2>{}</h2>".format(tab['name']) + '\n' + html.read() + "<hr/>"
-                    return self.resolve_string("<xml>{}</xml>".format(tabs_xml), context)
-                else:
-                    return self.resolve_empty(context)
+        policy_json = self.cache.json(path)
+        if policy_json is not None:
+            try:
+                # we only care about tabs that have a url_name and aren't course staff only
+                policy_tabs = policy_json['course/course']['tabs']
+                tabs = [tab for tab in policy_tabs if 'url_slug' in tab and not tab['course_staff_only']]
+            except KeyError:
+                return self.resolve_empty(context)
+            if tabs:
+                # resolver can't return multiple filenames out of
+                #  policy.json so we have to call another resolver on each
+                tabs_xml = _("<h1>Additional Course Pages</h1>")
+                for tab in tabs:
+                    html = self.fs.readtext('tabs/{}.html'.format(tab['url_slug']))
+                    tabs_xml += "\n<h2>{}</h2>".format(tab['name']) + '\n' + html + "<hr/>"
+                return self.resolve_string("<xml>{}</xml>".format(tabs_xml), context)
+            else:
+                return self.resolve_empty(context)
         else:
             return self.resolve_empty(context)
 
@@ -110,20 +338,19 @@ class ExportFSUpdatesJSONResolver(ExportFSResolver):
         if not url.startswith('updates:'):
             return None   # move on to next Resolver
 
-        path = self.fs.getsyspath(url.replace('updates:', '', 1))
+        path = url.replace('updates:', '', 1)
 
-        if os.path.exists(path):
-            with open(path) as f:
-                updates_json = json.load(f)
-                if len(updates_json):
-                    updates_xml = ""
-                    for update in updates_json:
-                        if update['status'] == 'visible':
-                            updates_xml += "<h4>{}</h4>".format(update['date'])
-                            updates_xml += update['content']
-                    return self.resolve_string("<xml>{}</xml>".format(updates_xml), context)
-                else:
-                    return self.resolve_empty(context)
+        updates_json = self.cache.json(path)
+        if updates_json is not None:
+            if len(updates_json):
+                updates_xml = ""
+                for update in updates_json:
+                    if update['status'] == 'visible':
+                        updates_xml += "<h4>{}</h4>".format(update['date'])
+                        updates_xml += update['content']
+                return self.resolve_string("<xml>{}</xml>".format(updates_xml), context)
+            else:
+                return self.resolve_empty(context)
         else:
             return self.resolve_empty(context)
 
@@ -135,15 +362,16 @@ class AssetURLResolver(ExportFSResolver):
         if not url.startswith('asseturl:'):
             return None   # move on to next Resolver
 
-        asset_id = url.replace('asseturl:/static/', '', 1)
-        json_path = self.fs.getsyspath("policies/assets.json")
-        if os.path.exists(json_path):
-            with open(json_path) as f:
-                assets = json.load(f)
-                try:
-                    asset_url = assets[asset_id]['filename']
-                    return self.resolve_string("<xml>{}</xml>".format(asset_url), context)
-                except KeyError:
-                    return self.resolve_empty(context)
+        asset_url = self.lookup_asset_url(url.replace('asseturl:', '', 1))
+        if asset_url is not None:
+            return self.resolve_string("<xml>{}</xml>".format(asset_url), context)
         else:
             return self.resolve_empty(context)
+
+    def lookup_asset_url(self, url):
+        """
+        Get the content store URL of a /static/ asset URL, or None if it is unknown.
+        """
+        if not url.startswith('/static/'):
+            return None
+        return self.cache.asset_url(url.replace('/static/', '', 1))
@@ -0,0 +1,15 @@
+<?xml version="1.0" encoding="UTF-8"?>
+<xsl:stylesheet
+    xmlns:xsl="http://www.w3.org/1999/XSL/Transform"
+    version="1.0">
+
+  <!--
+  Renders individual content fragments (HTML, problem XML) for the direct
+  Markdown exporter with the rules of md_single_doc.xsl, as plain text.
+  -->
+
+  <xsl:import href="pylocal:md_single_doc.xsl" />
+
+  <xsl:output method="text" encoding="UTF-8" />
+
+</xsl:stylesheet>
@@ -3,12 +3,16 @@
     xmlns:xsl="http://www.w3.org/1999/XSL/Transform"
     xmlns:dyn="http://exslt.org/dynamic"
     xmlns:str="http://exslt.org/strings"
+    xmlns:md="urn:x-openedx-export-plugins:markdown"
     extension-element-prefixes="dyn str"
+    exclude-result-prefixes="md"
     version="1.0">
 
   <xsl:param name="baseURL" />
   <xsl:param name="curDateTime" />
   <xsl:param name="courseID" />
+  <!-- 'xsl' or 'python' to convert HTML documents with html_markdown.HTMLMarkdownConverter -->
+  <xsl:param name="markdownEngine" select="'xsl'" />
 
   <xsl:include href="pylocal:html_to_markdown_2.xsl" />
 
@@ -38,7 +42,15 @@
   </xsl:template>
 
   <xsl:template match="*">
-    <xsl:apply-templates mode="markdown"/>
+    <xsl:choose>
+      <!-- HTML documents, leaving any problem markup to the templates below -->
+      <xsl:when test="$markdownEngine = 'python' and (self::html or self::xml or self::section) and not(.//choicegroup or .//optionresponse or .//multiplechoiceresponse)">
+        <xsl:value-of select="md:html-to-markdown(., $baseURL)"/>
+      </xsl:when>
+      <xsl:otherwise>
+        <xsl:apply-templates mode="markdown"/>
+      </xsl:otherwise>
+    </xsl:choose>
   </xsl:template>
 
   <!-- whitespace-only text node to explicit line break -->
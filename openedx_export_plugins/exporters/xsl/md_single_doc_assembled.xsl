@@ -0,0 +1,120 @@
+<?xml version="1.0" encoding="UTF-8"?>
+<xsl:stylesheet
+    xmlns:xsl="http://www.w3.org/1999/XSL/Transform"
+    xmlns:oep="urn:x-openedx-export-plugins:course-tree"
+    exclude-result-prefixes="oep"
+    version="1.0">
+
+  <!--
+  Plain single-pass variant of md_single_doc.xsl for a course tree assembled
+  in Python (see base.CourseTreeAssembler).  Every OLX document the course
+  references is already in the source tree as an oep:document keyed by its
+  tmpfs: URL, and asset URLs as oep:asset elements, so no dyn:evaluate or
+  resolver callbacks are needed to walk the course.
+
+  Templates here take import precedence over all of md_single_doc.xsl's,
+  whatever their priority, so every template that competes with the pointer
+  templates is re-declared below in the same order and with the same
+  priority to keep the output identical.
+  -->
+
+  <xsl:import href="pylocal:md_single_doc.xsl" />
+
+  <xsl:key name="oep-documents" match="oep:document" use="@url"/>
+  <xsl:key name="oep-assets" match="oep:asset" use="@url"/>
+
+  <xsl:variable name="courseTree" select="/"/>
+
+  <xsl:template match="oep:course-tree">
+    <xsl:apply-templates select="*[@course]"/>
+  </xsl:template>
+
+<!-- keep this (lack of) indentation -->
+<xsl:template match="*[@course]">
+<xsl:variable name="courseDocument" select="key('oep-documents', concat('tmpfs:course/', @url_name, '.xml'))"/>
+<root>
+<!-- the following 3 lines are used with the Pandoc yaml_metadata_block Markdown extension -->
+---
+title: <xsl:value-of select="$courseDocument//course/@display_name"/>
+date: Course exported from <xsl:value-of select="$baseURL" /> at <xsl:value-of select="$curDateTime" />
+---
+*<xsl:value-of select="$courseID"/>*
+<xsl:text>&#10;</xsl:text>
+<xsl:apply-templates select="document('tmpfs:about/overview.html')//section[@class='about']"/>
+<xsl:apply-templates select="document('tmpfs:about/short_description.html')//section"/>
+<xsl:apply-templates select="document('tmpfs:about/overview.html')//section[@class='prerequisites']"/>
+<xsl:call-template name="updates"/>
+<xsl:apply-templates select="$courseDocument/node()"/>
+<xsl:apply-templates select="document('tabs:policies/course/policy.json')"/>
+<xsl:call-template name="handouts"/>
+<xsl:call-template name="assets"/>
+</root>
+</xsl:template>
+
+  <xsl:template match="*[@visible_to_staff_only = 'true']" priority="2"/>
+
+  <xsl:template match="course/chapter[@url_name]">
+    <xsl:apply-templates select="key('oep-documents', concat('tmpfs:chapter/', @url_name, '.xml'))/node()"/>
+  </xsl:template>
+
+  <xsl:template match="chapter/sequential[@url_name]">
+    <xsl:apply-templates select="key('oep-documents', concat('tmpfs:sequential/', @url_name, '.xml'))/node()"/>
+  </xsl:template>
+
+  <xsl:template match="sequential/vertical[@url_name]">
+    <xsl:apply-templates select="key('oep-documents', concat('tmpfs:vertical/', @url_name, '.xml'))/node()"/>
+  </xsl:template>
+
+  <xsl:template match="vertical/*[not(self::html)][@url_name]" priority="2">
+    <xsl:variable name="componentContents" select="key('oep-documents', concat('tmpfs:', local-name(), '/', @url_name, '.xml'))"/>
+    <xsl:choose>
+      <xsl:when test="$componentContents/*">
+        <xsl:apply-templates select="$componentContents/node()" />
+      </xsl:when>
+      <xsl:otherwise>
+        <xsl:call-template name="nonFileComponent" mode="markdown">
+          <xsl:with-param name="nodeType" select="local-name()"/>
+          <xsl:with-param name="displayName" select="@display_name|@name" />
+        </xsl:call-template>
+      </xsl:otherwise>
+    </xsl:choose>
+  </xsl:template>
+
+  <xsl:template match="vertical/html[@url_name]">
+    <xsl:apply-templates select="key('oep-documents', concat('tmpfs:html/', @url_name, '.xml'))/node()" />
+  </xsl:template>
+
+  <xsl:template match="html[@filename]" priority="2">
+    <xsl:apply-templates select="key('oep-documents', concat('tmpfs:html/', @filename, '.html'))/node()"/>
+  </xsl:template>
+
+  <xsl:template match="*[@display_name|@name]" priority="1">
+    <xsl:call-template name="mdHeading" mode="markdown">
+      <xsl:with-param name="nodeName" select="local-name()"/>
+      <xsl:with-param name="blockURL" select="@href"/>
+      <xsl:with-param name="blockTitle" select="@display_name|@name"/>
+    </xsl:call-template>
+    <xsl:apply-templates/>
+  </xsl:template>
+
+  <!-- asset URLs from the assembled oep:asset index rather than an asseturl: lookup -->
+  <xsl:template name="evalHref">
+    <xsl:param name="url"/>
+    <xsl:choose>
+      <xsl:when test="contains($url, '://')">
+        <xsl:value-of select="$url" />
+      </xsl:when>
+      <xsl:when test="starts-with($url, '.')">
+        <xsl:value-of select="$url" />
+      </xsl:when>
+      <xsl:when test="starts-with($url, '/static')">
+        <xsl:value-of select="$baseURL" />
+        <xsl:for-each select="$courseTree"><xsl:value-of select="key('oep-assets', $url)/@href" /></xsl:for-each>
+      </xsl:when>
+      <xsl:otherwise>
+        <xsl:value-of select="$url" />
+      </xsl:otherwise>
+    </xsl:choose>
+  </xsl:template>
+
+</xsl:stylesheet>
@@ -0,0 +1,65 @@
+<?xml version="1.0" encoding="UTF-8"?>
+<xsl:stylesheet
+    xmlns:xsl="http://www.w3.org/1999/XSL/Transform"
+    xmlns:dyn="http://exslt.org/dynamic"
+    extension-element-prefixes="dyn"
+    version="1.0">
+
+  <!--
+  Part-at-a-time variant of md_single_doc.xsl for streaming output.
+
+  Each transform renders one part of the document: 'head' (front matter,
+  about, updates and the course heading), 'chapter' (the $chapter'th chapter
+  of the course, with the nodes between it and the previous chapter), or
+  'tail' (whatever follows the last chapter, tabs, handouts and assets).
+  Written out in order, the parts are identical to the output of
+  md_single_doc.xsl.
+  -->
+
+  <xsl:import href="pylocal:md_single_doc.xsl" />
+
+  <xsl:param name="part" select="'head'" />
+  <xsl:param name="chapter" select="0" />
+
+<!-- keep this (lack of) indentation -->
+<xsl:template match="*[@course]">
+<root>
+<xsl:if test="$part = 'head'">
+---
+title: <xsl:value-of select="dyn:evaluate('document(concat(&quot;tmpfs:course/&quot;, @url_name, &quot;.xml&quot;))')//course/@display_name"/>
+date: Course exported from <xsl:value-of select="$baseURL" /> at <xsl:value-of select="$curDateTime" />
+---
+*<xsl:value-of select="$courseID"/>*
+<xsl:text>&#10;</xsl:text>
+<xsl:apply-templates select="document('tmpfs:about/overview.html')//section[@class='about']"/>
+<xsl:apply-templates select="document('tmpfs:about/short_description.html')//section"/>
+<xsl:apply-templates select="document('tmpfs:about/overview.html')//section[@class='prerequisites']"/>
+<xsl:call-template name="updates"/>
+</xsl:if>
+<xsl:apply-templates select="dyn:evaluate('document(concat(&quot;tmpfs:course/&quot;, @url_name, &quot;.xml&quot;))')"/>
+<xsl:if test="$part = 'tail'">
+<xsl:apply-templates select="document('tabs:policies/course/policy.json')"/>
+<xsl:call-template name="handouts"/>
+<xsl:call-template name="assets"/>
+</xsl:if>
+</root>
+</xsl:template>
+
+  <!-- the course element of course/{url_name}.xml, split into parts; otherwise as md_single_doc.xsl renders it -->
+  <xsl:template match="/course[not(@course)]">
+    <xsl:if test="not(@visible_to_staff_only = 'true')">
+      <xsl:if test="$part = 'head' and (@display_name or @name)">
+        <xsl:call-template name="mdHeading"><xsl:with-param name="nodeName" select="local-name()"/><xsl:with-param name="blockTitle" select="@display_name|@name"/><xsl:with-param name="blockURL" select="@href"/></xsl:call-template>
+      </xsl:if>
+      <xsl:choose>
+        <xsl:when test="$part = 'chapter'">
+          <xsl:apply-templates select="node()[count(preceding-sibling::chapter) = $chapter - 1][self::chapter or following-sibling::chapter]"/>
+        </xsl:when>
+        <xsl:when test="$part = 'tail'">
+          <xsl:apply-templates select="node()[not(self::chapter or following-sibling::chapter)]"/>
+        </xsl:when>
+      </xsl:choose>
+    </xsl:if>
+  </xsl:template>
+
+</xsl:stylesheet>
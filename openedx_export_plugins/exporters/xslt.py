@@ -0,0 +1,93 @@
+"""
+Process-wide cache of compiled XSLT stylesheets.
+
+Compiling a stylesheet (including its xsl:include'd sheets) is costly and
+the result does not depend on the course being exported, so compiled
+transforms are shared by every export in the process.  Resolvers for
+the export being transformed are supplied at transform time through a
+resolvers.ExportResolverContext.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+
+from lxml import etree
+
+from . import resolvers
+
+
+logger = logging.getLogger(__name__)
+
+_compiled_transforms = {}
+_compile_lock = threading.Lock()
+
+
+def stylesheet_hash(xsl_sheet):
+    """
+    Return a content hash identifying an XSL stylesheet.
+    """
+    if not isinstance(xsl_sheet, bytes):
+        xsl_sheet = bytes(xsl_sheet, 'utf-8')
+    return hashlib.sha256(xsl_sheet).hexdigest()
+
+
+def get_transform(xsl_sheet):
+    """
+    Return a compiled XSLT transform for the stylesheet, compiling it at most once per process.
+    """
+    if not isinstance(xsl_sheet, bytes):
+        xsl_sheet = bytes(xsl_sheet, 'utf-8')
+    key = stylesheet_hash(xsl_sheet)
+    try:
+        return _compiled_transforms[key]
+    except KeyError:
+        pass
+
+    with _compile_lock:
+        if key not in _compiled_transforms:
+            parser = etree.XMLParser(recover=True)  # use a forgiving parser, OLX is messy
+            parser.resolvers.add(resolvers.PyLocalXSLResolver())
+            parser.resolvers.add(resolvers.ExportContextResolver())
+            xslt_root = etree.XML(xsl_sheet, parser)
+            _compiled_transforms[key] = etree.XSLT(xslt_root)
+        return _compiled_transforms[key]
+
+
+def warm(plugin_classes):
+    """
+    Compile the default stylesheets of the given exporter plugin classes ahead of use.
+    """
+    for plugin_class in plugin_classes:
+        try:
+            xsl_sheet = plugin_class.DEFAULT_XSL_STYLESHEET
+        except AttributeError:
+            continue  # not all exporter plugins use XSL
+        get_transform(xsl_sheet)
+        logger.info("Compiled XSL stylesheet for course export plugin {}".format(plugin_class.name))
+
+
+def clear():
+    """
+    Drop all compiled transforms.
+    """
+    with _compile_lock:
+        _compiled_transforms.clear()
+
+
+def reinit_after_fork():
+    """
+    Give a forked child process a new compile lock.
+
+    A thread of the parent may have held the lock, compiling, when the
+    process forked, and the child's copy would then stay locked for good.
+    Compiled transforms are only added to the cache once complete, so the
+    cache itself stays usable.
+    """
+    global _compile_lock  # pylint: disable=global-statement
+    _compile_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):  # Python 3.7+
+    os.register_at_fork(after_in_child=reinit_after_fork)
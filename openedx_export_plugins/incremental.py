@@ -0,0 +1,159 @@
+"""
+Record of previous course exports, for incremental multi-course exports.
+
+Per exporter plugin, the output of each exported course is kept in a
+directory along with a manifest of the course version it was exported from
+and a SHA-256 hash of the output.  A course whose published version and
+assets are unchanged since its last export reuses the kept output instead
+of being exported again.
+"""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import shutil
+
+from xmodule.contentstore.django import contentstore
+from xmodule.modulestore import ModuleStoreEnum
+
+from . import __version__, app_settings
+
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+def course_version(course):
+    """
+    Get an identifier of the content version of a course, or None if the modulestore doesn't tell it.
+    """
+    version = getattr(course, 'course_version', None)  # split modulestore
+    if version is not None:
+        return str(version)
+    edited_on = getattr(course, 'subtree_edited_on', None) or getattr(course, 'edited_on', None)
+    return edited_on.isoformat() if edited_on else None
+
+
+def course_assets_fingerprint(content_store, course_key):
+    """
+    Get an identifier of the state of a course's assets in the content store: their count and latest upload.
+
+    Uploading, replacing or deleting assets doesn't change the course
+    version, but changes this.
+    """
+    assets, count = content_store.get_all_content_for_course(
+        course_key, start=0, maxresults=1, sort=[('uploadDate', -1)]
+    )
+    upload_date = assets[0].get('uploadDate') if assets else None
+    return "{}@{}".format(count, upload_date.isoformat() if upload_date else '')
+
+
+def published_course_version(store, course_key):
+    """
+    Get an identifier of the content version of the published course and its assets, or None if it can't be told.
+    """
+    with store.branch_setting(ModuleStoreEnum.Branch.published_only, course_key):
+        course = store.get_course(course_key, depth=0)
+    version = course_version(course) if course is not None else None
+    if version is None:
+        return None
+    return "{}+assets:{}".format(version, course_assets_fingerprint(contentstore(), course_key))
+
+
+def file_sha256(path):
+    """
+    Get the hex SHA-256 digest of a file's contents.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CourseExportRecord(object):
+    """
+    Previous course exports of one exporter plugin, checked against the current published course and asset versions.
+
+    Outputs are also invalidated by a new version of this package, which may
+    render courses differently.
+    """
+    def __init__(self, plugin_class, store, root_dir=None):
+        self.plugin_class = plugin_class
+        self.store = store
+        self.course_versions = {}
+        self.dir = os.path.join(root_dir or app_settings.COURSE_EXPORT_PLUGIN_INCREMENTAL_DIR, plugin_class.name)
+        self.reused = []
+        self.regenerated = []
+        self._manifest = self._load_manifest()
+
+    def reusable_output(self, course_key):
+        """
+        Get the path of the kept output of a course if it is still current, or None.
+        """
+        version = self._course_version(course_key)
+        entry = self._manifest.get(str(course_key))
+        if version is None or not entry:
+            return None
+        if entry.get('version') != version or entry.get('package_version') != __version__:
+            return None
+        path = self._output_path(course_key)
+        if not os.path.exists(path) or file_sha256(path) != entry.get('sha256'):
+            logger.warning('Kept export of {} is missing or corrupt, exporting it again'.format(course_key))
+            return None
+        self.reused.append(course_key)
+        return path
+
+    def record(self, course_key, output_filepath):
+        """
+        Keep the fresh output of a course for later runs.
+        """
+        self.regenerated.append(course_key)
+        version = self._course_version(course_key)
+        if version is None:
+            return
+        path = self._output_path(course_key)
+        shutil.copyfile(output_filepath, path)
+        self._manifest[str(course_key)] = {
+            'version': version,
+            'package_version': __version__,
+            'sha256': file_sha256(path),
+        }
+
+    def save(self):
+        """
+        Write the manifest, replacing the previous one only once the new one is complete.
+        """
+        manifest_path = os.path.join(self.dir, MANIFEST_FILENAME)
+        with io.open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(json.dumps(self._manifest, indent=2, sort_keys=True))
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+    def report(self):
+        return "{} courses reused, {} regenerated".format(len(self.reused), len(self.regenerated))
+
+    def _course_version(self, course_key):
+        if course_key not in self.course_versions:
+            self.course_versions[course_key] = published_course_version(self.store, course_key)
+        return self.course_versions[course_key]
+
+    def _output_path(self, course_key):
+        return os.path.join(self.dir, "{}.{}".format(
+            str(course_key).replace('/', '+'), self.plugin_class.filename_extension
+        ))
+
+    def _load_manifest(self):
+        if not os.path.isdir(self.dir):
+            os.makedirs(self.dir)
+        manifest_path = os.path.join(self.dir, MANIFEST_FILENAME)
+        if not os.path.exists(manifest_path):
+            return {}
+        try:
+            with io.open(manifest_path, encoding='utf-8') as f:
+                return json.load(f)
+        except ValueError:
+            logger.warning('Unreadable export manifest {}, exporting all courses again'.format(manifest_path))
+            return {}
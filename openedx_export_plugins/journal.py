@@ -0,0 +1,237 @@
+"""
+Journal of all-courses export runs, so an interrupted run can be resumed.
+
+Each run of an exporter plugin has a directory, named after the plugin and
+the run id (the date by default), holding the output of each course
+finished so far and a journal of them.  An entry is appended to the journal
+and synced to disk as each course finishes, so a run restarted after its
+worker was killed resumes from the first unfinished course.
+
+The process running a run holds a lock file in its directory, refreshed as
+each course finishes, so no other process runs it meanwhile.
+"""
+
+import datetime
+import io
+import json
+import logging
+import os
+import shutil
+import socket
+import time
+
+from . import app_settings, exceptions
+
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_FILENAME = "journal.jsonl"
+LOCK_FILENAME = "run.lock"
+
+
+def list_runs(plugin=None, root_dir=None):
+    """
+    Get the journals of all runs, or of one plugin's runs, oldest first.
+    """
+    root_dir = root_dir or app_settings.COURSE_EXPORT_PLUGIN_RUN_JOURNAL_DIR
+    if not os.path.isdir(root_dir):
+        return []
+    plugins = [plugin] if plugin else sorted(os.listdir(root_dir))
+    runs = []
+    for name in plugins:
+        plugin_dir = os.path.join(root_dir, name)
+        if not os.path.isdir(plugin_dir):
+            continue
+        for run_id in sorted(os.listdir(plugin_dir)):
+            if os.path.exists(os.path.join(plugin_dir, run_id, JOURNAL_FILENAME)):
+                runs.append(ExportRunJournal(name, run_id, root_dir))
+    return sorted(runs, key=lambda run: run.started or '')
+
+
+class ExportRunJournal(object):
+    """
+    The courses finished by one all-courses export run of an exporter plugin, and their outputs.
+    """
+    def __init__(self, plugin, run_id=None, root_dir=None):
+        self.plugin = plugin
+        self.run_id = run_id or datetime.date.today().isoformat()
+        self.dir = os.path.join(root_dir or app_settings.COURSE_EXPORT_PLUGIN_RUN_JOURNAL_DIR, plugin, self.run_id)
+        self.resumed = []
+        self.exported = []
+        self._locked = False
+        self._load()
+
+    def finished_output(self, course_key):
+        """
+        Get the path and archive file name of the output of a course finished earlier in the run, or None.
+        """
+        entry = self.courses.get(str(course_key))
+        if not entry:
+            return None
+        path = os.path.join(self.dir, entry['output'])
+        if not os.path.exists(path):
+            logger.warning('Output of {} is missing from run {}, exporting it again'.format(course_key, self.run_id))
+            return None
+        self.resumed.append(course_key)
+        return path, entry['filename']
+
+    def record(self, course_key, output_filepath, out_fn):
+        """
+        Keep the output of a course and journal it as finished.
+        """
+        self.exported.append(course_key)
+        output = str(course_key).replace('/', '+')
+        shutil.copyfile(output_filepath, os.path.join(self.dir, output + '.tmp'))
+        os.replace(os.path.join(self.dir, output + '.tmp'), os.path.join(self.dir, output))
+        self.courses[str(course_key)] = {'output': output, 'filename': out_fn}
+        self._append({'event': 'course', 'course': str(course_key), 'output': output, 'filename': out_fn})
+        if self._locked:
+            os.utime(self._lock_path, None)
+
+    def complete(self, archive):
+        """
+        Journal the run as complete with the stored archive, and remove the kept course outputs.
+        """
+        self.completed = _now()
+        self.archive = archive
+        self._append({'event': 'complete', 'archive': archive})
+        for entry in self.courses.values():
+            try:
+                os.remove(os.path.join(self.dir, entry['output']))
+            except OSError:
+                pass
+
+    def restart(self):
+        """
+        Forget everything journaled for the run and start it anew.
+        """
+        self.discard()
+        self.resumed = []
+        self.exported = []
+        self._load()
+        if self._locked:
+            self._write_lock()
+
+    def discard(self):
+        """
+        Remove the run's journal and kept course outputs.
+        """
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def lock(self):
+        """
+        Take the run's lock, so no other process runs it until unlocked.
+
+        Raises ExportPluginsRunInProgressError if another process holds it.
+        """
+        holder = self.lock_holder()
+        if holder:
+            raise exceptions.ExportPluginsRunInProgressError(
+                'Run {} of {} is in progress in {}'.format(self.run_id, self.plugin, holder)
+            )
+        try:
+            os.remove(self._lock_path)  # left by a process that died
+        except OSError:
+            pass
+        try:
+            self._write_lock()
+        except FileExistsError:
+            raise exceptions.ExportPluginsRunInProgressError(
+                'Run {} of {} was started meanwhile in {}'.format(self.run_id, self.plugin, self.lock_holder())
+            )
+        self._locked = True
+
+    def unlock(self):
+        if self._locked:
+            self._locked = False
+            try:
+                os.remove(self._lock_path)
+            except OSError:
+                pass
+
+    def lock_holder(self):
+        """
+        Get the host and process id of the process running the run, or None if it isn't running.
+
+        A lock not refreshed for COURSE_EXPORT_PLUGIN_RUN_JOURNAL_LOCK_TIMEOUT
+        seconds, or whose process is gone from this host, isn't held anymore.
+        """
+        try:
+            with io.open(self._lock_path, encoding='utf-8') as f:
+                holder = f.read().strip()
+            age = time.time() - os.path.getmtime(self._lock_path)
+        except (IOError, OSError):
+            return None
+        if age > app_settings.COURSE_EXPORT_PLUGIN_RUN_JOURNAL_LOCK_TIMEOUT:
+            return None
+        host, __, pid = holder.rpartition(':')
+        if host == socket.gethostname() and pid.isdigit() and not _process_exists(int(pid)):
+            return None
+        return holder
+
+    def report(self):
+        return "{} courses resumed, {} exported".format(len(self.resumed), len(self.exported))
+
+    @property
+    def _lock_path(self):
+        return os.path.join(self.dir, LOCK_FILENAME)
+
+    def _write_lock(self):
+        fd = os.open(self._lock_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL)
+        with io.open(fd, 'w', encoding='utf-8') as f:
+            f.write('{}:{}'.format(socket.gethostname(), os.getpid()))
+
+    def _load(self):
+        self.started = None
+        self.completed = None
+        self.archive = None
+        self.courses = {}
+        if not os.path.isdir(self.dir):
+            os.makedirs(self.dir)
+        journal_path = os.path.join(self.dir, JOURNAL_FILENAME)
+        if not os.path.exists(journal_path):
+            self.started = _now()
+            self._append({'event': 'start'})
+            return
+        with io.open(journal_path, encoding='utf-8') as f:
+            lines = f.readlines()
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # the last entry may be cut short when the worker was killed while writing it
+            if entry['event'] == 'start':
+                self.started = entry['at']
+            elif entry['event'] == 'course':
+                self.courses[entry['course']] = {'output': entry['output'], 'filename': entry['filename']}
+            elif entry['event'] == 'complete':
+                self.completed = entry['at']
+                self.archive = entry['archive']
+
+    def _append(self, entry):
+        entry['at'] = _now()
+        with io.open(os.path.join(self.dir, JOURNAL_FILENAME), 'a+b') as f:
+            # start a new line after an entry cut short
+            f.seek(0, os.SEEK_END)
+            if f.tell():
+                f.seek(-1, os.SEEK_END)
+                separator = b'' if f.read(1) == b'\n' else b'\n'
+            else:
+                separator = b''
+            f.write(separator + json.dumps(entry, sort_keys=True).encode('utf-8') + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def _process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # another user's
+    return True
+
+
+def _now():
+    return datetime.datetime.utcnow().replace(microsecond=0).isoformat()
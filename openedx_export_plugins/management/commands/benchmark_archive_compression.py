@@ -0,0 +1,90 @@
+"""
+A Django command that benchmarks archive compression codecs on sample exports.
+
+The given export files, or all files in the given directories, are put in
+an uncompressed tar file the way multi-course exports are, which is then
+compressed with each codec, level and thread count.  Throughput of the
+uncompressed data and the compression ratio are reported for each.
+"""
+
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+from textwrap import dedent
+
+from django.core.management.base import BaseCommand, CommandError
+
+from openedx_export_plugins import compression
+
+CHUNK_SIZE = 64 * 1024
+
+
+class Command(BaseCommand):
+    """
+    Benchmark archive compression codecs on sample exports.
+    """
+    help = dedent(__doc__).strip()
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help="export files, or directories of them, e.g. Markdown exports")
+        parser.add_argument('--codecs', nargs='+', default=compression.available_stream_compressions())
+        parser.add_argument('--levels', nargs='+', type=int, default=[None], help="default is each codec's")
+        parser.add_argument('--threads', nargs='+', type=int, default=[1, os.cpu_count() or 1])
+
+    def handle(self, *args, **options):
+        unavailable = set(options['codecs']) - set(compression.available_stream_compressions())
+        if unavailable:
+            raise CommandError("Unavailable codecs {}".format(', '.join(sorted(unavailable))))
+
+        temp_dir = tempfile.mkdtemp()
+        try:
+            tar_path = os.path.join(temp_dir, 'sample.tar')
+            files = self._build_tar(options['paths'], tar_path)
+            size = os.path.getsize(tar_path)
+            self.stdout.write("{} files, {:.1f} MB uncompressed tar".format(files, size / 1e6))
+            self.stdout.write("{:<6} {:>5} {:>7} {:>10} {:>7} {:>8}".format(
+                'codec', 'level', 'threads', 'MB/s', 'ratio', 'seconds'
+            ))
+            for codec in options['codecs']:
+                for level in options['levels']:
+                    for threads in sorted(set(options['threads'])):
+                        compressor = compression.get_stream_compressor(codec, level=level, threads=threads)
+                        seconds, compressed_size = _compress_file(tar_path, compressor)
+                        self.stdout.write("{:<6} {:>5} {:>7} {:>10.1f} {:>7.2f} {:>8.3f}".format(
+                            codec, compressor.level, threads, size / 1e6 / seconds, size / compressed_size, seconds
+                        ))
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def _build_tar(self, paths, tar_path):
+        files = 0
+        with tarfile.open(tar_path, "w:") as out_tar:
+            for path in paths:
+                if not os.path.exists(path):
+                    raise CommandError("No such file or directory {}".format(path))
+                if os.path.isdir(path):
+                    filepaths = [
+                        os.path.join(dirpath, filename)
+                        for dirpath, __, filenames in os.walk(path) for filename in sorted(filenames)
+                    ]
+                else:
+                    filepaths = [path]
+                for filepath in filepaths:
+                    out_tar.add(filepath, os.path.relpath(filepath, os.path.dirname(path)))
+                    files += 1
+        return files
+
+
+def _compress_file(path, compressor):
+    """
+    Compress a file, returning the seconds it took and the compressed size.
+    """
+    compressed_size = 0
+    start = time.time()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            compressed_size += len(compressor.compress(chunk))
+    compressed_size += len(compressor.finish())
+    return time.time() - start, compressed_size
@@ -0,0 +1,130 @@
+"""
+A Django command that benchmarks the Markdown engines against each other on courses.
+
+Each course is exported once, then its Markdown is rendered with both the
+html_to_markdown_2.xsl stylesheet and the native Python engine, timing the
+transform of the whole course and of its HTML fragments alone.  The
+output of the two engines is compared document by document and fragment
+by fragment, and the command fails if any of it differs.
+"""
+
+import os
+import shutil
+import time
+from textwrap import dedent
+
+from django.core.management.base import BaseCommand, CommandError
+
+from lxml import etree
+
+from opaque_keys import InvalidKeyError
+from opaque_keys.edx.keys import CourseKey
+
+from fs.osfs import OSFS
+from xmodule.contentstore.django import contentstore
+from xmodule.modulestore.django import modulestore
+
+from openedx_export_plugins import utils
+from openedx_export_plugins.exporters import resolvers, xslt
+from openedx_export_plugins.exporters.markdown import MarkdownCourseExportManager
+from openedx_export_plugins.exporters.markdown_direct import DirectMarkdownCourseExporter
+
+ENGINES = ('xsl', 'python')
+
+
+class Command(BaseCommand):
+    """
+    Benchmark the Python Markdown engine against the XSL one and compare their output.
+    """
+    help = dedent(__doc__).strip()
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_ids', nargs='+')
+        parser.add_argument('--repeat', type=int, default=3, help="number of timed runs per engine, best is reported")
+
+    def handle(self, *args, **options):
+        differences = 0
+        for course_id in options['course_ids']:
+            try:
+                course_key = CourseKey.from_string(course_id)
+            except InvalidKeyError:
+                raise CommandError("Unparsable course_id {}".format(course_id))
+
+            root_dir = utils.mkdtemp()
+            try:
+                differences += self._compare_course(course_key, root_dir, options['repeat'])
+            finally:
+                shutil.rmtree(root_dir)
+
+        if differences:
+            raise CommandError("Markdown engine output differs in {} places".format(differences))
+
+    def _compare_course(self, course_key, root_dir, repeat):
+        target_dir = os.path.normpath(str(course_key).replace('/', '+'))
+        exporter = MarkdownCourseExportManager(modulestore(), contentstore(), course_key, root_dir, target_dir)
+        exporter.export()
+
+        export_fs = OSFS(root_dir).opendir(target_dir)
+        root = etree.fromstring(export_fs.readbytes('course.xml'))
+        fragments = self._load_fragments(export_fs)
+        self.stdout.write("{}: {} HTML fragments".format(course_key, len(fragments)))
+
+        documents = {}
+        results = {}
+        for engine in ENGINES:
+            exporter.markdown_engine = engine
+            course_secs, __ = _timed(repeat, exporter.post_process, root, export_fs)
+            documents[engine] = _without_export_date(export_fs.readtext('output.md'))
+            params = exporter._get_xsl_params(export_fs)  # pylint: disable=protected-access
+            fragments_secs, results[engine] = _timed(repeat, self._render_fragments, export_fs, fragments, params)
+            self.stdout.write("  {:<8} course {:.3f}s, HTML fragments {:.3f}s".format(
+                engine, course_secs, fragments_secs
+            ))
+
+        differences = 0
+        if documents['xsl'] != documents['python']:
+            differences += 1
+            self.stdout.write("  course documents differ")
+        for path in sorted(fragments):
+            if results['xsl'][path] != results['python'][path]:
+                differences += 1
+                self.stdout.write("  {} differs".format(path))
+        if not differences:
+            self.stdout.write("  output identical")
+        return differences
+
+    def _load_fragments(self, export_fs):
+        """
+        Get the normalized XHTML trees of all HTML files in the export by path.
+        """
+        parser = etree.XMLParser(recover=True)  # use a forgiving parser, content is messy
+        fragments = {}
+        for path in export_fs.walk.files(filter=['*.html']):
+            document = resolvers.normalize_html(export_fs.readtext(path))
+            if document is not None:
+                fragments[path] = etree.fromstring(document, parser)
+        return fragments
+
+    def _render_fragments(self, export_fs, fragments, params):
+        cache = resolvers.ExportFSCache(export_fs)
+        transform = xslt.get_transform(DirectMarkdownCourseExporter.DEFAULT_XSL_STYLESHEET)
+        export_resolvers = [resolvers.ExportFSResolver(export_fs, cache), resolvers.AssetURLResolver(export_fs, cache)]
+        with resolvers.ExportResolverContext(export_resolvers):
+            return {path: str(transform(fragment, **params)) for path, fragment in fragments.items()}
+
+
+def _timed(repeat, func, *args):
+    """
+    Call func repeat times, returning the best time and the last result.
+    """
+    best = result = None
+    for __ in range(max(repeat, 1)):
+        start = time.time()
+        result = func(*args)
+        secs = time.time() - start
+        best = secs if best is None else min(best, secs)
+    return best, result
+
+
+def _without_export_date(document):
+    return '\n'.join(line for line in document.split('\n') if not line.startswith('date: Course exported from'))
@@ -6,7 +6,6 @@ If <filename> is '-', it pipes the file to stdout.
 
 import os
 import shutil
-from tempfile import mkdtemp, mktemp
 from textwrap import dedent
 
 from django.core.management.base import BaseCommand, CommandError
@@ -18,6 +17,7 @@ from openedx.core.lib import plugins
 from xmodule.contentstore.django import contentstore
 from xmodule.modulestore.django import modulestore
 
+from openedx_export_plugins import utils
 from openedx_export_plugins.plugins import CourseExporterPluginManager
 
 
@@ -35,7 +35,7 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
 
-        root_dir = mkdtemp()
+        root_dir = utils.mkdtemp()
 
         course_id = options['course_id']
         target_dir = os.path.normpath(course_id.replace('/', '+'))
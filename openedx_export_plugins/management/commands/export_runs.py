@@ -0,0 +1,95 @@
+"""
+A Django command that inspects and resumes journaled all-courses export runs.
+
+'list' shows the runs, 'show' the courses a run has finished and how many
+remain, 'resume' continues an interrupted run from its first unfinished
+course (the most recent interrupted run of the plugin if no run id is
+given), and 'discard' removes a run's journal and kept course outputs.
+'show' without a run id shows the plugin's most recent run.  Runs in
+progress in another process can't be resumed nor discarded.
+"""
+
+from textwrap import dedent
+
+from django.core.management.base import BaseCommand, CommandError
+
+from openedx_export_plugins import core, exceptions, journal, tasks
+
+RUN_ROW_FORMAT = "{:<20} {:<12} {:<20} {:<20} {:>8}"
+
+
+class Command(BaseCommand):
+    """
+    Inspect and resume journaled all-courses export runs.
+    """
+    help = dedent(__doc__).strip()
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=('list', 'show', 'resume', 'discard'))
+        parser.add_argument('plugin', nargs='?')
+        parser.add_argument('--run-id', default=None)
+
+    def handle(self, *args, **options):
+        action = options['action']
+        if action == 'list':
+            self._list(journal.list_runs(options['plugin']))
+            return
+
+        if not options['plugin']:
+            raise CommandError("A plugin is required to {} a run".format(action))
+        if action == 'discard' and not options['run_id']:
+            raise CommandError("A run id is required to discard a run")
+        run = self._get_run(options['plugin'], options['run_id'], interrupted=action == 'resume')
+        if action == 'show':
+            self._show(run)
+        elif action == 'discard':
+            self._check_not_running(run)
+            run.discard()
+            self.stdout.write("Discarded run {} of {}".format(run.run_id, run.plugin))
+        else:
+            if run.completed:
+                raise CommandError("Run {} of {} is already complete".format(run.run_id, run.plugin))
+            self._check_not_running(run)
+            self.stdout.write("Resuming run {} of {} after {} courses".format(run.run_id, run.plugin, len(run.courses)))
+            try:
+                tasks.export_all_courses_as(run.plugin, run_id=run.run_id)
+            except exceptions.ExportPluginsRunInProgressError as e:
+                raise CommandError(str(e))
+
+    def _get_run(self, plugin, run_id, interrupted):
+        runs = [
+            run for run in journal.list_runs(plugin)
+            if (run_id is None or run.run_id == run_id) and not (interrupted and run.completed)
+        ]
+        if not runs:
+            raise CommandError("No {}run {}of {}".format(
+                'interrupted ' if interrupted else '', '{} '.format(run_id) if run_id else '', plugin
+            ))
+        return runs[-1]
+
+    def _check_not_running(self, run):
+        holder = run.lock_holder()
+        if holder:
+            raise CommandError("Run {} of {} is in progress in {}".format(run.run_id, run.plugin, holder))
+
+    def _list(self, runs):
+        self.stdout.write(RUN_ROW_FORMAT.format('plugin', 'run', 'started', 'completed', 'courses'))
+        for run in runs:
+            self.stdout.write(RUN_ROW_FORMAT.format(
+                run.plugin, run.run_id, run.started or '-', run.completed or _status(run), len(run.courses)
+            ))
+
+    def _show(self, run):
+        self.stdout.write("Run {} of {}, started {}".format(run.run_id, run.plugin, run.started))
+        if run.completed:
+            self.stdout.write("Completed {}, archive stored at {}".format(run.completed, run.archive))
+        else:
+            remaining = [key for key in core.get_course_keys() if str(key) not in run.courses]
+            status = "In progress in {}".format(run.lock_holder()) if run.lock_holder() else "Interrupted"
+            self.stdout.write("{}, {} courses remaining".format(status, len(remaining)))
+        for course_id, entry in sorted(run.courses.items()):
+            self.stdout.write("{} {}".format(course_id, entry['filename']))
+
+
+def _status(run):
+    return 'running' if run.lock_holder() else 'interrupted'
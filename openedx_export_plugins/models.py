@@ -1,3 +1,89 @@
 """
 Database models for openedx_export_plugins.
 """
+
+import json
+import uuid
+
+from django.conf import settings
+from django.db import models
+
+from opaque_keys.edx.keys import CourseKey
+
+
+class ExportJob(models.Model):
+    """
+    An asynchronous export of one or more courses with an exporter plugin, run by a Celery task.
+
+    The finished artifact, the course's export file or the archive of all
+    courses' exports, is kept in storage at storage_path.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    )
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='+')
+    plugin = models.CharField(max_length=255)
+    # JSON list of the ids of the courses to export
+    course_ids = models.TextField()
+    # archive of multi-course exports: "tar" or "zip"
+    archive_format = models.CharField(max_length=8, default='tar')
+    # exports a single course, requested by its course URL, to its export file instead of an archive
+    single_course = models.BooleanField(default=False)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    courses_done = models.PositiveIntegerField(default=0)
+    courses_total = models.PositiveIntegerField(default=0)
+    storage_path = models.CharField(max_length=1024, blank=True)
+    filename = models.CharField(max_length=255, blank=True)
+    content_type = models.CharField(max_length=255, blank=True)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta(object):
+        app_label = 'openedx_export_plugins'
+        ordering = ('-created',)
+
+    def __str__(self):
+        return 'ExportJob {} as {} ({})'.format(self.id, self.plugin, self.status)
+
+    @property
+    def course_keys(self):
+        return [CourseKey.from_string(course_id) for course_id in json.loads(self.course_ids)]
+
+    @course_keys.setter
+    def course_keys(self, course_keys):
+        self.course_ids = json.dumps([str(course_key) for course_key in course_keys])
+
+    def start(self, courses_total):
+        self.status = self.RUNNING
+        self.courses_total = courses_total
+        self.save(update_fields=['status', 'courses_total', 'modified'])
+
+    def update_progress(self, courses_done, courses_total):
+        """
+        Record how many courses of how many are exported, as export_courses_multiple reports progress.
+        """
+        self.courses_done = courses_done
+        self.courses_total = courses_total
+        self.save(update_fields=['courses_done', 'courses_total', 'modified'])
+
+    def succeed(self, storage_path, filename, content_type):
+        self.status = self.SUCCEEDED
+        self.storage_path = storage_path
+        self.filename = filename
+        self.content_type = content_type
+        self.save(update_fields=['status', 'storage_path', 'filename', 'content_type', 'modified'])
+
+    def fail(self, error):
+        self.status = self.FAILED
+        self.error = error
+        self.save(update_fields=['status', 'error', 'modified'])
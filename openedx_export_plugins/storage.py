@@ -3,16 +3,27 @@ File storage routines for openedx_export_plugins Django app.
 """
 
 import logging
+import os
+import shutil
 
 import boto
 from boto.s3.key import Key
 
-from .app_settings import AWS_ID, AWS_KEY, COURSE_EXPORT_PLUGIN_BUCKET, COURSE_EXPORT_PLUGIN_STORAGE_PREFIX
+from .app_settings import (
+    AWS_ID, AWS_KEY, COURSE_EXPORT_PLUGIN_BUCKET, COURSE_EXPORT_PLUGIN_STORAGE_DIR, COURSE_EXPORT_PLUGIN_STORAGE_PREFIX
+)
 
 
 logger = logging.getLogger(__name__)
 
 
+def get_s3_bucket():
+    """ connect to the S3 bucket generated files are stored in
+    """
+    s3_conn = boto.connect_s3(AWS_ID, AWS_KEY)
+    return s3_conn.get_bucket(COURSE_EXPORT_PLUGIN_BUCKET)
+
+
 def do_store_s3(tmp_fn, storage_path):
     """ handle Amazon S3 storage for generated files
     """
@@ -20,10 +31,56 @@ def do_store_s3(tmp_fn, storage_path):
     bucketname = COURSE_EXPORT_PLUGIN_BUCKET
     dest_path = COURSE_EXPORT_PLUGIN_STORAGE_PREFIX + "/" + storage_path
 
-    s3_conn = boto.connect_s3(AWS_ID, AWS_KEY)
-    bucket = s3_conn.get_bucket(bucketname)
+    bucket = get_s3_bucket()
     key = Key(bucket, name=dest_path)
     key.set_contents_from_filename(local_path)
     logger.info("uploaded {local} to S3 bucket {bucketname}/{s3path}".format(
             local=local_path, bucketname=bucketname, s3path=dest_path
     ))
+
+
+def do_delete_s3(storage_path):
+    """ delete a file stored in S3, if it exists
+    """
+    get_s3_bucket().delete_key(COURSE_EXPORT_PLUGIN_STORAGE_PREFIX + "/" + storage_path)
+
+
+def get_s3_url(storage_path, filename, expires_in):
+    """ get a signed URL downloading a stored file as an attachment named filename
+    """
+    dest_path = COURSE_EXPORT_PLUGIN_STORAGE_PREFIX + "/" + storage_path
+    key = Key(get_s3_bucket(), name=dest_path)
+    return key.generate_url(expires_in, response_headers={
+        'response-content-disposition': 'attachment; filename={}'.format(filename),
+    })
+
+
+def get_local_path(storage_path):
+    """ get the path of a file stored locally
+    """
+    return os.path.join(COURSE_EXPORT_PLUGIN_STORAGE_DIR, COURSE_EXPORT_PLUGIN_STORAGE_PREFIX, storage_path)
+
+
+def do_store_local(tmp_fn, storage_path):
+    """ handle local storage for generated files, in a directory shared with the web workers
+    """
+    dest_path = get_local_path(storage_path)
+    if not os.path.isdir(os.path.dirname(dest_path)):
+        os.makedirs(os.path.dirname(dest_path))
+    shutil.copyfile(tmp_fn, dest_path + '.tmp')
+    os.replace(dest_path + '.tmp', dest_path)
+    logger.info("stored {local} at {dest_path}".format(local=tmp_fn, dest_path=dest_path))
+
+
+def do_delete_local(storage_path):
+    """ delete a file stored locally, and its directory once empty
+    """
+    dest_path = get_local_path(storage_path)
+    try:
+        os.remove(dest_path)
+    except OSError:
+        pass  # already removed
+    try:
+        os.rmdir(os.path.dirname(dest_path))
+    except OSError:
+        pass  # other files remain
@@ -3,17 +3,29 @@ Provide Celery tasks for export jobs.
 """
 
 import datetime
+import functools
 import logging
 import os
+import shutil
+import tempfile
+import time
 
+from celery import chain, chord, shared_task
 from celery.decorators import periodic_task
 from celery.schedules import crontab
+from celery.signals import worker_process_init
 
+from django.core.exceptions import ImproperlyConfigured
 from django.core.mail import EmailMessage
+from django.utils import timezone
 
+from opaque_keys.edx.keys import CourseKey
+from openedx.core.lib.plugins import PluginError
 from xmodule.modulestore.django import modulestore
 
-from . import app_settings, constants, core, exceptions, storage, utils
+from . import app_settings, compression, constants, core, exceptions, incremental, journal, storage, utils
+from .exporters import base, xslt
+from .models import ExportJob
 from .plugins import CourseExporterPluginManager
 
 
@@ -36,15 +48,27 @@ def _notify_error(plugin, error):
     raise error
 
 
+@worker_process_init.connect
+def warm_xslt_cache(**kwargs):
+    """
+    Compile exporter plugin stylesheets once as each worker process starts.
+    """
+    try:
+        xslt.warm(CourseExporterPluginManager.get_available_plugins().values())
+    except Exception as e:
+        # a bad stylesheet should surface on export, not prevent the worker from starting
+        logger.warning("Could not warm XSLT cache: {}".format(e))
+
+
 @periodic_task(
     run_every=crontab(**app_settings.COURSE_EXPORT_PLUGIN_TASK_SCHEDULE),
     queue=QUEUE,
     options={'queue': QUEUE}
 )
 def export_all_courses():
-    for plugin in app_settings.COURSE_EXPORT_PLUGIN_SCHEDULED_PLUGINS:
+    for plugin, export in _get_scheduled_exports():
         try:
-            export_all_courses_as(plugin)
+            export()
         except exceptions.ExportPluginsCourseExportError as e:
             # any single course not exporting shouldn't cause whole job to quit
             logger.warning(e.msg)
@@ -53,31 +77,399 @@ def export_all_courses():
             _notify_error(plugin, e)
 
 
-def export_all_courses_as(plugin):
+def _get_scheduled_exports():
+    """
+    Get the plugin name and export function of each scheduled export.
+
+    With COURSE_EXPORT_PLUGIN_SHARED_OLX enabled the plugins that only
+    post-process the OLX export are exported together, and the others each
+    on their own.
+    """
+    plugins = list(app_settings.COURSE_EXPORT_PLUGIN_SCHEDULED_PLUGINS)
+    if app_settings.COURSE_EXPORT_PLUGIN_TASK_FANOUT:
+        return [(plugin, functools.partial(fan_out_export_all_courses_as, plugin)) for plugin in plugins]
+    exports = []
+    if app_settings.COURSE_EXPORT_PLUGIN_SHARED_OLX and _can_share_olx_exports():
+        shared_plugins = [plugin for plugin in plugins if _shares_olx_export(plugin)]
+        if len(shared_plugins) > 1:
+            exports.append((', '.join(shared_plugins), functools.partial(export_all_courses_as_shared, shared_plugins)))
+            plugins = [plugin for plugin in plugins if plugin not in shared_plugins]
+    return exports + [(plugin, functools.partial(export_all_courses_as, plugin)) for plugin in plugins]
+
+
+def _can_share_olx_exports():
+    """
+    Tell whether scheduled exports can share OLX exports between plugins with the other options configured.
+
+    Shared exports export courses one at a time and don't reuse unchanged
+    courses nor journal their runs, so plugins are exported on their own
+    with those options enabled.
+    """
+    conflicting = [
+        name for name, enabled in (
+            ('COURSE_EXPORT_PLUGIN_INCREMENTAL', app_settings.COURSE_EXPORT_PLUGIN_INCREMENTAL),
+            ('COURSE_EXPORT_PLUGIN_RUN_JOURNAL', app_settings.COURSE_EXPORT_PLUGIN_RUN_JOURNAL),
+            ('COURSE_EXPORT_PLUGIN_EXPORT_WORKERS', app_settings.COURSE_EXPORT_PLUGIN_EXPORT_WORKERS > 1),
+        ) if enabled
+    ]
+    if conflicting:
+        logger.warning('Not sharing OLX exports between plugins with {} enabled'.format(', '.join(conflicting)))
+        return False
+    return True
+
+
+def _shares_olx_export(plugin):
+    try:
+        return base.shares_olx_export(CourseExporterPluginManager.get_plugin(plugin))
+    except PluginError:
+        return False  # fails when exported on its own
+
+
+def export_all_courses_as_shared(plugins):
+    """
+    Save an archive of all course exports for each of several plugins, serializing each course to OLX once for all.
+
+    The plugins must only post-process the OLX export (see
+    exporters.base.shares_olx_export).
     """
-    Save a gzipped (by default) tar file of all course exports.
+    plugin_classes = [CourseExporterPluginManager.get_plugin(plugin) for plugin in plugins]
+    course_keys = core.get_course_keys()
+    archive_format = app_settings.COURSE_EXPORT_PLUGIN_TASK_ARCHIVE_FORMAT
+
+    with utils.TemporaryDirectory() as tempdir:
+        parts_dirs = core.export_courses_shared(plugin_classes, course_keys, tempdir)
+        for plugin_class in plugin_classes:
+            with utils.TemporaryDirectory() as archive_dir:
+                archives = core.archive_course_parts(
+                    plugin_class, course_keys, parts_dirs[plugin_class.name], archive_dir,
+                    _get_archive_filename(plugin_class, archive_format), archive_format=archive_format
+                )
+                _store_archive(plugin_class, archives, archive_format)
+            shutil.rmtree(parts_dirs[plugin_class.name])
+
+
+def export_all_courses_as(plugin, run_id=None):
+    """
+    Save a gzipped (by default) tar file, or a ZIP file, of all course exports.
+
+    With COURSE_EXPORT_PLUGIN_INCREMENTAL enabled, courses unchanged since
+    the last run reuse their previous output.
+
+    With COURSE_EXPORT_PLUGIN_RUN_JOURNAL enabled, or a run_id given, the run
+    is journaled, and a run of the same plugin and id (the date by default)
+    interrupted earlier is resumed from its first unfinished course.  Raises
+    ExportPluginsRunInProgressError if another process is running it.
+    """
+    plugin_class = CourseExporterPluginManager.get_plugin(plugin)
+    course_keys = core.get_course_keys()
+    export_record = None
+    if app_settings.COURSE_EXPORT_PLUGIN_INCREMENTAL:
+        export_record = incremental.CourseExportRecord(plugin_class, modulestore())
+    run_journal = None
+    if app_settings.COURSE_EXPORT_PLUGIN_RUN_JOURNAL or run_id is not None:
+        run_journal = journal.ExportRunJournal(plugin, run_id)
+        run_journal.lock()
+
+    archive_format = app_settings.COURSE_EXPORT_PLUGIN_TASK_ARCHIVE_FORMAT
+    outfilename = _get_archive_filename(plugin_class, archive_format)
+
+    try:
+        if run_journal is not None and run_journal.completed:
+            run_journal.restart()
+        elif run_journal is not None and run_journal.courses:
+            logger.info('Resuming export run {} as {} after {} courses'.format(
+                run_journal.run_id, plugin, len(run_journal.courses)
+            ))
+        with utils.TemporaryDirectory() as tempdir:
+            archives = core.export_courses_multiple(
+                None, plugin_class, course_keys, tempdir, outfilename, check_author_perms=False,
+                export_record=export_record, run_journal=run_journal, archive_format=archive_format
+            )
+            storage_path = _store_archive(plugin_class, archives, archive_format)
+            if export_record is not None:
+                logger.info('Exported all courses as {}: {}'.format(plugin, export_record.report()))
+            if run_journal is not None:
+                run_journal.complete(storage_path)
+                logger.info('Completed export run {} as {}: {}'.format(
+                    run_journal.run_id, plugin, run_journal.report()
+                ))
+    finally:
+        if run_journal is not None:
+            run_journal.unlock()
+
+
+def fan_out_export_all_courses_as(plugin):
+    """
+    Export all courses in per-course subtasks, then archive and store the outputs in a final task.
+
+    Subtasks run in COURSE_EXPORT_PLUGIN_TASK_FANOUT_CONCURRENCY chains of
+    courses, so no more courses than that are exported at once.  Their outputs
+    are collected in a directory under COURSE_EXPORT_PLUGIN_TASK_FANOUT_DIR,
+    which must be shared by all workers of the queue.  Directories left there
+    by earlier exports that never finished are removed once older than
+    COURSE_EXPORT_PLUGIN_TASK_FANOUT_MAX_AGE.
     """
     plugin_class = CourseExporterPluginManager.get_plugin(plugin)
-    store = modulestore()
-    course_keys = [course.id for course in store.get_courses()]
+    course_ids = [str(course_key) for course_key in core.get_course_keys()]
+    fanout_dir = app_settings.COURSE_EXPORT_PLUGIN_TASK_FANOUT_DIR
+    if not os.path.isdir(fanout_dir):
+        os.makedirs(fanout_dir)
+    _remove_stale_parts_dirs(fanout_dir)
+    parts_dir = tempfile.mkdtemp(prefix='{}-'.format(plugin_class.name), dir=fanout_dir)
 
+    concurrency = max(app_settings.COURSE_EXPORT_PLUGIN_TASK_FANOUT_CONCURRENCY, 1)
+    lanes = [course_ids[lane::concurrency] for lane in range(concurrency)]
+    header = [
+        chain(*[export_course_part.si(plugin, course_id, parts_dir).set(queue=QUEUE) for course_id in lane])
+        for lane in lanes if lane
+    ]
+    logger.info('Exporting {} courses as {} in {} subtask chains'.format(len(course_ids), plugin, len(header)))
+    return chord(header)(assemble_course_parts.si(plugin, course_ids, parts_dir).set(queue=QUEUE))
+
+
+def _remove_stale_parts_dirs(fanout_dir):
+    """
+    Remove the output directories of fanned out exports not modified for longer than the maximum age.
+
+    The final task of a fanned out export removes its directory, so those
+    left behind belong to exports whose final task never ran.
+    """
+    max_age = app_settings.COURSE_EXPORT_PLUGIN_TASK_FANOUT_MAX_AGE
+    if not max_age:
+        return
+    cutoff = time.time() - max_age
+    for name in os.listdir(fanout_dir):
+        path = os.path.join(fanout_dir, name)
+        try:
+            stale = os.path.isdir(path) and os.path.getmtime(path) < cutoff
+        except OSError:
+            continue  # removed meanwhile
+        if stale:
+            logger.warning('Removing output directory {} of an unfinished fanned out export'.format(path))
+            shutil.rmtree(path, ignore_errors=True)
+
+
+# acknowledged once done, so a course whose worker is killed midway is redelivered rather than lost
+# with the chord waiting on it
+@shared_task(bind=True, acks_late=True, reject_on_worker_lost=True,
+             max_retries=app_settings.COURSE_EXPORT_PLUGIN_TASK_FANOUT_RETRIES,
+             default_retry_delay=app_settings.COURSE_EXPORT_PLUGIN_TASK_FANOUT_RETRY_DELAY)
+def export_course_part(self, plugin, course_id, parts_dir):
+    """
+    Export one course of a fanned out export, retrying on unexpected errors.
+
+    A course that can't be exported, still fails after the last retry, or
+    whose worker was lost more than COURSE_EXPORT_PLUGIN_TASK_FANOUT_REDELIVERIES
+    times, is left out of the archive rather than failing the chain of
+    courses it's in.
+    """
+    plugin_class = CourseExporterPluginManager.get_plugin(plugin)
+    course_key = CourseKey.from_string(course_id)
+    deliveries_path = _get_deliveries_path(plugin_class, course_key, parts_dir)
+    lost_deliveries = _count_lost_deliveries(deliveries_path)
+    if lost_deliveries > app_settings.COURSE_EXPORT_PLUGIN_TASK_FANOUT_REDELIVERIES:
+        logger.error('Giving up exporting {} as {} after its worker was lost {} times'.format(
+            course_id, plugin, lost_deliveries
+        ))
+        return None
+    try:
+        # the count outlives the delivery only if its worker is lost
+        with open(deliveries_path, 'w') as deliveries_file:
+            deliveries_file.write(str(lost_deliveries + 1))
+        try:
+            return core.export_course_part(plugin_class, course_key, parts_dir)
+        finally:
+            os.remove(deliveries_path)
+    except exceptions.ExportPluginsCourseExportError:
+        return None
+    except Exception as e:  # pylint: disable=broad-except
+        if self.request.retries >= self.max_retries:
+            logger.error('Giving up exporting {} as {}: {}'.format(course_id, plugin, e))
+            return None
+        raise self.retry(exc=e)
+
+
+def _get_deliveries_path(plugin_class, course_key, parts_dir):
+    return core._get_part_path(plugin_class, course_key, parts_dir) + '.deliveries'  # pylint: disable=protected-access
+
+
+def _count_lost_deliveries(deliveries_path):
+    """
+    Get the number of deliveries of a course subtask lost with their worker, as counted in deliveries_path.
+    """
+    try:
+        with open(deliveries_path) as deliveries_file:
+            return int(deliveries_file.read() or 0)
+    except (IOError, ValueError):
+        return 0
+
+
+@shared_task
+def assemble_course_parts(plugin, course_ids, parts_dir):
+    """
+    Archive and store the course outputs of a fanned out export once all its subtasks are done.
+    """
+    plugin_class = CourseExporterPluginManager.get_plugin(plugin)
+    archive_format = app_settings.COURSE_EXPORT_PLUGIN_TASK_ARCHIVE_FORMAT
+    outfilename = _get_archive_filename(plugin_class, archive_format)
+    course_keys = [CourseKey.from_string(course_id) for course_id in course_ids]
+    try:
+        with utils.TemporaryDirectory() as tempdir:
+            archives = core.archive_course_parts(
+                plugin_class, course_keys, parts_dir, tempdir, outfilename, archive_format=archive_format
+            )
+            _store_archive(plugin_class, archives, archive_format)
+    except Exception as e:
+        logger.exception('Could not archive the fanned out export as {}'.format(plugin))
+        _notify_error(plugin, e)
+    finally:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+
+
+def _get_archive_filename(plugin_class, archive_format):
+    zipped = archive_format == 'zip'
     if not app_settings.COURSE_EXPORT_PLUGIN_STORAGE_OVERWRITE:
-        outfilename = constants.EXPORT_FILENAME_FORMAT_MULTIPLE.format(
+        filename_format = constants.EXPORT_FILENAME_FORMAT_MULTIPLE_ZIP if zipped else \
+            constants.EXPORT_FILENAME_FORMAT_MULTIPLE
+        return filename_format.format(
             plugin_class.filename_extension,
             datetime.datetime.now().strftime('%Y-%m-%d')
         )
     else:
-        outfilename = constants.EXPORT_FILENAME_FORMAT_MULTIPLE_NO_DATE.format(
+        filename_format = constants.EXPORT_FILENAME_FORMAT_MULTIPLE_ZIP_NO_DATE if zipped else \
+            constants.EXPORT_FILENAME_FORMAT_MULTIPLE_NO_DATE
+        return filename_format.format(
             plugin_class.filename_extension
         )
 
-    with utils.TemporaryDirectory() as tempdir:
-        tarf = next(core.export_courses_multiple(
-            None, plugin_class, course_keys, tempdir, outfilename, check_author_perms=False
-        ))
 
-        if app_settings.COURSE_EXPORT_PLUGIN_STORAGE_TYPE == 's3':
-            fn = os.path.basename(tarf.name)
-            storage_path = '{}/{}'.format(plugin_class.name, fn)
-            storage.do_store_s3(tarf.name, storage_path)
+def _store_archive(plugin_class, archives, archive_format):
+    """
+    Finish the archive yielded by archives and store it, returning where it is stored.
+    """
+    archive_path = _finish_archive(archives, archive_format)
+    return _store_file(archive_path, '{}/{}'.format(plugin_class.name, os.path.basename(archive_path)))
+
+
+def _finish_archive(archives, archive_format):
+    """
+    Get the path of the archive yielded by archives, once it's finished.
+    """
+    archive = next(archives)
+    # run the generator to its end, so it leaves the with block writing the end of the archive normally
+    for __ in archives:
+        pass
+    return archive.filename if archive_format == 'zip' else archive.name
+
+
+def _store_file(local_path, storage_path):
+    """
+    Store a file with the configured storage type, returning its storage path, or None if the type isn't supported.
+    """
+    if app_settings.COURSE_EXPORT_PLUGIN_STORAGE_TYPE == 's3':
+        storage.do_store_s3(local_path, storage_path)
+    elif app_settings.COURSE_EXPORT_PLUGIN_STORAGE_TYPE == 'local':
+        storage.do_store_local(local_path, storage_path)
+    else:
         # TODO: handle other storage types
+        return None
+    return storage_path
+
+
+@shared_task
+def run_export_job(job_id):
+    """
+    Run an asynchronous export job and store its artifact for download.
+
+    A single course job stores the course's export file, others the
+    archive of the exports of the courses the job's user may export, however
+    many there are.  The job records its progress as courses are exported.
+    """
+    job = ExportJob.objects.get(id=job_id)
+    course_keys = job.course_keys
+    job.start(len(course_keys))
+    try:
+        plugin_class = CourseExporterPluginManager.get_plugin(job.plugin)
+        with utils.TemporaryDirectory() as tempdir:
+            if job.single_course:
+                artifact_path, filename = core.export_course_single(job.user, plugin_class, tempdir, course_keys[0])
+                content_type = plugin_class.http_content_type
+                job.update_progress(1, 1)
+            else:
+                filename_format = constants.EXPORT_FILENAME_FORMAT_MULTIPLE
+                if job.archive_format == 'zip':
+                    filename_format = constants.EXPORT_FILENAME_FORMAT_MULTIPLE_ZIP
+                outfilename = filename_format.format(
+                    plugin_class.filename_extension,
+                    datetime.datetime.now().strftime('%Y-%m-%d')
+                )
+                archives = core.export_courses_multiple(
+                    job.user, plugin_class, course_keys, tempdir, outfilename,
+                    archive_format=job.archive_format, progress=job.update_progress
+                )
+                artifact_path = _finish_archive(archives, job.archive_format)
+                filename = os.path.basename(artifact_path)
+                content_type = _get_archive_content_type(filename)
+            storage_path = _store_file(artifact_path, 'jobs/{}/{}'.format(job.id, filename))
+            if storage_path is None:
+                raise ImproperlyConfigured('Unsupported storage type {}'.format(
+                    app_settings.COURSE_EXPORT_PLUGIN_STORAGE_TYPE
+                ))
+    except Exception as e:  # pylint: disable=broad-except
+        logger.exception('Export job {} as {} failed'.format(job.id, job.plugin))
+        job.fail(str(e) or type(e).__name__)
+        return
+    job.succeed(storage_path, filename, content_type)
+
+
+# hourly
+@periodic_task(run_every=crontab(minute=0), queue=QUEUE, options={'queue': QUEUE})
+def clean_up_export_jobs():
+    """
+    Fail export jobs that stopped making progress, and delete expired jobs with their artifacts.
+
+    Jobs still pending or running without progress for
+    COURSE_EXPORT_PLUGIN_JOB_STALE_AFTER seconds lost their task with its
+    worker.  Finished jobs are deleted COURSE_EXPORT_PLUGIN_JOB_EXPIRES
+    seconds after their last change.
+    """
+    now = timezone.now()
+    stale_after = app_settings.COURSE_EXPORT_PLUGIN_JOB_STALE_AFTER
+    if stale_after:
+        stale_jobs = ExportJob.objects.filter(
+            status__in=(ExportJob.PENDING, ExportJob.RUNNING),
+            modified__lt=now - datetime.timedelta(seconds=stale_after),
+        )
+        for job in stale_jobs:
+            logger.warning('Failing export job {} as {}, stale since {}'.format(job.id, job.plugin, job.modified))
+            job.fail('The export made no progress for {} seconds and was abandoned'.format(stale_after))
+    expires = app_settings.COURSE_EXPORT_PLUGIN_JOB_EXPIRES
+    if expires:
+        expired_jobs = ExportJob.objects.filter(
+            status__in=(ExportJob.SUCCEEDED, ExportJob.FAILED),
+            modified__lt=now - datetime.timedelta(seconds=expires),
+        )
+        for job in expired_jobs:
+            if job.storage_path:
+                _delete_file(job.storage_path)
+            job.delete()
+
+
+def _delete_file(storage_path):
+    """
+    Delete a file stored with the configured storage type.
+    """
+    if app_settings.COURSE_EXPORT_PLUGIN_STORAGE_TYPE == 's3':
+        storage.do_delete_s3(storage_path)
+    elif app_settings.COURSE_EXPORT_PLUGIN_STORAGE_TYPE == 'local':
+        storage.do_delete_local(storage_path)
+
+
+def _get_archive_content_type(filename):
+    if filename.endswith('.zip'):
+        return 'application/zip'
+    extension = filename.rpartition('.')[2]
+    for compressor_class in compression.STREAM_COMPRESSORS.values():
+        if compressor_class.filename_extension == extension:
+            return compressor_class.content_type
+    return 'application/tar'
@@ -10,6 +10,10 @@ from openedx_export_plugins import views
 
 
 urlpatterns = [
+    url(r'^export/jobs/(?P<job_id>[0-9a-f-]+)$',
+        views.export_job_status_handler, name='export_job_status_handler'),
+    url(r'^export/jobs/(?P<job_id>[0-9a-f-]+)/download$',
+        views.export_job_download_handler, name='export_job_download_handler'),
     url(r'^export/{}/(?P<plugin_name>.*)$'.format(settings.COURSE_KEY_PATTERN),
         views.plugin_export_handler, name='plugin_export_handler'),
     url(r'^export/all/(?P<plugin_name>.*)$',
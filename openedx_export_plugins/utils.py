@@ -3,14 +3,37 @@ Utility classes and functions for openedx_export_plugins Django app.
 """
 
 import contextlib
+import logging
+import os
 import shutil
 import tempfile
 
+from . import app_settings
+
+
+logger = logging.getLogger(__name__)
+
+
+def mkdtemp():
+    """
+    Create a scratch directory for export intermediates.
+
+    With COURSE_EXPORT_PLUGIN_MEMORY_FS enabled the directory is created on
+    the RAM-backed filesystem at COURSE_EXPORT_PLUGIN_MEMORY_FS_ROOT, so the
+    OLX export and the reads made during the transform never touch disk.
+    """
+    if app_settings.COURSE_EXPORT_PLUGIN_MEMORY_FS:
+        memory_root = app_settings.COURSE_EXPORT_PLUGIN_MEMORY_FS_ROOT
+        if os.path.isdir(memory_root):
+            return tempfile.mkdtemp(dir=memory_root)
+        logger.warning("In-memory export filesystem {} not available, using disk".format(memory_root))
+    return tempfile.mkdtemp()
+
 
 # replicate Python 3.2+'s tempfile.TemporaryDirectory for now
 @contextlib.contextmanager
 def TemporaryDirectory(delete=True):
-    temp_dir = tempfile.mkdtemp()
+    temp_dir = mkdtemp()
     try:
         yield temp_dir
     finally:
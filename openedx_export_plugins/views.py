@@ -5,24 +5,36 @@ Views for export plugins.
 import datetime
 import logging
 import os
-from tempfile import mkdtemp
+import shutil
 
 from django.contrib.auth.decorators import login_required
+from django.core.exceptions import PermissionDenied, ValidationError
+from django.db import transaction
 try:
     # removed in Django 1.9
     from django.core.servers.basehttp import FileWrapper
 except ImportError:
     from wsgiref.util import FileWrapper
-from django.http import HttpResponse, HttpResponseServerError, Http404, StreamingHttpResponse
+from django.http import (
+    FileResponse, HttpResponse, HttpResponseBadRequest, HttpResponseRedirect, HttpResponseServerError, Http404,
+    JsonResponse, StreamingHttpResponse
+)
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.cache import patch_vary_headers
+from django.utils.dateparse import parse_date, parse_datetime
 from django.views.decorators.csrf import ensure_csrf_cookie
 from django.views.decorators.http import require_http_methods
 
 from util.views import ensure_valid_course_key
 from opaque_keys.edx.keys import CourseKey
 from openedx.core.lib import plugins
+from student.auth import has_course_author_access
+from student.roles import GlobalStaff
 from xmodule.modulestore.django import modulestore
 
-from . import constants, core
+from . import app_settings, compression, constants, core, storage, tasks, utils
+from .models import ExportJob
 from .plugins import CourseExporterPluginManager
 
 
@@ -31,13 +43,27 @@ logger = logging.getLogger(__name__)
 
 @ensure_csrf_cookie
 @login_required
-@require_http_methods(("GET",))
+@require_http_methods(("GET", "POST"))
 @ensure_valid_course_key
 def plugin_export_handler(request, plugin_name, course_key_string=None):
     """
     The restful handler for exporting a course, or all courses, with an exporter plugin.
-    Passing no course key string will export all courses to which the user has access
+    Passing no course key string will export all courses to which the user has access,
+    limited to those of the ``org`` query parameters and modified since the date or
+    datetime of the ``modified_since`` query parameter if given.
+
+    The tarball of all courses is compressed on the fly with the codec named by the
+    ``compression`` query parameter, served as a .tar.gz or .tar.zst file, or failing
+    that with a codec the client accepts as content encoding.  ``compression=none``
+    turns compression off.  With ``archive=zip`` a ZIP file with individually
+    compressed courses is streamed instead.
+
+    A POST enqueues the export as an asynchronous job instead, taking the same
+    parameters, and responds with the job's status (see export_job_status_handler).
+    The job stores a tar file, compressed as COURSE_EXPORT_PLUGIN_ARCHIVE_COMPRESSION
+    configures, or with ``archive=zip`` a ZIP file of all courses.
     """
+    params = request.POST if request.method == 'POST' else request.GET
     store = modulestore()
     try:
         plugin_class = CourseExporterPluginManager.get_plugin(plugin_name)
@@ -51,15 +77,24 @@ def plugin_export_handler(request, plugin_name, course_key_string=None):
         if courselike_module is None:
             raise Http404  # this should only ever happen if a course_key_string is passed
     else:
-        courses = store.get_courses()
-        course_keys = [course.id for course in courses]
+        modified_since = None
+        if params.get('modified_since'):
+            modified_since = _parse_modified_since(params['modified_since'])
+            if modified_since is None:
+                return HttpResponseBadRequest('Unparsable modified_since {}'.format(params['modified_since']))
+        course_keys = core.get_course_keys(orgs=params.getlist('org'), modified_since=modified_since)
+
+    if request.method == 'POST':
+        return _enqueue_export_job(
+            request, plugin_name, course_keys, params.get('archive', 'tar'), single_course=bool(course_key_string)
+        )
 
     # Don't use a contextmanager or delete the tempdir here.
     # StreamingHTTPResponse will require tempdir to exist beyond this function's
     # termination, as the streamed content is generated
-    tempdir = mkdtemp()
+    tempdir = utils.mkdtemp()
 
-    if len(course_keys) == 1:
+    if course_key_string:
         (outfilepath, outfn) = core.export_course_single(request.user, plugin_class, tempdir, course_keys[0])
         with open(outfilepath) as outfile:
             wrapper = FileWrapper(outfile)
@@ -70,13 +105,176 @@ def plugin_export_handler(request, plugin_name, course_key_string=None):
     else:
         # if exporting all files, stream the response back to avoid proxy timeout at front-end webserver
         # return a tarball of all export files in the response
-        outfilename = constants.EXPORT_FILENAME_FORMAT_MULTIPLE.format(
+        archive_format = request.GET.get('archive', 'tar')
+        if archive_format not in ('tar', 'zip'):
+            shutil.rmtree(tempdir)
+            return HttpResponseBadRequest('Unsupported archive {}'.format(archive_format))
+        filename_format = constants.EXPORT_FILENAME_FORMAT_MULTIPLE
+        if archive_format == 'zip':
+            filename_format = constants.EXPORT_FILENAME_FORMAT_MULTIPLE_ZIP
+        outfilename = filename_format.format(
             plugin_class.filename_extension,
             datetime.datetime.now().strftime('%Y-%m-%d')
         )
+        content_type = 'application/tar'
+        content_encoding = None
+        compression_name = request.GET.get('compression')
+        if archive_format == 'zip':
+            # ZIP members are compressed already
+            content_type = 'application/zip'
+            compressor = None
+        elif compression_name:
+            compressor = None
+            if compression_name != 'none':
+                if compression_name in compression.available_streamed_compressions():
+                    compressor = compression.get_stream_compressor(compression_name)
+                if compressor is None:
+                    shutil.rmtree(tempdir)
+                    return HttpResponseBadRequest('Unsupported compression {}'.format(compression_name))
+                content_type = compressor.content_type
+        else:
+            compressor = _get_accepted_stream_compressor(request)
+            if compressor is not None:
+                content_encoding = compressor.name
         response = StreamingHttpResponse(
-            core.export_courses_multiple(request.user, plugin_class, course_keys, tempdir, outfilename, stream=True),
-            content_type='application/tar'
+            core.export_courses_multiple(
+                request.user, plugin_class, course_keys, tempdir, outfilename, stream=True, compressor=compressor,
+                archive_format=archive_format
+            ),
+            content_type=content_type
         )
+        if content_encoding is not None:
+            response['Content-Encoding'] = content_encoding
+        elif compressor is not None:
+            outfilename += '.{}'.format(compressor.filename_extension)
+        patch_vary_headers(response, ('Accept-Encoding',))
         response['Content-Disposition'] = 'attachment; filename={}'.format(outfilename)
         return response
+
+
+def _parse_modified_since(value):
+    """
+    Parse an ISO 8601 date or datetime to an aware datetime, or return None if it can't be parsed.
+    """
+    try:
+        parsed = parse_datetime(value)
+        if parsed is None:
+            parsed_date = parse_date(value)
+            if parsed_date is None:
+                return None
+            parsed = datetime.datetime.combine(parsed_date, datetime.time())
+    except ValueError:
+        return None
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, timezone.utc)
+    return parsed
+
+
+def _get_accepted_stream_compressor(request):
+    """
+    Get a compressor for the preferred compression the request's Accept-Encoding allows, or None.
+    """
+    accepted = set()
+    for coding in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        name, __, params = coding.strip().partition(';')
+        try:
+            quality = float(params.strip()[2:]) if params.strip().startswith('q=') else 1.0
+        except ValueError:
+            quality = 0.0
+        if quality > 0:
+            accepted.add(name.strip().lower())
+    for name in compression.available_streamed_compressions():
+        if name in accepted:
+            return compression.get_stream_compressor(name)
+    return None
+
+
+@login_required
+@require_http_methods(("GET",))
+def export_job_status_handler(request, job_id):
+    """
+    Report the status of an asynchronous export job and its progress as courses exported out of the total.
+
+    Once the job has succeeded the status includes the URL to download its
+    artifact from, and if it failed, the error.
+    """
+    return JsonResponse(_get_job_status(request, _get_user_job(request, job_id)))
+
+
+@login_required
+@require_http_methods(("GET",))
+def export_job_download_handler(request, job_id):
+    """
+    Download the artifact of a finished asynchronous export job from storage.
+
+    Artifacts in S3 are downloaded from a signed URL the request is
+    redirected to, valid for COURSE_EXPORT_PLUGIN_JOB_DOWNLOAD_URL_EXPIRES seconds.
+    """
+    job = _get_user_job(request, job_id)
+    if job.status != ExportJob.SUCCEEDED:
+        return JsonResponse(_get_job_status(request, job), status=409)
+    if app_settings.COURSE_EXPORT_PLUGIN_STORAGE_TYPE == 's3':
+        return HttpResponseRedirect(storage.get_s3_url(
+            job.storage_path, job.filename, app_settings.COURSE_EXPORT_PLUGIN_JOB_DOWNLOAD_URL_EXPIRES
+        ))
+    try:
+        artifact = open(storage.get_local_path(job.storage_path), 'rb')
+    except IOError:
+        raise Http404
+    return FileResponse(artifact, as_attachment=True, filename=job.filename, content_type=job.content_type)
+
+
+def _enqueue_export_job(request, plugin_name, course_keys, archive_format, single_course):
+    """
+    Create an export job, run it on the export queue once created, and respond with its status.
+    """
+    if archive_format not in ('tar', 'zip'):
+        return HttpResponseBadRequest('Unsupported archive {}'.format(archive_format))
+    if single_course and not has_course_author_access(request.user, course_keys[0]):
+        raise PermissionDenied()
+    job = ExportJob(
+        user=request.user, plugin=plugin_name, archive_format=archive_format, single_course=single_course
+    )
+    job.course_keys = course_keys
+    job.save()
+    transaction.on_commit(lambda: tasks.run_export_job.apply_async((str(job.id),), queue=tasks.QUEUE))
+    response = JsonResponse(_get_job_status(request, job), status=202)
+    response['Location'] = _get_job_url(request, 'export_job_status_handler', job)
+    return response
+
+
+def _get_user_job(request, job_id):
+    """
+    Get the export job of the requesting user, or any job for global staff, raising Http404 if there's none.
+    """
+    try:
+        job = ExportJob.objects.get(id=job_id)
+    except (ExportJob.DoesNotExist, ValidationError):
+        raise Http404
+    if job.user_id != request.user.id and not GlobalStaff().has_user(request.user):
+        raise Http404
+    return job
+
+
+def _get_job_status(request, job):
+    status = {
+        'id': str(job.id),
+        'plugin': job.plugin,
+        'status': job.status,
+        'courses_done': job.courses_done,
+        'courses_total': job.courses_total,
+        'created': job.created.isoformat(),
+        'modified': job.modified.isoformat(),
+    }
+    if job.status == ExportJob.SUCCEEDED:
+        status['download_url'] = _get_job_url(request, 'export_job_download_handler', job)
+    elif job.status == ExportJob.FAILED:
+        status['error'] = job.error
+    return status
+
+
+def _get_job_url(request, view_name, job):
+    namespace = request.resolver_match.namespace if request.resolver_match else ''
+    if namespace:
+        view_name = '{}:{}'.format(namespace, view_name)
+    return request.build_absolute_uri(reverse(view_name, kwargs={'job_id': str(job.id)}))
@@ -92,7 +92,8 @@ setup(
     ],
     entry_points={
         'openedx.exporters.course': [
-            'markdown = openedx_export_plugins.exporters.markdown:MarkdownCourseExportManager'
+            'markdown = openedx_export_plugins.exporters.markdown:MarkdownCourseExportManager',
+            'markdown-direct = openedx_export_plugins.exporters.markdown_direct:DirectMarkdownCourseExporter',
         ],
         "cms.djangoapp": [
             "openedx_export_plugins = openedx_export_plugins.apps:OpenedxExportPluginsConfig",
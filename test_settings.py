@@ -29,7 +29,14 @@ DATABASES = {
 INSTALLED_APPS = (
     'django.contrib.auth',
     'django.contrib.contenttypes',
+    'django.contrib.sessions',
     'openedx_export_plugins',
+    'test_utils',
+)
+
+MIDDLEWARE = (
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
 )
 
 LOCALE_PATHS = [
@@ -39,3 +46,12 @@ LOCALE_PATHS = [
 ROOT_URLCONF = 'openedx_export_plugins.urls'
 
 SECRET_KEY = 'insecure-secret-key'
+
+USE_TZ = True
+
+# edx-platform settings the app settings are read from
+ENV_TOKENS = {}
+AUTH_TOKENS = {}
+HTTPS = 'off'
+DEFAULT_PRIORITY_QUEUE = 'default'
+COURSE_KEY_PATTERN = r'(?P<course_key_string>[^/+]+(/|\+)[^/+]+(/|\+)[^/?]+)'
@@ -0,0 +1,33 @@
+"""
+Stand-ins for edx-platform models the app queries, so its queries can be tested without edx-platform's apps.
+"""
+
+from django.conf import settings
+from django.db import models
+
+from opaque_keys.edx.django.models import CourseKeyField
+
+
+class CourseAccessRole(models.Model):
+    """
+    Stand-in for student.models.CourseAccessRole, with the fields the export permission checks read.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    org = models.CharField(max_length=64, db_index=True, blank=True)
+    course_id = CourseKeyField(max_length=255, db_index=True, blank=True)
+    role = models.CharField(max_length=64, db_index=True)
+
+    class Meta(object):
+        app_label = 'test_utils'
+
+
+class CourseOverview(models.Model):
+    """
+    Stand-in for course_overviews.models.CourseOverview, with the fields courses to export are listed by.
+    """
+    id = CourseKeyField(db_index=True, primary_key=True, max_length=255)
+    org = models.TextField(max_length=255, default='outdated_entry')
+    modified = models.DateTimeField()
+
+    class Meta(object):
+        app_label = 'test_utils'
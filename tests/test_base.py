@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for the `openedx-export-plugins` exporters base module.
+"""
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from fs.osfs import OSFS
+from lxml import etree
+
+from openedx_export_plugins.exporters import base
+
+
+def _fake_plugin_class(name, fails=False):
+    """
+    Get a plugin class writing its name as output, or raising if it fails.
+    """
+    def post_process(root, export_fs):
+        if fails:
+            raise ValueError('bad course')
+        export_fs.writetext('output.{}'.format(name), name)
+
+    exporter = mock.Mock(filename_extension=name, post_process=post_process)
+    exporter.name = name
+    return mock.Mock(return_value=exporter)
+
+
+class SharedOLXCourseExportManagerTest(TestCase):
+    """
+    Test post-processing a shared OLX export with several plugins.
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.export_fs = OSFS(self.tempdir)
+        self.addCleanup(self.export_fs.close)
+
+    def test_failing_plugin_skipped(self):
+        plugin_classes = [_fake_plugin_class('md'), _fake_plugin_class('html', fails=True), _fake_plugin_class('txt')]
+        output_paths = {name: os.path.join(self.tempdir, 'part.' + name) for name in ('md', 'html', 'txt')}
+        exporter = base.SharedOLXCourseExportManager(
+            None, None, 'course-v1:Org+Course+Run', self.tempdir, 'course', plugin_classes, output_paths
+        )
+        exporter.post_process(etree.Element('course'), self.export_fs)
+
+        self.assertTrue(os.path.exists(output_paths['md']))
+        self.assertFalse(os.path.exists(output_paths['html']))
+        self.assertTrue(os.path.exists(output_paths['txt']))
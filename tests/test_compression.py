@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for the `openedx-export-plugins` compression module.
+"""
+
+import gzip
+import lzma
+import os
+import zlib
+from unittest import TestCase, mock
+
+from openedx_export_plugins import compression
+
+
+class StreamedCompressionsTest(TestCase):
+    """
+    Test the compressions offered for streamed responses.
+    """
+
+    def test_xz_not_streamed(self):
+        self.assertIn('xz', compression.available_stream_compressions())
+        self.assertNotIn('xz', compression.available_streamed_compressions())
+        self.assertIn('gzip', compression.available_streamed_compressions())
+
+    def test_streamed_compressions_flush(self):
+        for name in compression.available_streamed_compressions():
+            with self.subTest(compression=name):
+                compressor = compression.get_stream_compressor(name)
+                compressed = compressor.compress(b'course' * 1000) + compressor.flush()
+                self.assertTrue(compressed)
+                if name == 'gzip':
+                    self.assertEqual(zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(compressed), b'course' * 1000)
+
+
+# compressible and incompressible runs, so blocks refer back to the ones before them
+SAMPLE = b''.join(b'course %d ' % (n % 500) * 20 + os.urandom(200) for n in range(2000))
+
+
+@mock.patch.object(compression.ParallelGzipStreamCompressor, 'block_size', 64 * 1024)
+@mock.patch.object(compression.ParallelXzStreamCompressor, 'block_size', 64 * 1024)
+class ParallelCompressionTest(TestCase):
+    """
+    Test the block-parallel gzip and xz compressors.
+    """
+    decompress = {
+        'gzip': gzip.decompress,
+        'xz': lzma.decompress,
+    }
+
+    def _round_trip(self, name, data, piece_size=10000, flush_every=None):
+        compressor = compression.get_stream_compressor(name, threads=3)
+        self.assertIsInstance(compressor, compression.PARALLEL_STREAM_COMPRESSORS[name])
+        compressed = []
+        for n, start in enumerate(range(0, len(data), piece_size)):
+            compressed.append(compressor.compress(data[start:start + piece_size]))
+            if flush_every and n % flush_every == 0:
+                compressed.append(compressor.flush())
+        compressed.append(compressor.finish())
+        return self.decompress[name](b''.join(compressed))
+
+    def test_multiple_blocks(self):
+        self.assertGreater(len(SAMPLE), 5 * 64 * 1024)
+        for name in ('gzip', 'xz'):
+            with self.subTest(compression=name):
+                self.assertEqual(self._round_trip(name, SAMPLE), SAMPLE)
+
+    def test_flushed_midway(self):
+        for name in ('gzip', 'xz'):
+            with self.subTest(compression=name):
+                self.assertEqual(self._round_trip(name, SAMPLE, flush_every=7), SAMPLE)
+
+    def test_gzip_flush_makes_data_decompressible(self):
+        compressor = compression.get_stream_compressor('gzip', threads=3)
+        compressed = compressor.compress(SAMPLE[:100000]) + compressor.flush()
+        self.assertEqual(zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(compressed), SAMPLE[:100000])
+        compressor.close()
+
+    def test_empty_input(self):
+        for name in ('gzip', 'xz'):
+            with self.subTest(compression=name):
+                self.assertEqual(self._round_trip(name, b''), b'')
+
+    def test_close_shuts_pool_down(self):
+        for name in ('gzip', 'xz'):
+            with self.subTest(compression=name):
+                compressor = compression.get_stream_compressor(name, threads=3)
+                compressor.compress(SAMPLE)
+                compressor.close()
+                self.assertFalse(compressor._in_flight)
+                with self.assertRaises(RuntimeError):
+                    compressor._executor.submit(abs, -1)
@@ -0,0 +1,478 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for the `openedx-export-plugins` core module.
+"""
+
+import datetime
+import gzip
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent import futures
+from unittest import TestCase, mock, skipUnless
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase as DjangoTestCase
+from django.utils import timezone
+
+from lxml import etree
+from opaque_keys.edx.django.models import CourseKeyField
+from opaque_keys.edx.keys import CourseKey
+from opaque_keys.edx.locator import CourseLocator
+
+from openedx_export_plugins import app_settings, compression, core, exceptions
+from openedx_export_plugins.exporters import xslt
+from test_utils.models import CourseAccessRole, CourseOverview
+
+
+class CourseTarBytesTest(TestCase):
+    """
+    Test streaming course export files into tar files.
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.out_tar = tarfile.open(os.path.join(self.tempdir, 'courses.tar'), 'w:')
+        self.addCleanup(self.out_tar.close)
+
+    def _write_output(self, size):
+        path = os.path.join(self.tempdir, 'output.md')
+        with open(path, 'wb') as f:
+            for __ in range(size // core.TAR_STREAM_CHUNK_SIZE):
+                f.write(os.urandom(core.TAR_STREAM_CHUNK_SIZE))
+            f.write(os.urandom(size % core.TAR_STREAM_CHUNK_SIZE))
+        return path
+
+    def test_streamed_members_are_readable(self):
+        path = self._write_output(3 * core.TAR_STREAM_CHUNK_SIZE + 100)
+        tar_bytes = b''.join(core._course_tar_bytes(self.out_tar, path, 'course.md'))
+        tar_bytes += core._get_tar_end_padding_bytes()
+
+        with tarfile.open(fileobj=io.BytesIO(tar_bytes)) as in_tar:
+            self.assertEqual(in_tar.getnames(), ['course.md'])
+            with open(path, 'rb') as f:
+                self.assertEqual(in_tar.extractfile('course.md').read(), f.read())
+
+    def test_peak_memory_follows_chunk_size(self):
+        size = 8 * 1024 * 1024 + 100
+        path = self._write_output(size)
+
+        chunk_sizes = []
+        tracemalloc.start()
+        try:
+            for tar_bytes in core._course_tar_bytes(self.out_tar, path, 'course.md'):
+                chunk_sizes.append(len(tar_bytes))
+            __, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        header_size = chunk_sizes[0]
+        self.assertEqual(sum(chunk_sizes) - header_size, size + len(core._get_tar_record_padding_bytes(size)))
+        # a chunk being read and the one handed out, not the whole file
+        self.assertLess(peak, 3 * core.TAR_STREAM_CHUNK_SIZE)
+
+
+class FakePlugin(object):
+    name = 'fake'
+    filename_extension = 'md'
+
+
+def _fake_course_export(plugin_class, tempdir, course_key):
+    """
+    Write an output for the course, finishing later courses first, or fail for courses of the 'Broken' org.
+    """
+    if course_key.org == 'Broken':
+        raise exceptions.ExportPluginsCourseExportError('bad course')
+    course_number = int(course_key.course.replace('Course', ''))
+    time.sleep(0.01 * (8 - course_number))
+    output_filepath = os.path.join(tempdir, core._get_target_dir(course_key), 'output.md')
+    os.makedirs(os.path.dirname(output_filepath))
+    with open(output_filepath, 'w') as f:
+        f.write('# {}\n'.format(course_key) * (1000 * course_number))
+    os.utime(output_filepath, (0, 0))  # tar headers of separate exports don't differ
+    return output_filepath, core._get_output_filename(course_key, FakePlugin.filename_extension)
+
+
+@mock.patch.object(core, '_do_course_export', _fake_course_export)
+@mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_ARCHIVE_COMPRESSION', 'none')
+@mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_EXPORT_ORDER', 'course')
+class ExportCoursesMultipleTest(TestCase):
+    """
+    Test archiving the outputs of multi-course exports.
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.course_keys = [CourseKey.from_string('course-v1:Org+Course{}+Run'.format(n)) for n in range(1, 8)]
+        self.course_keys.insert(3, CourseKey.from_string('course-v1:Broken+Course4+Run'))
+
+    def _stored_tar_members(self, workers=1, pool='process', **kwargs):
+        tempdir = tempfile.mkdtemp(dir=self.tempdir)
+        with mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_EXPORT_WORKERS', workers), \
+                mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_EXPORT_POOL', pool):
+            for __ in core.export_courses_multiple(
+                None, FakePlugin, self.course_keys, tempdir, 'courses.tar', check_author_perms=False, **kwargs
+            ):
+                pass
+        with tarfile.open(os.path.join(tempdir, 'courses.tar')) as in_tar:
+            return [(member.name, in_tar.extractfile(member).read()) for member in in_tar.getmembers()]
+
+    def _kept_outputs(self, course_numbers):
+        """
+        Get the kept output, as (path, name), of each course of the given numbers.
+        """
+        kept_dir = tempfile.mkdtemp(dir=self.tempdir)
+        kept_outputs = {}
+        for course_key in self.course_keys:
+            if course_key.org != 'Broken' and int(course_key.course.replace('Course', '')) in course_numbers:
+                with tempfile.TemporaryDirectory() as export_dir:
+                    output_filepath, out_fn = _fake_course_export(FakePlugin, export_dir, course_key)
+                    kept_outputs[course_key] = shutil.move(output_filepath, os.path.join(kept_dir, out_fn)), out_fn
+        return kept_outputs
+
+    def _streamed_tar(self, compressor=None):
+        tempdir = tempfile.mkdtemp(dir=self.tempdir)
+        return b''.join(core.export_courses_multiple(
+            None, FakePlugin, self.course_keys, tempdir, 'courses.tar', stream=True, check_author_perms=False,
+            compressor=compressor
+        ))
+
+    def test_concurrent_matches_serial(self):
+        serial = self._stored_tar_members()
+        self.assertEqual(
+            [name for name, __ in serial],
+            [core._get_output_filename(key, 'md') for key in self.course_keys if key.org != 'Broken']
+        )
+        self.assertEqual(self._stored_tar_members(workers=3, pool='thread'), serial)
+        self.assertEqual(self._stored_tar_members(workers=3, pool='process'), serial)
+
+    def test_reused_outputs_in_course_order(self):
+        serial = self._stored_tar_members()
+        kept_outputs = self._kept_outputs({2, 6})
+        exported = [key for key in self.course_keys if key.org != 'Broken' and key not in kept_outputs]
+        for workers in (1, 3):
+            with self.subTest(workers=workers):
+                export_record = mock.Mock(reusable_output=lambda key: kept_outputs.get(key, (None,))[0])
+                self.assertEqual(self._stored_tar_members(workers, export_record=export_record), serial)
+                self.assertEqual([call[0][0] for call in export_record.record.call_args_list], exported)
+                export_record.save.assert_called_once_with()
+
+                run_journal = mock.Mock(finished_output=kept_outputs.get)
+                self.assertEqual(self._stored_tar_members(workers, run_journal=run_journal), serial)
+                self.assertEqual([call[0][0] for call in run_journal.record.call_args_list], exported)
+
+    def test_compressed_stream_decompresses_to_plain(self):
+        plain = self._streamed_tar()
+        with tarfile.open(fileobj=io.BytesIO(plain)) as in_tar:
+            self.assertEqual(len(in_tar.getmembers()), 7)
+        for name in compression.available_streamed_compressions():
+            with self.subTest(compression=name):
+                compressed = self._streamed_tar(compression.get_stream_compressor(name))
+                self.assertEqual(_decompress(name, compressed), plain)
+
+
+def _decompress(name, data):
+    if name == 'gzip':
+        return gzip.decompress(data)
+    return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+
+class TarCoursesTest(TestCase):
+    """
+    Test building tar files of course outputs.
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir, ignore_errors=True)
+        self.output_path = os.path.join(self.tempdir, 'output.md')
+        with open(self.output_path, 'w') as f:
+            f.write('# Course\n')
+        # the second course's output is gone
+        self.course_outputs = [(self.output_path, 'one.md'), (os.path.join(self.tempdir, 'missing.md'), 'two.md')]
+
+    def _assert_closed(self, compressor):
+        with self.assertRaises(RuntimeError):
+            compressor._executor.submit(abs, -1)
+
+    def test_stored_compressor_closed_on_error(self):
+        compressor = compression.get_stream_compressor('gzip', threads=2)
+        with mock.patch.object(core, '_get_archive_compressor', return_value=compressor):
+            with self.assertRaises(OSError):
+                list(core._tar_courses(iter(self.course_outputs), self.tempdir, 'courses.tar', False, None))
+        self._assert_closed(compressor)
+
+    def test_streamed_compressor_closed_on_error(self):
+        compressor = compression.get_stream_compressor('gzip', threads=2)
+        with self.assertRaises(OSError):
+            list(core._tar_courses(iter(self.course_outputs), self.tempdir, 'courses.tar', True, compressor))
+        self._assert_closed(compressor)
+
+    def test_stored_parallel_gzip(self):
+        compressor = compression.get_stream_compressor('gzip', threads=2)
+        with mock.patch.object(core, '_get_archive_compressor', return_value=compressor):
+            archives = core._tar_courses(iter(self.course_outputs[:1]), self.tempdir, 'courses.tar', False, None)
+            for __ in archives:
+                pass
+        with tarfile.open(os.path.join(self.tempdir, 'courses.tar.gz')) as in_tar:
+            self.assertEqual(in_tar.extractfile('one.md').read(), b'# Course\n')
+        self._assert_closed(compressor)
+
+
+class ScratchSpaceTest(TestCase):
+    """
+    Test bounding the scratch space of multi-course exports.
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.course_keys = [CourseKey.from_string('course-v1:Org+Course{}+Run'.format(n)) for n in range(8)]
+
+    def _max_concurrent_exports(self, over_budget):
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def export(plugin_class, tempdir, course_key):
+            with lock:
+                running.append(course_key)
+                peak.append(len(running))
+            time.sleep(0.05)
+            with lock:
+                running.remove(course_key)
+            return 'output.md', 'course.md'
+
+        with mock.patch.object(core, '_do_course_export', export), \
+                mock.patch.object(core, '_over_disk_budget', return_value=over_budget), \
+                mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_EXPORT_POOL', 'thread'), \
+                mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_SCRATCH_DISK_BUDGET', 1):
+            results = list(core._export_courses_concurrently(FakePlugin, self.tempdir, self.course_keys, 4))
+        self.assertEqual([course_key for course_key, __, __ in results], self.course_keys)
+        return max(peak)
+
+    def test_budget_throttles_submissions(self):
+        self.assertGreater(self._max_concurrent_exports(over_budget=False), 1)
+        # a new export only starts once the running ones are done
+        self.assertEqual(self._max_concurrent_exports(over_budget=True), 1)
+
+    def test_over_disk_budget(self):
+        os.makedirs(os.path.join(self.tempdir, 'course', 'static'))
+        with open(os.path.join(self.tempdir, 'course', 'static', 'image.png'), 'wb') as f:
+            f.write(b'x' * 1000)
+        with open(os.path.join(self.tempdir, 'courses.tar'), 'wb') as f:
+            f.write(b'x' * 5000)  # the archive being built isn't scratch space
+        self.assertTrue(core._over_disk_budget(self.tempdir, 999))
+        self.assertFalse(core._over_disk_budget(self.tempdir, 1000))
+        self.assertFalse(core._over_disk_budget(self.tempdir, 0))
+
+    def test_remove_intermediates(self):
+        export_dir = os.path.join(self.tempdir, 'course')
+        os.makedirs(os.path.join(export_dir, 'course', 'chapter'))
+        for path in ('output.md', 'course.xml', os.path.join('course', 'chapter', 'intro.xml')):
+            with open(os.path.join(export_dir, path), 'w') as f:
+                f.write('<chapter/>')
+        os.symlink(os.path.join(export_dir, 'course'), os.path.join(export_dir, 'link'))
+        core._remove_intermediates(export_dir, os.path.join(export_dir, 'output.md'))
+        self.assertEqual(os.listdir(export_dir), ['output.md'])
+
+
+class CCXLocator(CourseLocator):
+    """
+    Key of a CCX course, as in the ccx_keys package of edx-platform.
+    """
+    CANONICAL_NAMESPACE = 'ccx-v1'
+
+
+@mock.patch.object(core, 'CourseOverview', CourseOverview)
+class GetCourseKeysTest(DjangoTestCase):
+    """
+    Test listing the courses to export from course overviews.
+    """
+
+    def setUp(self):
+        self.course_keys = []
+        for n, (org, day) in enumerate((('OrgA', 1), ('OrgB', 2), ('OrgA', 3), ('OrgC', 4))):
+            course_key = CourseKey.from_string('course-v1:{}+Course{}+Run'.format(org, n))
+            CourseOverview.objects.create(
+                id=course_key, org=org, modified=datetime.datetime(2021, 8, day, tzinfo=timezone.utc)
+            )
+            self.course_keys.append(course_key)
+        # a CCX course, whose key can't even be parsed without edx-platform's ccx_keys
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO test_utils_courseoverview (id, org, modified) VALUES (%s, %s, %s)',
+                ['ccx-v1:OrgA+Course0+Run+ccx@1', 'OrgA', '2021-08-05 00:00:00']
+            )
+
+    def test_all_courses(self):
+        self.assertEqual(core.get_course_keys(), sorted(self.course_keys, key=str))
+
+    def test_orgs(self):
+        self.assertEqual(
+            core.get_course_keys(orgs=['OrgA', 'OrgC']),
+            sorted((self.course_keys[0], self.course_keys[2], self.course_keys[3]), key=str)
+        )
+
+    def test_modified_since(self):
+        modified_since = datetime.datetime(2021, 8, 2, tzinfo=timezone.utc)
+        self.assertEqual(core.get_course_keys(modified_since=modified_since), sorted(self.course_keys[1:], key=str))
+        self.assertEqual(core.get_course_keys(orgs=['OrgA'], modified_since=modified_since), [self.course_keys[2]])
+
+
+@mock.patch.object(core, 'CourseAccessRole', CourseAccessRole)
+class AuthorCourseKeysTest(DjangoTestCase):
+    """
+    Test resolving the courses a user may export in bulk.
+    """
+
+    def setUp(self):
+        self.course_keys = [
+            CourseKey.from_string('course-v1:{}+Course{}+Run'.format(org, n))
+            for org in ('OrgA', 'OrgB', 'OrgC') for n in range(4)
+        ]
+        self.user = User.objects.create_user('author')
+
+    def _add_role(self, role, org='', course_key=CourseKeyField.Empty):
+        CourseAccessRole.objects.create(user=self.user, role=role, org=org, course_id=course_key)
+
+    def test_global_staff(self):
+        self.user.is_staff = True
+        with self.assertNumQueries(0):
+            self.assertEqual(core._get_author_course_keys(self.user, self.course_keys), set(self.course_keys))
+
+    def test_org_role(self):
+        self._add_role(core.CourseInstructorRole.ROLE, org='OrgB')
+        with self.assertNumQueries(1):
+            author_course_keys = core._get_author_course_keys(self.user, self.course_keys)
+        self.assertEqual(author_course_keys, {key for key in self.course_keys if key.org == 'OrgB'})
+
+    def test_course_role(self):
+        self._add_role(core.CourseStaffRole.ROLE, org='OrgA', course_key=self.course_keys[1])
+        with self.assertNumQueries(1):
+            author_course_keys = core._get_author_course_keys(self.user, self.course_keys)
+        self.assertEqual(author_course_keys, {self.course_keys[1]})
+
+    def test_one_query_for_all_courses(self):
+        self._add_role(core.CourseStaffRole.ROLE, org='OrgA', course_key=self.course_keys[0])
+        self._add_role(core.CourseInstructorRole.ROLE, org='OrgA', course_key=self.course_keys[2])
+        self._add_role(core.CourseStaffRole.ROLE, org='OrgC')
+        self._add_role('beta_testers', org='OrgB')
+        with self.assertNumQueries(1):
+            author_course_keys = core._get_author_course_keys(self.user, self.course_keys)
+        self.assertEqual(
+            author_course_keys,
+            {self.course_keys[0], self.course_keys[2]} | {key for key in self.course_keys if key.org == 'OrgC'}
+        )
+
+    def test_ccx_courses_excluded(self):
+        ccx_key = CCXLocator('OrgA', 'Course0', 'Run')
+        self._add_role(core.CourseInstructorRole.ROLE, org='OrgA')
+        self.assertEqual(
+            core._get_author_course_keys(self.user, [ccx_key] + self.course_keys[:2]), set(self.course_keys[:2])
+        )
+        self.user.is_staff = True
+        self.assertEqual(core._get_author_course_keys(self.user, [ccx_key]), set())
+
+    def test_inactive_user(self):
+        self._add_role(core.CourseStaffRole.ROLE, org='OrgA')
+        self.user.is_active = False
+        with self.assertNumQueries(0):
+            self.assertEqual(core._get_author_course_keys(self.user, self.course_keys), set())
+
+
+class RunIsolatedTest(TestCase):
+    """
+    Test running course exports in forked child processes.
+    """
+    course_key = CourseKey.from_string('course-v1:Org+Course+Run')
+
+    def setUp(self):
+        patcher = mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_ISOLATION_TIMEOUT', 10)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _run_timed(self, func, *args):
+        start = time.time()
+        result = core._run_isolated(self.course_key, func, *args)
+        return result, time.time() - start
+
+    def test_concurrent_runs(self):
+        # children of the slow thread must not inherit the pipes of the fast one, holding them open while they run
+        with futures.ThreadPoolExecutor(max_workers=2) as executor:
+            slow = executor.submit(lambda: [self._run_timed(time.sleep, 0.3) for __ in range(10)])
+            fast = executor.submit(lambda: [self._run_timed(abs, -n) for n in range(100)])
+            fast_runs = fast.result()
+            slow.result()
+        self.assertEqual([result for result, __ in fast_runs], list(range(100)))
+        self.assertLess(max(seconds for __, seconds in fast_runs), 0.25)
+
+    def test_compile_lock_free_in_child(self):
+        xsl_sheet = """<?xml version="1.0" encoding="UTF-8"?>
+<xsl:stylesheet xmlns:xsl="http://www.w3.org/1999/XSL/Transform" version="1.0">
+  <xsl:output method="text" />
+  <xsl:template match="/">isolated</xsl:template>
+</xsl:stylesheet>
+"""
+
+        def transform():
+            return str(xslt.get_transform(xsl_sheet)(etree.XML('<course/>')))
+
+        # as if another thread were compiling a stylesheet when the export forks
+        with xslt._compile_lock:
+            result, __ = self._run_timed(transform)
+        self.assertEqual(result, 'isolated')
+
+    def test_killed_after_timeout(self):
+        with mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_ISOLATION_TIMEOUT', 0.3):
+            with self.assertLogs(core.logger, 'WARNING') as logs:
+                with self.assertRaises(exceptions.ExportPluginsCourseExportError):
+                    self._run_timed(time.sleep, 10)
+        self.assertIn('exceeding its time limit', logs.output[0])
+
+    @skipUnless(os.path.exists('/proc/self/status'), 'peak RSS is only watched on Linux')
+    def test_killed_over_max_rss(self):
+        max_rss = core._peak_rss(os.getpid()) + 50 * 1000 * 1000
+
+        def allocate():
+            data = b'x' * (200 * 1000 * 1000)
+            time.sleep(10)
+            return len(data)
+
+        start = time.time()
+        with mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_ISOLATION_MAX_RSS', max_rss):
+            with self.assertLogs(core.logger, 'WARNING') as logs:
+                with self.assertRaises(exceptions.ExportPluginsCourseExportError):
+                    self._run_timed(allocate)
+        self.assertIn('exceeding its memory limit', logs.output[0])
+        self.assertLess(time.time() - start, 5)
+
+
+class RunIsolatedTransactionTest(DjangoTestCase):
+    """
+    Test running isolated course exports within a transaction, as views do with ATOMIC_REQUESTS.
+    """
+
+    def test_transaction_usable(self):
+        User.objects.create(username='before')
+        self.assertTrue(connection.in_atomic_block)
+        # connections to in-memory SQLite databases are never closed, unlike those to database servers
+        with mock.patch.object(connection, 'is_in_memory_db', return_value=False), \
+                mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_ISOLATION_TIMEOUT', 10):
+            self.assertEqual(core._run_isolated(CourseKey.from_string('course-v1:Org+Course+Run'), abs, -1), 1)
+        User.objects.create(username='after')
+        self.assertEqual(User.objects.filter(username__in=['before', 'after']).count(), 2)
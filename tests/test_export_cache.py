@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for the `openedx-export-plugins` export_cache module.
+"""
+
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from openedx_export_plugins import app_settings, export_cache
+from openedx_export_plugins.exporters import markdown
+
+
+class FakeS3Key(object):
+    """
+    S3 key of a mocked bucket, refusing copies onto itself that change nothing, as S3 does.
+    """
+    def __init__(self, bucket, name, contents):
+        self.bucket = bucket
+        self.name = name
+        self.contents = contents
+        self.metadata = {}
+        self.copies = 0
+
+    def get_contents_to_filename(self, filename):
+        with open(filename, 'wb') as f:
+            f.write(self.contents)
+
+    def copy(self, dst_bucket, dst_key, metadata=None, preserve_acl=False):
+        if dst_bucket == self.bucket.name and dst_key == self.name and metadata is None:
+            raise Exception("400 InvalidRequest: This copy request is illegal")
+        self.metadata = dict(metadata or self.metadata)
+        self.copies += 1
+
+
+class ThirdPartyPlugin(markdown.MarkdownCourseExportManager):
+    DEFAULT_XSL_STYLESHEET = '<xsl:stylesheet version="1.0"/>'
+
+
+class PythonEnginePlugin(markdown.MarkdownCourseExportManager):
+    markdown_engine = 'python'
+
+
+@mock.patch.object(export_cache.incremental, 'published_course_version', return_value='v1')
+class CacheKeyTest(TestCase):
+    """
+    Test that cache keys cover everything an export output depends on.
+    """
+
+    def _key(self, plugin_class=markdown.MarkdownCourseExportManager):
+        return export_cache.cache_key(None, plugin_class, 'course-v1:Org+Course+Run')
+
+    def test_settings(self, __):
+        key = self._key()
+        self.assertEqual(self._key(), key)
+        for name, value in (
+            ('COURSE_EXPORT_PLUGIN_MARKDOWN_ENGINE', 'python'),
+            ('COURSE_EXPORT_PLUGIN_COURSE_TREE_MODE', 'assembled'),
+            ('LMS_ROOT_URL', 'https://other.example.com'),
+        ):
+            with self.subTest(setting=name), mock.patch.object(app_settings, name, value):
+                self.assertNotEqual(self._key(), key)
+
+    def test_plugin_markdown_engine(self, __):
+        with mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_MARKDOWN_ENGINE', 'xsl'):
+            self.assertNotEqual(self._key(PythonEnginePlugin), self._key())
+        with mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_MARKDOWN_ENGINE', 'python'):
+            self.assertEqual(self._key(PythonEnginePlugin), self._key())
+
+    def test_third_party_stylesheet(self, __):
+        self.assertNotEqual(
+            export_cache.plugin_stylesheet_hash(ThirdPartyPlugin),
+            export_cache.plugin_stylesheet_hash(markdown.MarkdownCourseExportManager)
+        )
+
+
+class S3ExportCacheTest(TestCase):
+    """
+    Test the S3 tier of the export cache against a mocked bucket.
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.bucket = mock.Mock()
+        self.bucket.name = 'exports'
+        self.s3_key = FakeS3Key(self.bucket, 'course_exports/cache/abc', b'# Course')
+        self.bucket.get_key.side_effect = lambda name: self.s3_key if name == self.s3_key.name else None
+        with mock.patch('openedx_export_plugins.storage.get_s3_bucket', return_value=self.bucket):
+            self.cache = export_cache.S3ExportCache('course_exports/cache', 1024)
+        self.dest_path = os.path.join(self.tempdir, 'course', 'output.md')
+
+    def test_fetch_hit_marks_recently_used(self):
+        self.assertTrue(self.cache.fetch('abc', self.dest_path))
+        with open(self.dest_path, 'rb') as f:
+            self.assertEqual(f.read(), b'# Course')
+        self.assertEqual(self.s3_key.copies, 1)
+        self.assertIn('last-used', self.s3_key.metadata)
+
+    def test_fetch_miss(self):
+        self.assertFalse(self.cache.fetch('other', self.dest_path))
+        self.assertFalse(os.path.exists(self.dest_path))
+
+    def test_failed_recency_update_keeps_fetched_output(self):
+        self.s3_key.copy = mock.Mock(side_effect=Exception("503 Slow Down"))
+        self.assertTrue(self.cache.fetch('abc', self.dest_path))
+        with open(self.dest_path, 'rb') as f:
+            self.assertEqual(f.read(), b'# Course')
+
+    def test_evicted_once_per_interval(self):
+        self.bucket.list.return_value = []
+        src_path = os.path.join(self.tempdir, 'output.md')
+        with open(src_path, 'w') as f:
+            f.write('# Course')
+        with mock.patch.dict(export_cache._s3_evicted, clear=True), mock.patch.object(export_cache.time, 'time') as now:
+            for now.return_value in (1000, 1001, 1000 + export_cache.S3_EVICT_INTERVAL - 1):
+                self.cache.store('abc', src_path)
+            self.assertEqual(self.bucket.list.call_count, 1)
+            now.return_value = 1000 + export_cache.S3_EVICT_INTERVAL
+            self.cache.store('abc', src_path)
+            self.assertEqual(self.bucket.list.call_count, 2)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for the `openedx-export-plugins` export_runs management command.
+"""
+
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+from unittest import TestCase, mock
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from opaque_keys.edx.keys import CourseKey
+
+from openedx_export_plugins import app_settings, core, exceptions, journal, storage, tasks
+
+
+class FakePlugin(object):
+    name = 'fake'
+    filename_extension = 'md'
+    http_content_type = 'text/markdown'
+
+
+class ExportRunsCommandTest(TestCase):
+    """
+    Test listing, showing, resuming and discarding export runs.
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.root_dir = os.path.join(self.tempdir, 'runs')
+        self.course_keys = [CourseKey.from_string('course-v1:Org+Course{}+Run'.format(n)) for n in range(3)]
+        self.exported = []
+        for patcher in (
+            mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_RUN_JOURNAL_DIR', self.root_dir),
+            mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_STORAGE_TYPE', 'local'),
+            mock.patch.object(storage, 'COURSE_EXPORT_PLUGIN_STORAGE_DIR', os.path.join(self.tempdir, 'storage')),
+            mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_STORAGE_OVERWRITE', True),
+            mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_ARCHIVE_COMPRESSION', 'none'),
+            mock.patch.object(tasks.CourseExporterPluginManager, 'get_plugin', return_value=FakePlugin),
+            mock.patch.object(core, 'get_course_keys', return_value=self.course_keys),
+            mock.patch.object(core, '_do_course_export', side_effect=self._export_course),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _export_course(self, plugin_class, tempdir, course_key):
+        self.exported.append(course_key)
+        output_filepath = os.path.join(tempdir, core._get_target_dir(course_key), 'output.md')
+        os.makedirs(os.path.dirname(output_filepath))
+        with open(output_filepath, 'w') as f:
+            f.write('# {}\n'.format(course_key))
+        return output_filepath, core._get_output_filename(course_key, plugin_class.filename_extension)
+
+    def _run(self, run_id, finished=0, completed=False):
+        """
+        Journal a run that finished the first courses, and was completed or interrupted.
+        """
+        run = journal.ExportRunJournal('fake', run_id)
+        for course_key in self.course_keys[:finished]:
+            output_filepath, out_fn = self._export_course(FakePlugin, self.tempdir, course_key)
+            run.record(course_key, output_filepath, out_fn)
+            shutil.rmtree(os.path.dirname(output_filepath))
+        if completed:
+            run.complete('fake/all_courses_as_md.tar')
+        self.exported = []
+        return run
+
+    def _call(self, *args):
+        stdout = io.StringIO()
+        call_command('export_runs', *args, stdout=stdout)
+        return stdout.getvalue().splitlines()
+
+    def test_list(self):
+        self._run('2021-08-01', finished=3, completed=True)
+        self._run('2021-08-02', finished=1)
+        self._run('2021-08-03', finished=2).lock()
+
+        lines = self._call('list')
+        self.assertEqual(lines[0].split(), ['plugin', 'run', 'started', 'completed', 'courses'])
+        self.assertEqual([(line.split()[1], line.split()[-2:]) for line in lines[1:]], [
+            ('2021-08-01', [journal.ExportRunJournal('fake', '2021-08-01').completed, '3']),
+            ('2021-08-02', ['interrupted', '1']),
+            ('2021-08-03', ['running', '2']),
+        ])
+        self.assertEqual(self._call('list', 'other'), lines[:1])
+
+    def test_show(self):
+        self._run('2021-08-01', finished=3, completed=True)
+        self._run('2021-08-02', finished=1)
+
+        lines = self._call('show', 'fake')
+        self.assertTrue(lines[0].startswith('Run 2021-08-02 of fake, started '))
+        self.assertEqual(lines[1], 'Interrupted, 2 courses remaining')
+        out_fn = core._get_output_filename(self.course_keys[0], 'md')
+        self.assertEqual(lines[2:], ['{} {}'.format(self.course_keys[0], out_fn)])
+
+        lines = self._call('show', 'fake', '--run-id', '2021-08-01')
+        self.assertTrue(lines[1].endswith('archive stored at fake/all_courses_as_md.tar'))
+        self.assertEqual(len(lines), 5)
+
+        self._run('2021-08-02').lock()
+        self.assertTrue(self._call('show', 'fake')[1].startswith('In progress in '))
+
+    def test_resume_skips_finished_courses(self):
+        self._run('2021-08-01', finished=1)
+
+        lines = self._call('resume', 'fake')
+        self.assertEqual(lines, ['Resuming run 2021-08-01 of fake after 1 courses'])
+        self.assertEqual(self.exported, self.course_keys[1:])
+        run = journal.ExportRunJournal('fake', '2021-08-01')
+        self.assertIsNotNone(run.completed)
+        self.assertIsNone(run.lock_holder())
+        with tarfile.open(storage.get_local_path(run.archive)) as archive:
+            self.assertEqual(archive.getnames(), [
+                core._get_output_filename(course_key, 'md') for course_key in self.course_keys
+            ])
+
+    def test_resume_refused(self):
+        self._run('2021-08-01', finished=3, completed=True)
+        with self.assertRaisesRegex(CommandError, 'No interrupted run of fake'):
+            self._call('resume', 'fake')
+        with self.assertRaisesRegex(CommandError, 'A plugin is required'):
+            self._call('resume')
+
+        self._run('2021-08-02', finished=1).lock()
+        with self.assertRaisesRegex(CommandError, 'in progress in'):
+            self._call('resume', 'fake')
+        self.assertEqual(self.exported, [])
+
+    def test_resume_started_meanwhile(self):
+        self._run('2021-08-01', finished=1)
+        in_progress = exceptions.ExportPluginsRunInProgressError('Run 2021-08-01 of fake was started meanwhile')
+        with mock.patch.object(tasks, 'export_all_courses_as', side_effect=in_progress):
+            with self.assertRaisesRegex(CommandError, 'started meanwhile'):
+                self._call('resume', 'fake')
+
+    def test_discard(self):
+        run = self._run('2021-08-01', finished=1)
+        with self.assertRaisesRegex(CommandError, 'A run id is required'):
+            self._call('discard', 'fake')
+        self.assertEqual(self._call('discard', 'fake', '--run-id', '2021-08-01'), ['Discarded run 2021-08-01 of fake'])
+        self.assertFalse(os.path.exists(run.dir))
+        with self.assertRaisesRegex(CommandError, 'No run 2021-08-01 of fake'):
+            self._call('discard', 'fake', '--run-id', '2021-08-01')
+
+        self._run('2021-08-02').lock()
+        with self.assertRaisesRegex(CommandError, 'in progress in'):
+            self._call('discard', 'fake', '--run-id', '2021-08-02')
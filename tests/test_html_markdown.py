@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for the `openedx-export-plugins` html_markdown module.
+
+The HTML fragments in fixtures/html_markdown are converted with both
+Markdown engines, html_to_markdown_2.xsl and the native Python
+HTMLMarkdownConverter, and compared with the golden Markdown next to them.
+"""
+
+import io
+import json
+import os
+from unittest import TestCase
+
+from fs.memoryfs import MemoryFS
+from lxml import etree
+
+from openedx_export_plugins.exporters import resolvers, xslt
+from openedx_export_plugins.exporters.html_markdown import HTMLMarkdownConverter
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures', 'html_markdown')
+
+BASE_URL = 'https://lms.example.com/'
+
+ASSETS = {
+    'handout.pdf': {'filename': 'asset-v1:Org+Course+Run+type@asset+block@handout.pdf'},
+    'notes.pdf': {'filename': 'asset-v1:Org+Course+Run+type@asset+block@notes.pdf'},
+    'diagram.png': {'filename': 'asset-v1:Org+Course+Run+type@asset+block@diagram.png'},
+}
+
+# applies the html_to_markdown_2.xsl rules of md_single_doc.xsl to an HTML document
+XSL_ENGINE_STYLESHEET = """<?xml version="1.0" encoding="UTF-8"?>
+<xsl:stylesheet xmlns:xsl="http://www.w3.org/1999/XSL/Transform" version="1.0">
+  <xsl:import href="pylocal:md_single_doc.xsl" />
+  <xsl:output method="text" encoding="UTF-8" />
+  <xsl:template match="/">
+    <xsl:apply-templates select="html" mode="markdown" />
+  </xsl:template>
+</xsl:stylesheet>
+"""
+
+
+def _fixture_names():
+    return sorted(name[:-len('.html')] for name in os.listdir(FIXTURES_DIR) if name.endswith('.html'))
+
+
+def _read_fixture(filename):
+    with io.open(os.path.join(FIXTURES_DIR, filename), encoding='utf-8') as f:
+        return f.read()
+
+
+class HTMLMarkdownGoldenTest(TestCase):
+    """
+    Compare the output of both Markdown engines with golden Markdown.
+    """
+
+    def setUp(self):
+        export_fs = MemoryFS()
+        export_fs.makedir('policies')
+        export_fs.writetext('policies/assets.json', json.dumps(ASSETS))
+        self.export_context = resolvers.ExportResolverContext([resolvers.AssetURLResolver(export_fs)])
+        self.parser = etree.XMLParser(recover=True)
+
+    def _parse(self, name):
+        document = resolvers.normalize_html(_read_fixture(name + '.html'))
+        return etree.fromstring(document, self.parser)
+
+    def _xsl_markdown(self, name):
+        transform = xslt.get_transform(XSL_ENGINE_STYLESHEET)
+        with self.export_context:
+            return str(transform(self._parse(name), baseURL="'{}'".format(BASE_URL)))
+
+    def _python_markdown(self, name):
+        with self.export_context:
+            converter = HTMLMarkdownConverter(BASE_URL, self.export_context.asset_url)
+            return converter.convert(self._parse(name))
+
+    def test_fixtures_present(self):
+        self.assertTrue(_fixture_names())
+        for name in _fixture_names():
+            self.assertTrue(os.path.exists(os.path.join(FIXTURES_DIR, name + '.md')), name)
+
+    def test_xsl_engine_matches_golden(self):
+        for name in _fixture_names():
+            with self.subTest(fixture=name):
+                self.assertEqual(self._xsl_markdown(name), _read_fixture(name + '.md'))
+
+    def test_python_engine_matches_golden(self):
+        for name in _fixture_names():
+            with self.subTest(fixture=name):
+                self.assertEqual(self._python_markdown(name), _read_fixture(name + '.md'))
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for the `openedx-export-plugins` incremental module.
+"""
+
+import contextlib
+import datetime
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from opaque_keys.edx.keys import CourseKey
+
+from openedx_export_plugins import incremental
+
+
+class FakeContentStore(object):
+    """
+    Content store holding a list of asset upload dates.
+    """
+    def __init__(self):
+        self.upload_dates = []
+
+    def get_all_content_for_course(self, course_key, start=0, maxresults=-1, sort=None):
+        assets = [{'uploadDate': upload_date} for upload_date in sorted(self.upload_dates, reverse=True)]
+        return assets[start:start + maxresults], len(assets)
+
+
+class FakeModuleStore(object):
+    """
+    Modulestore with a single published course version.
+    """
+    def __init__(self, version):
+        self.version = version
+
+    @contextlib.contextmanager
+    def branch_setting(self, branch, course_key):
+        yield
+
+    def get_course(self, course_key, depth=0):
+        return mock.Mock(course_version=self.version)
+
+
+class CourseExportRecordTest(TestCase):
+    """
+    Test reusing kept course outputs.
+    """
+
+    def setUp(self):
+        self.course_key = CourseKey.from_string('course-v1:Org+Course+Run')
+        self.root_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root_dir)
+        self.output_path = os.path.join(self.root_dir, 'output.md')
+        with open(self.output_path, 'w') as f:
+            f.write('# Course')
+        self.content_store = FakeContentStore()
+        self.content_store.upload_dates.append(datetime.datetime(2020, 1, 1))
+        patcher = mock.patch.object(incremental, 'contentstore', return_value=self.content_store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.plugin_class = mock.Mock(filename_extension='md')
+        self.plugin_class.name = 'markdown'
+
+    def _record(self, store):
+        return incremental.CourseExportRecord(self.plugin_class, store, os.path.join(self.root_dir, 'kept'))
+
+    def _keep_output(self, store):
+        record = self._record(store)
+        record.record(self.course_key, self.output_path)
+        record.save()
+
+    def test_unchanged_course_is_reused(self):
+        store = FakeModuleStore('v1')
+        self._keep_output(store)
+        self.assertIsNotNone(self._record(store).reusable_output(self.course_key))
+
+    def test_new_course_version_is_regenerated(self):
+        self._keep_output(FakeModuleStore('v1'))
+        self.assertIsNone(self._record(FakeModuleStore('v2')).reusable_output(self.course_key))
+
+    def test_uploaded_asset_is_regenerated(self):
+        store = FakeModuleStore('v1')
+        self._keep_output(store)
+        self.content_store.upload_dates.append(datetime.datetime(2020, 2, 1))
+        self.assertIsNone(self._record(store).reusable_output(self.course_key))
+
+    def test_deleted_asset_is_regenerated(self):
+        store = FakeModuleStore('v1')
+        self.content_store.upload_dates.append(datetime.datetime(2019, 1, 1))
+        self._keep_output(store)
+        self.content_store.upload_dates.remove(datetime.datetime(2019, 1, 1))
+        self.assertIsNone(self._record(store).reusable_output(self.course_key))
@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for the `openedx-export-plugins` journal module.
+"""
+
+import io
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from unittest import TestCase, mock
+
+from opaque_keys.edx.keys import CourseKey
+
+from openedx_export_plugins import app_settings, exceptions, journal
+
+
+class ExportRunJournalTest(TestCase):
+    """
+    Test journaling, resuming and completing export runs.
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.root_dir = os.path.join(self.tempdir, 'runs')
+        self.course_keys = [CourseKey.from_string('course-v1:Org+Course{}+Run'.format(n)) for n in range(3)]
+
+    def _journal(self, run_id='run'):
+        return journal.ExportRunJournal('fake', run_id, self.root_dir)
+
+    def _record(self, run, course_key):
+        output_filepath = os.path.join(self.tempdir, 'output.md')
+        with open(output_filepath, 'w') as f:
+            f.write('# {}\n'.format(course_key))
+        run.record(course_key, output_filepath, '{}.md'.format(course_key.course))
+
+    def _journal_path(self, run):
+        return os.path.join(run.dir, journal.JOURNAL_FILENAME)
+
+    def test_resume_skips_finished_courses(self):
+        run = self._journal()
+        for course_key in self.course_keys[:2]:
+            self._record(run, course_key)
+
+        resumed = self._journal()
+        self.assertIsNotNone(resumed.started)
+        self.assertIsNone(resumed.completed)
+        path, filename = resumed.finished_output(self.course_keys[0])
+        with open(path) as f:
+            self.assertEqual(f.read(), '# {}\n'.format(self.course_keys[0]))
+        self.assertEqual(filename, 'Course0.md')
+        self.assertIsNotNone(resumed.finished_output(self.course_keys[1]))
+        self.assertIsNone(resumed.finished_output(self.course_keys[2]))
+        self.assertEqual(resumed.resumed, self.course_keys[:2])
+
+    def test_missing_output_exported_again(self):
+        run = self._journal()
+        self._record(run, self.course_keys[0])
+        os.remove(os.path.join(run.dir, run.courses[str(self.course_keys[0])]['output']))
+        with self.assertLogs(journal.logger, 'WARNING'):
+            self.assertIsNone(self._journal().finished_output(self.course_keys[0]))
+
+    def test_resume_after_partial_last_line(self):
+        run = self._journal()
+        self._record(run, self.course_keys[0])
+        # the worker was killed while journaling the second course
+        with open(self._journal_path(run), 'ab') as f:
+            f.write(b'{"course": "course-v1:Org+Cou')
+
+        resumed = self._journal()
+        self.assertEqual(list(resumed.courses), [str(self.course_keys[0])])
+        self._record(resumed, self.course_keys[1])
+        with io.open(self._journal_path(run), encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[-2], '{"course": "course-v1:Org+Cou')
+        self.assertEqual(
+            list(self._journal().courses), [str(course_key) for course_key in self.course_keys[:2]]
+        )
+
+    def test_complete_and_restart(self):
+        run = self._journal()
+        for course_key in self.course_keys:
+            self._record(run, course_key)
+        run.complete('fake/all_courses.tar.gz')
+        self.assertEqual(os.listdir(run.dir), [journal.JOURNAL_FILENAME])
+
+        completed = self._journal()
+        self.assertIsNotNone(completed.completed)
+        self.assertEqual(completed.archive, 'fake/all_courses.tar.gz')
+        self.assertEqual(len(completed.courses), 3)
+
+        completed.restart()
+        self.assertIsNone(completed.completed)
+        self.assertEqual(completed.courses, {})
+        restarted = self._journal()
+        self.assertIsNone(restarted.completed)
+        self.assertEqual(restarted.courses, {})
+
+    def test_discard(self):
+        run = self._journal()
+        self._record(run, self.course_keys[0])
+        run.discard()
+        self.assertFalse(os.path.exists(run.dir))
+
+    def test_list_runs(self):
+        # started and journaled at the same time
+        started = ['2021-08-02T00:00:00'] * 2 + ['2021-08-01T00:00:00'] * 2
+        with mock.patch.object(journal, '_now', side_effect=started):
+            self._journal('later')
+            self._journal('earlier')
+        journal.ExportRunJournal('other', 'run', self.root_dir)
+
+        runs = journal.list_runs(root_dir=self.root_dir)
+        self.assertEqual([(run.plugin, run.run_id) for run in runs][:2], [('fake', 'earlier'), ('fake', 'later')])
+        self.assertEqual(len(runs), 3)
+        self.assertEqual([run.plugin for run in journal.list_runs('other', self.root_dir)], ['other'])
+        self.assertEqual(journal.list_runs(root_dir=os.path.join(self.tempdir, 'missing')), [])
+
+
+class ExportRunLockTest(TestCase):
+    """
+    Test that a run in progress isn't run by another process meanwhile.
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.root_dir = os.path.join(self.tempdir, 'runs')
+
+    def _journal(self):
+        return journal.ExportRunJournal('fake', 'run', self.root_dir)
+
+    def _lock_path(self, run):
+        return os.path.join(run.dir, journal.LOCK_FILENAME)
+
+    def _hold_lock(self, run, holder):
+        with open(self._lock_path(run), 'w') as f:
+            f.write(holder)
+
+    def test_lock_held_until_unlocked(self):
+        run = self._journal()
+        self.assertIsNone(run.lock_holder())
+        run.lock()
+        holder = '{}:{}'.format(socket.gethostname(), os.getpid())
+        self.assertEqual(self._journal().lock_holder(), holder)
+        with self.assertRaises(exceptions.ExportPluginsRunInProgressError):
+            self._journal().lock()
+
+        run.unlock()
+        self.assertIsNone(self._journal().lock_holder())
+        self._journal().lock()
+
+    def test_lock_kept_on_restart(self):
+        run = self._journal()
+        run.lock()
+        run.complete('fake/all_courses.tar.gz')
+        run.restart()
+        self.assertIsNotNone(self._journal().lock_holder())
+
+    def test_lock_of_dead_process_taken_over(self):
+        process = subprocess.Popen([sys.executable, '-c', ''])
+        process.wait()
+        run = self._journal()
+        self._hold_lock(run, '{}:{}'.format(socket.gethostname(), process.pid))
+        self.assertIsNone(run.lock_holder())
+        run.lock()
+        self.assertEqual(run.lock_holder(), '{}:{}'.format(socket.gethostname(), os.getpid()))
+
+    def test_lock_of_other_host_times_out(self):
+        run = self._journal()
+        self._hold_lock(run, 'otherhost:1')
+        self.assertEqual(run.lock_holder(), 'otherhost:1')
+        self.assertRaises(exceptions.ExportPluginsRunInProgressError, run.lock)
+
+        timeout = app_settings.COURSE_EXPORT_PLUGIN_RUN_JOURNAL_LOCK_TIMEOUT
+        stale = time.time() - timeout - 60
+        os.utime(self._lock_path(run), (stale, stale))
+        self.assertIsNone(run.lock_holder())
+        run.lock()
+
+    def test_lock_refreshed_as_courses_finish(self):
+        run = self._journal()
+        run.lock()
+        stale = time.time() - app_settings.COURSE_EXPORT_PLUGIN_RUN_JOURNAL_LOCK_TIMEOUT - 60
+        os.utime(self._lock_path(run), (stale, stale))
+        output_filepath = os.path.join(self.tempdir, 'output.md')
+        with open(output_filepath, 'w') as f:
+            f.write('# course\n')
+        run.record(CourseKey.from_string('course-v1:Org+Course+Run'), output_filepath, 'Course.md')
+        self.assertIsNotNone(self._journal().lock_holder())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for the `openedx-export-plugins` Markdown exporter.
+
+The OLX export in fixtures/markdown/course is transformed each way the
+exporter can run, and the outputs are compared byte for byte.
+"""
+
+import datetime
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from fs.osfs import OSFS
+from lxml import etree
+
+from openedx_export_plugins import app_settings
+from openedx_export_plugins.exporters import markdown
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures', 'markdown', 'course')
+
+# settings of the exports compared, unless a test overrides them
+EXPORT_SETTINGS = dict(
+    LMS_ROOT_URL='https://lms.example.com',
+    COURSE_EXPORT_PLUGIN_MARKDOWN_ENGINE='xsl',
+    COURSE_EXPORT_PLUGIN_COURSE_TREE_MODE='dynamic',
+    COURSE_EXPORT_PLUGIN_HTML_NORMALIZE_WORKERS=0,
+    COURSE_EXPORT_PLUGIN_MARKDOWN_TRANSFORM_WORKERS=1,
+    COURSE_EXPORT_PLUGIN_MARKDOWN_STREAMING=False,
+)
+
+
+class FakeDatetime(datetime.datetime):
+    """
+    A datetime whose now() is fixed, so export dates don't differ between runs.
+    """
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2021, 8, 16, 3, 0)
+
+
+@mock.patch.object(markdown.datetime, 'datetime', FakeDatetime)
+class MarkdownDocumentTest(TestCase):
+    """
+    Test that every way of transforming a Markdown export writes the same document.
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+
+    def _export(self, **settings):
+        """
+        Transform a fresh copy of the fixture export with the given settings and return the Markdown bytes.
+        """
+        export_dir = tempfile.mkdtemp(dir=self.tempdir)
+        shutil.copytree(FIXTURE_DIR, os.path.join(export_dir, 'course'))
+        with OSFS(export_dir) as root_fs:
+            export_fs = root_fs.opendir('course')
+            root = etree.fromstring(export_fs.readbytes('course.xml'))
+            exporter = markdown.MarkdownCourseExportManager(
+                None, None, 'course-v1:Org+Course+2021', export_dir, 'course'
+            )
+            with mock.patch.multiple(app_settings, **dict(EXPORT_SETTINGS, **settings)):
+                exporter.post_process(root, export_fs)
+            return export_fs.readbytes('output.md')
+
+    def test_fixture_rendered(self):
+        output = self._export().decode('utf-8')
+        for text in ('title: Streaming Course', 'Introduction', 'First Steps', 'Café', 'Right', 'Glossary'):
+            self.assertIn(text, output)
+        self.assertNotIn('Staff Notes', output)
+
+    def test_streamed_matches_whole(self):
+        self.assertEqual(self._export(COURSE_EXPORT_PLUGIN_MARKDOWN_STREAMING=True), self._export())
+
+    def test_parallel_matches_serial(self):
+        serial = self._export(COURSE_EXPORT_PLUGIN_MARKDOWN_STREAMING=True)
+        self.assertEqual(self._export(COURSE_EXPORT_PLUGIN_MARKDOWN_TRANSFORM_WORKERS=2), serial)
+        # in daemonic processes the parts are transformed in threads
+        with mock.patch.object(markdown.multiprocessing, 'current_process', return_value=mock.Mock(daemon=True)):
+            self.assertEqual(self._export(COURSE_EXPORT_PLUGIN_MARKDOWN_TRANSFORM_WORKERS=2), serial)
+
+    def test_broken_pool_transforms_serially(self):
+        serial = self._export(COURSE_EXPORT_PLUGIN_MARKDOWN_STREAMING=True)
+        with mock.patch.object(markdown, '_transform_document_part', _die):
+            self.assertEqual(self._export(COURSE_EXPORT_PLUGIN_MARKDOWN_TRANSFORM_WORKERS=2), serial)
+
+    def test_bulk_normalized_matches_lazy(self):
+        lazy = self._export()
+        for workers, pool in ((1, 'thread'), (2, 'thread'), (2, 'process')):
+            with self.subTest(workers=workers, pool=pool):
+                settings = dict(
+                    COURSE_EXPORT_PLUGIN_HTML_NORMALIZE_WORKERS=workers, COURSE_EXPORT_PLUGIN_HTML_NORMALIZE_POOL=pool
+                )
+                self.assertEqual(self._export(**settings), lazy)
+                self.assertEqual(self._export(COURSE_EXPORT_PLUGIN_MARKDOWN_STREAMING=True, **settings), lazy)
+
+
+def _die(export_dir, root_xml, part):
+    os._exit(1)  # pylint: disable=protected-access
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for the `openedx-export-plugins` markdown_direct module.
+
+A small course is rendered from a fake modulestore and compared with the
+golden Markdown in fixtures/markdown_direct.
+"""
+
+import contextlib
+import datetime
+import io
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from lxml import etree
+from opaque_keys.edx.keys import CourseKey
+
+from openedx_export_plugins.exporters import markdown_direct, resolvers, xslt
+from xmodule.modulestore.exceptions import ItemNotFoundError
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), 'fixtures', 'markdown_direct')
+
+COURSE_KEY = CourseKey.from_string('course-v1:Org+Course+Run')
+
+OVERVIEW = """<section class="about"><h2>About This Course</h2><p>Learn things.</p></section>
+<section class="prerequisites"><h2>Requirements</h2><p>None.</p></section>"""
+
+# content saved with an XML declaration, which lxml refuses in str
+HTML_WITH_DECLARATION = """<?xml version="1.0" encoding="utf-8"?>
+<p>Café diagram: <img src="/static/diagram.png" alt="Diagram"/></p>"""
+
+PROBLEM_WITH_DECLARATION = """<?xml version="1.0" encoding="utf-8"?>
+<problem><p>What is 2 + 2?</p><stringresponse answer="4"><textline/></stringresponse></problem>"""
+
+# resolves an asset URL as html_to_markdown_2.xsl does
+ASSET_URL_STYLESHEET = """<?xml version="1.0" encoding="UTF-8"?>
+<xsl:stylesheet xmlns:xsl="http://www.w3.org/1999/XSL/Transform" version="1.0">
+  <xsl:output method="text" />
+  <xsl:template match="/">
+    <xsl:value-of select="document('asseturl:/static/images/diagram.png')" />
+    <xsl:text>|</xsl:text>
+    <xsl:value-of select="document('asseturl:https://example.com/diagram.png')" />
+  </xsl:template>
+</xsl:stylesheet>
+"""
+
+
+class FakeStaticContent(object):
+    """
+    The asset key computation of xmodule's StaticContent.
+    """
+
+    @staticmethod
+    def compute_location(course_key, path):
+        return course_key.make_asset_key('asset', path.lstrip('/').replace('/', '_'))
+
+
+class FakeField(object):
+
+    def __init__(self, scope, value):
+        self.scope = scope
+        self.value = value
+
+    def is_set_on(self, block):
+        return self.value is not None
+
+    def read_from(self, block):
+        return self.value
+
+
+class FakeBlock(object):
+
+    def __init__(self, block_type, display_name, children=(), data=None, fields=None, visible_to_staff_only=False):
+        self.location = COURSE_KEY.make_usage_key(block_type, display_name.lower().replace(' ', '_'))
+        self.display_name = display_name
+        self.data = data
+        self.fields = fields or {}
+        self.visible_to_staff_only = visible_to_staff_only
+        self.children = list(children)
+        self.has_children = bool(self.children)
+        self.items = []
+        self.tabs = []
+
+    def get_children(self):
+        return self.children
+
+
+class FakeTab(object):
+
+    def __init__(self, url_slug, name):
+        self.url_slug = url_slug
+        self.name = name
+        self.course_staff_only = False
+
+
+class FakeModuleStore(object):
+
+    def __init__(self, course, items):
+        self.course = course
+        self.items = items
+
+    @contextlib.contextmanager
+    def branch_setting(self, branch_setting, course_key):
+        yield
+
+    def get_course(self, course_key, depth=0):
+        return self.course
+
+    def get_item(self, usage_key):
+        try:
+            return self.items[(usage_key.block_type, usage_key.block_id)]
+        except KeyError:
+            raise ItemNotFoundError(usage_key)
+
+
+class FakeContentStore(object):
+
+    def get_all_content_for_course(self, course_key):
+        assets = [
+            {'contentType': 'image/png', 'displayname': 'diagram.png'},
+            {'contentType': 'application/pdf', 'displayname': 'handout.pdf'},
+        ]
+        return assets, len(assets)
+
+
+def _build_course():
+    video = FakeBlock('video', 'Intro Video', fields={
+        'youtube_id_1_0': FakeField(markdown_direct.Scope.content, 'abc123'),
+        'display_name': FakeField(markdown_direct.Scope.settings, 'Intro Video'),
+        'download_video': FakeField(markdown_direct.Scope.settings, None),
+    })
+    vertical = FakeBlock('vertical', 'Unit One', children=[
+        FakeBlock('html', 'Diagram', data=HTML_WITH_DECLARATION),
+        FakeBlock('html', 'Staff Notes', data='<p>Staff only.</p>', visible_to_staff_only=True),
+        FakeBlock('problem', 'Sum', data=PROBLEM_WITH_DECLARATION),
+        video,
+    ])
+    course = FakeBlock('course', 'Direct Course', children=[
+        FakeBlock('chapter', 'Week One', children=[FakeBlock('sequential', 'Lesson One', children=[vertical])]),
+    ])
+    course.tabs = [FakeTab('syllabus', 'Syllabus')]
+    updates = FakeBlock('course_info', 'updates')
+    updates.items = [
+        {'status': 'visible', 'date': 'August 16, 2021', 'content': '<p>Welcome!</p>'},
+        {'status': 'deleted', 'date': 'August 1, 2021', 'content': '<p>Gone.</p>'},
+    ]
+    items = {
+        ('about', 'overview'): FakeBlock('about', 'overview', data=OVERVIEW),
+        ('about', 'short_description'): FakeBlock('about', 'short_description', data='<section>Short.</section>'),
+        ('course_info', 'updates'): updates,
+        ('course_info', 'handouts'): FakeBlock('course_info', 'handouts', data='<ol><li>Read this.</li></ol>'),
+        ('static_tab', 'syllabus'): FakeBlock('static_tab', 'syllabus', data='<p>Week one: basics.</p>'),
+    }
+    return FakeModuleStore(course, items)
+
+
+class DirectMarkdownCourseExporterTest(TestCase):
+    """
+    Test rendering a course to Markdown straight from the modulestore.
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        for patcher in (
+            mock.patch.object(markdown_direct, 'StaticContent', FakeStaticContent),
+            mock.patch.object(markdown_direct.app_settings, 'LMS_ROOT_URL', 'https://lms.example.com'),
+            mock.patch.object(markdown_direct.app_settings, 'COURSE_EXPORT_PLUGIN_MARKDOWN_ENGINE', 'xsl'),
+            mock.patch.object(markdown_direct, 'datetime'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        markdown_direct.datetime.datetime.now.return_value = datetime.datetime(2021, 8, 16, 3, 0)
+
+    def _export(self):
+        exporter = markdown_direct.DirectMarkdownCourseExporter(
+            _build_course(), FakeContentStore(), COURSE_KEY, self.tempdir, 'course'
+        )
+        exporter.export()
+        with io.open(os.path.join(self.tempdir, 'course', 'output.md'), encoding='utf-8') as f:
+            return f.read()
+
+    def test_matches_golden(self):
+        with io.open(os.path.join(FIXTURES_DIR, 'course.md'), encoding='utf-8') as f:
+            self.assertEqual(self._export(), f.read())
+
+
+class StaticAssetURLResolverTest(TestCase):
+    """
+    Test resolving /static/ asset URLs from the course key.
+    """
+
+    def setUp(self):
+        patcher = mock.patch.object(markdown_direct, 'StaticContent', FakeStaticContent)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.resolver = markdown_direct.StaticAssetURLResolver(COURSE_KEY)
+
+    def test_lookup_asset_url(self):
+        self.assertEqual(
+            self.resolver.lookup_asset_url('/static/images/diagram.png'),
+            'asset-v1:Org+Course+Run+type@asset+block@images_diagram.png'
+        )
+        self.assertIsNone(self.resolver.lookup_asset_url('https://example.com/diagram.png'))
+
+    def test_resolve(self):
+        with resolvers.ExportResolverContext([self.resolver]):
+            result = xslt.get_transform(ASSET_URL_STYLESHEET)(etree.XML('<course/>'))
+        self.assertEqual(str(result), 'asset-v1:Org+Course+Run+type@asset+block@images_diagram.png|')
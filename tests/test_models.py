@@ -4,4 +4,61 @@
 Tests for the `openedx-export-plugins` models module.
 """
 
+from django.contrib.auth.models import User
+from django.test import TestCase
 
+from opaque_keys.edx.keys import CourseKey
+
+from openedx_export_plugins.models import ExportJob
+
+
+class ExportJobTest(TestCase):
+    """
+    Test the status and progress an export job records.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(username='author')
+        self.course_keys = [CourseKey.from_string('course-v1:Org+Course{}+Run'.format(n)) for n in range(3)]
+        self.job = ExportJob(user=self.user, plugin='markdown')
+        self.job.course_keys = self.course_keys
+        self.job.save()
+
+    def _reloaded(self):
+        return ExportJob.objects.get(id=self.job.id)
+
+    def test_created(self):
+        job = self._reloaded()
+        self.assertEqual(job.status, ExportJob.PENDING)
+        self.assertEqual(job.course_keys, self.course_keys)
+        self.assertEqual(job.archive_format, 'tar')
+        self.assertFalse(job.single_course)
+
+    def test_start(self):
+        self.job.start(3)
+        job = self._reloaded()
+        self.assertEqual(job.status, ExportJob.RUNNING)
+        self.assertEqual((job.courses_done, job.courses_total), (0, 3))
+
+    def test_update_progress(self):
+        self.job.start(3)
+        self.job.update_progress(2, 3)
+        job = self._reloaded()
+        self.assertEqual(job.status, ExportJob.RUNNING)
+        self.assertEqual((job.courses_done, job.courses_total), (2, 3))
+
+    def test_succeed(self):
+        self.job.start(3)
+        self.job.succeed('jobs/{}/all_courses.tar'.format(self.job.id), 'all_courses.tar', 'application/tar')
+        job = self._reloaded()
+        self.assertEqual(job.status, ExportJob.SUCCEEDED)
+        self.assertEqual(job.storage_path, 'jobs/{}/all_courses.tar'.format(self.job.id))
+        self.assertEqual(job.filename, 'all_courses.tar')
+        self.assertEqual(job.content_type, 'application/tar')
+
+    def test_fail(self):
+        self.job.start(3)
+        self.job.fail('export failed')
+        job = self._reloaded()
+        self.assertEqual(job.status, ExportJob.FAILED)
+        self.assertEqual(job.error, 'export failed')
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for the `openedx-export-plugins` resolvers module.
+"""
+
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from fs.memoryfs import MemoryFS
+from fs.osfs import OSFS
+from lxml import etree
+
+from openedx_export_plugins.exporters import resolvers, xslt
+
+# looks the same document up twice, and a malformed one
+LOOKUP_STYLESHEET = """<?xml version="1.0" encoding="UTF-8"?>
+<xsl:stylesheet xmlns:xsl="http://www.w3.org/1999/XSL/Transform" version="1.0">
+  <xsl:output method="text" />
+  <xsl:template match="/">
+    <xsl:value-of select="document('tmpfs:chapter/one.xml')/chapter/@display_name" />
+    <xsl:text>|</xsl:text>
+    <xsl:value-of select="count(document('tmpfs:chapter/one.xml')//sequential)" />
+    <xsl:text>|</xsl:text>
+    <xsl:value-of select="count(document('tmpfs:chapter/broken.xml')//sequential)" />
+    <xsl:text>|</xsl:text>
+    <xsl:value-of select="count(document('tmpfs:chapter/empty.xml')//sequential)" />
+  </xsl:template>
+</xsl:stylesheet>
+"""
+
+
+class ExportFSCacheTest(TestCase):
+    """
+    Test reading export documents once per export and parsing them once per transform.
+    """
+
+    def setUp(self):
+        self.export_fs = MemoryFS()
+        self.export_fs.makedir('chapter')
+        self.export_fs.writebytes('chapter/one.xml', (
+            b'<chapter display_name="One"><sequential url_name="s1"/><sequential url_name="s2"/></chapter>'
+        ))
+        self.export_fs.writebytes('chapter/broken.xml', b'<chapter><sequential url_name="s1"></chapter>')
+        self.export_fs.writebytes('chapter/empty.xml', b'\n')
+        self.cache = resolvers.ExportFSCache(self.export_fs)
+
+    def test_document_read_once_and_not_parsed(self):
+        with mock.patch.object(self.export_fs, 'readbytes', wraps=self.export_fs.readbytes) as readbytes, \
+                mock.patch.object(resolvers.etree, 'fromstring', side_effect=AssertionError('parsed')):
+            document = self.cache.document('tmpfs:chapter/one.xml')
+            self.assertIs(self.cache.document('tmpfs:chapter/one.xml'), document)
+        self.assertEqual(readbytes.call_count, 1)
+
+    def test_missing_and_empty_documents(self):
+        self.assertIsNone(self.cache.document('tmpfs:chapter/missing.xml'))
+        self.assertIsNone(self.cache.document('tmpfs:chapter/empty.xml'))
+
+    def test_transform_resolves_document_once(self):
+        resolver = resolvers.ExportFSResolver(self.export_fs, self.cache)
+        with mock.patch.object(resolver, 'resolve', wraps=resolver.resolve) as resolve:
+            with resolvers.ExportResolverContext([resolver]):
+                result = xslt.get_transform(LOOKUP_STYLESHEET)(etree.XML('<course/>'))
+        # malformed documents are recovered by the transform's parser, empty ones are empty
+        self.assertEqual(str(result), 'One|2|1|0')
+        looked_up = [call[0][0] for call in resolve.call_args_list]
+        self.assertEqual(looked_up.count('tmpfs:chapter/one.xml'), 1)
+
+
+class PrepareHTMLTest(TestCase):
+    """
+    Test normalizing the HTML fragments of an export in bulk.
+    """
+    fragments = {
+        'html/good.html': '<p>Good <b>bold</b></p>',
+        'html/bad.html': '<p>Bad <b>bold</p>',
+        'about/empty.html': '',
+    }
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.export_fs = OSFS(self.tempdir)
+        self.addCleanup(self.export_fs.close)
+        for path, fragment in self.fragments.items():
+            self.export_fs.makedirs(path.split('/')[0], recreate=True)
+            self.export_fs.writetext(path, fragment)
+
+    def _assert_prepared(self, export_fs, workers=1, use_processes=False):
+        cache = resolvers.ExportFSCache(export_fs)
+        report = cache.prepare_html(workers, use_processes=use_processes)
+        self.assertEqual((report.fragments, report.fixed, report.dropped), (3, 1, 1))
+        # nothing but whether the fragments are usable is kept in memory
+        self.assertEqual(sorted(cache._prepared.values()), [False, True, True])
+        expected = {path: resolvers.normalize_html(fragment) for path, fragment in self.fragments.items()}
+        with mock.patch.object(resolvers, 'normalize_html', side_effect=AssertionError('normalized again')):
+            for path in self.fragments:
+                self.assertEqual(cache.document('tmpfs:' + path), expected[path])
+
+    def test_serial(self):
+        self._assert_prepared(self.export_fs)
+
+    def test_thread_pool(self):
+        self._assert_prepared(self.export_fs, workers=2)
+
+    def test_process_pool(self):
+        self._assert_prepared(self.export_fs, workers=2, use_processes=True)
+
+    def test_process_pool_in_memory(self):
+        memory_fs = MemoryFS()
+        for path, fragment in self.fragments.items():
+            memory_fs.makedirs(path.split('/')[0], recreate=True)
+            memory_fs.writetext(path, fragment)
+        # there is no file a pool process could open, so threads normalize the fragments
+        self._assert_prepared(memory_fs, workers=2, use_processes=True)
+
+    def test_released_with_documents(self):
+        cache = resolvers.ExportFSCache(self.export_fs)
+        cache.prepare_html()
+        with mock.patch.object(self.export_fs, 'readbytes', wraps=self.export_fs.readbytes) as readbytes:
+            document = cache.document('tmpfs:html/good.html')
+            cache.clear_documents()
+            self.assertEqual(cache.document('tmpfs:html/good.html'), document)
+        self.assertEqual([call[0][0] for call in readbytes.call_args_list], ['html/good.html.xhtml'] * 2)
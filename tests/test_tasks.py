@@ -0,0 +1,367 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for the `openedx-export-plugins` tasks module.
+"""
+
+import datetime
+import gzip
+import lzma
+import os
+import shutil
+import tarfile
+import tempfile
+import time
+import zipfile
+from unittest import TestCase, mock
+
+from celery import current_app
+from django.contrib.auth.models import User
+from django.test import TestCase as DjangoTestCase
+from django.utils import timezone
+from opaque_keys.edx.keys import CourseKey
+
+from openedx_export_plugins import app_settings, core, storage, tasks
+from openedx_export_plugins.models import ExportJob
+
+
+class FakePlugin(object):
+    name = 'fake'
+    filename_extension = 'md'
+    http_content_type = 'text/markdown'
+
+
+def _raise_error(plugin, error):
+    raise error
+
+
+class WorkerLost(BaseException):
+    """
+    The worker process of a task killed midway.
+    """
+
+
+class ArchiveTestMixin(object):
+    """
+    Course outputs in a parts directory, as left by per-course exports.
+    """
+
+    def setUp(self):
+        super(ArchiveTestMixin, self).setUp()
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.parts_dir = os.path.join(self.tempdir, 'parts')
+        os.makedirs(self.parts_dir)
+        self.course_keys = [CourseKey.from_string('course-v1:Org+Course{}+Run'.format(n)) for n in range(3)]
+        for course_key in self.course_keys:
+            with open(core._get_part_path(FakePlugin, course_key, self.parts_dir), 'w') as f:
+                f.write('# {}\n'.format(course_key) * 100)
+
+    def assert_terminated_tar(self, tar_data):
+        # two zero blocks end the archive, which is padded to whole records
+        self.assertEqual(tar_data[-2 * tarfile.BLOCKSIZE:], tarfile.NUL * 2 * tarfile.BLOCKSIZE)
+        self.assertEqual(len(tar_data) % tarfile.RECORDSIZE, 0)
+
+
+class FinishArchiveTest(ArchiveTestMixin, TestCase):
+    """
+    Test finishing the archives of multi-course exports before storing them.
+    """
+
+    def _finish(self, outfilename, archive_format):
+        archive_dir = os.path.join(self.tempdir, 'archive')
+        os.makedirs(archive_dir)
+        archives = core.archive_course_parts(
+            FakePlugin, self.course_keys, self.parts_dir, archive_dir, outfilename, archive_format=archive_format
+        )
+        return tasks._finish_archive(archives, archive_format)
+
+    def test_tar(self):
+        with mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_ARCHIVE_COMPRESSION', 'none'):
+            path = self._finish('courses.tar', 'tar')
+        with open(path, 'rb') as f:
+            self.assert_terminated_tar(f.read())
+        with tarfile.open(path) as archive:
+            self.assertEqual(len(archive.getnames()), 3)
+
+    def test_gzipped_tar(self):
+        with mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_ARCHIVE_COMPRESSION', 'gzip'):
+            path = self._finish('courses.tar', 'tar')
+        self.assertTrue(path.endswith('.tar.gz'))
+        with gzip.open(path, 'rb') as f:
+            self.assert_terminated_tar(f.read())
+
+    def test_xz_tar(self):
+        with mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_ARCHIVE_COMPRESSION', 'xz'):
+            path = self._finish('courses.tar', 'tar')
+        self.assertTrue(path.endswith('.tar.xz'))
+        with lzma.open(path, 'rb') as f:
+            self.assert_terminated_tar(f.read())
+
+    def test_zip(self):
+        path = self._finish('courses.zip', 'zip')
+        with zipfile.ZipFile(path) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(len(archive.namelist()), 3)
+
+
+class FanOutExportTest(ArchiveTestMixin, TestCase):
+    """
+    Test fanned out exports, with Celery running tasks eagerly.
+    """
+
+    def setUp(self):
+        super(FanOutExportTest, self).setUp()
+        self.fanout_dir = os.path.join(self.tempdir, 'fanout')
+        self.storage_dir = os.path.join(self.tempdir, 'storage')
+        always_eager = current_app.conf.task_always_eager
+        current_app.conf.task_always_eager = True
+        self.addCleanup(setattr, current_app.conf, 'task_always_eager', always_eager)
+        for patcher in (
+            mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_TASK_FANOUT_DIR', self.fanout_dir),
+            mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_STORAGE_TYPE', 'local'),
+            mock.patch.object(storage, 'COURSE_EXPORT_PLUGIN_STORAGE_DIR', self.storage_dir),
+            mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_STORAGE_OVERWRITE', True),
+            mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_ARCHIVE_COMPRESSION', 'none'),
+            mock.patch.object(tasks.CourseExporterPluginManager, 'get_plugin', return_value=FakePlugin),
+            mock.patch.object(tasks.core, 'get_course_keys', return_value=self.course_keys),
+            mock.patch.object(tasks, '_notify_error', side_effect=_raise_error),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.attempts = {}
+
+    def _export_course_part(self, plugin_class, course_key, parts_dir):
+        """
+        Export the first course never, the second on its second try and the third at once.
+        """
+        attempt = self.attempts[course_key] = self.attempts.get(course_key, 0) + 1
+        if course_key == self.course_keys[0] or (course_key == self.course_keys[1] and attempt == 1):
+            raise IOError('export failed')
+        shutil.copy(core._get_part_path(plugin_class, course_key, self.parts_dir), parts_dir)
+        return core._get_part_path(plugin_class, course_key, parts_dir)
+
+    def test_retry_then_drop_and_assemble(self):
+        with mock.patch.object(tasks.core, 'export_course_part', side_effect=self._export_course_part):
+            tasks.fan_out_export_all_courses_as('fake')
+
+        retries = app_settings.COURSE_EXPORT_PLUGIN_TASK_FANOUT_RETRIES
+        self.assertEqual(self.attempts[self.course_keys[0]], retries + 1)
+        self.assertEqual(self.attempts[self.course_keys[1]], 2)
+        self.assertEqual(self.attempts[self.course_keys[2]], 1)
+        with tarfile.open(storage.get_local_path('fake/all_courses_as_md.tar')) as archive:
+            self.assertEqual(archive.getnames(), [
+                core._get_output_filename(course_key, 'md') for course_key in self.course_keys[1:]
+            ])
+        # the parts directory is removed once the archive is stored
+        self.assertEqual(os.listdir(self.fanout_dir), [])
+
+    def _deliver(self, course_key, parts_dir, lost=False):
+        """
+        Deliver the subtask exporting a course, its worker killed midway if lost.
+        """
+        def export_course_part(plugin_class, course_key, parts_dir):
+            if lost:
+                self.attempts[course_key] = self.attempts.get(course_key, 0) + 1
+                raise WorkerLost()
+            return self._export_course_part(plugin_class, course_key, parts_dir)
+
+        with mock.patch.object(tasks.core, 'export_course_part', side_effect=export_course_part):
+            # a killed worker doesn't clean up after itself
+            with mock.patch.object(tasks.os, 'remove') if lost else mock.MagicMock():
+                return tasks.export_course_part('fake', str(course_key), parts_dir)
+
+    def test_course_parts_redelivered_on_worker_lost(self):
+        self.assertTrue(tasks.export_course_part.acks_late)
+        self.assertTrue(tasks.export_course_part.reject_on_worker_lost)
+        course_key = self.course_keys[2]
+        parts_dir = os.path.join(self.tempdir, 'delivered')
+        os.makedirs(parts_dir)
+        for __ in range(app_settings.COURSE_EXPORT_PLUGIN_TASK_FANOUT_REDELIVERIES):
+            self.assertRaises(WorkerLost, self._deliver, course_key, parts_dir, lost=True)
+        part_path = core._get_part_path(FakePlugin, course_key, parts_dir)
+        self.assertEqual(self._deliver(course_key, parts_dir), part_path)
+        self.assertEqual(os.listdir(parts_dir), [os.path.basename(part_path)])
+
+    def test_course_parts_dropped_after_redeliveries(self):
+        course_key = self.course_keys[2]
+        parts_dir = os.path.join(self.tempdir, 'delivered')
+        os.makedirs(parts_dir)
+        redeliveries = app_settings.COURSE_EXPORT_PLUGIN_TASK_FANOUT_REDELIVERIES
+        for __ in range(redeliveries + 1):
+            self.assertRaises(WorkerLost, self._deliver, course_key, parts_dir, lost=True)
+        with self.assertLogs(tasks.logger, 'ERROR'):
+            self.assertIsNone(self._deliver(course_key, parts_dir))
+        self.assertEqual(self.attempts[course_key], redeliveries + 1)
+        self.assertFalse(os.path.exists(core._get_part_path(FakePlugin, course_key, parts_dir)))
+
+    def test_assembly_failure_logged(self):
+        with mock.patch.object(tasks, '_store_archive', side_effect=IOError('storage full')):
+            with self.assertLogs(tasks.logger, 'ERROR') as logs:
+                self.assertRaises(IOError, tasks.assemble_course_parts, 'fake', [], self.parts_dir)
+        self.assertIn('storage full', logs.output[0])
+        self.assertFalse(os.path.exists(self.parts_dir))
+
+    def test_stale_parts_dirs_removed(self):
+        stale_dir = os.path.join(self.fanout_dir, 'fake-stale')
+        recent_dir = os.path.join(self.fanout_dir, 'fake-recent')
+        os.makedirs(stale_dir)
+        os.makedirs(recent_dir)
+        two_days_ago = time.time() - app_settings.COURSE_EXPORT_PLUGIN_TASK_FANOUT_MAX_AGE - 60
+        os.utime(stale_dir, (two_days_ago, two_days_ago))
+        with mock.patch.object(tasks.core, 'export_course_part', side_effect=self._export_course_part):
+            tasks.fan_out_export_all_courses_as('fake')
+        self.assertEqual(os.listdir(self.fanout_dir), ['fake-recent'])
+
+
+class ScheduledExportsTest(TestCase):
+    """
+    Test which plugins scheduled exports export together.
+    """
+
+    def setUp(self):
+        for patcher in (
+            mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_SCHEDULED_PLUGINS', ('markdown', 'html')),
+            mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_SHARED_OLX', True),
+            mock.patch.object(tasks, '_shares_olx_export', return_value=True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _scheduled_plugins(self):
+        return [plugin for plugin, __ in tasks._get_scheduled_exports()]
+
+    def test_shared(self):
+        self.assertEqual(self._scheduled_plugins(), ['markdown, html'])
+
+    def test_not_shared_with_unsupported_options(self):
+        for name, value in (
+            ('COURSE_EXPORT_PLUGIN_INCREMENTAL', True),
+            ('COURSE_EXPORT_PLUGIN_RUN_JOURNAL', True),
+            ('COURSE_EXPORT_PLUGIN_EXPORT_WORKERS', 4),
+        ):
+            with self.subTest(setting=name), mock.patch.object(app_settings, name, value):
+                self.assertEqual(self._scheduled_plugins(), ['markdown', 'html'])
+
+
+class RunExportJobTest(ArchiveTestMixin, DjangoTestCase):
+    """
+    Test running asynchronous export jobs.
+    """
+
+    def setUp(self):
+        super(RunExportJobTest, self).setUp()
+        self.user = User.objects.create(username='staff', is_staff=True)
+        for patcher in (
+            mock.patch.object(storage, 'COURSE_EXPORT_PLUGIN_STORAGE_DIR', os.path.join(self.tempdir, 'storage')),
+            mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_STORAGE_TYPE', 'local'),
+            mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_ARCHIVE_COMPRESSION', 'none'),
+            mock.patch.object(tasks.CourseExporterPluginManager, 'get_plugin', return_value=FakePlugin),
+            mock.patch.object(core, '_do_course_export', side_effect=self._do_course_export),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _do_course_export(self, plugin_class, tempdir, course_key):
+        output_filepath = os.path.join(tempdir, 'output.md')
+        shutil.copy(core._get_part_path(plugin_class, course_key, self.parts_dir), output_filepath)
+        return output_filepath, core._get_output_filename(course_key, plugin_class.filename_extension)
+
+    def _run_job(self, course_keys, **kwargs):
+        job = ExportJob(user=self.user, plugin='fake', **kwargs)
+        job.course_keys = course_keys
+        job.save()
+        tasks.run_export_job(str(job.id))
+        return ExportJob.objects.get(id=job.id)
+
+    def test_single_course(self):
+        job = self._run_job(self.course_keys[:1], single_course=True)
+        self.assertEqual(job.status, ExportJob.SUCCEEDED, job.error)
+        self.assertEqual(job.filename, core._get_output_filename(self.course_keys[0], 'md'))
+        self.assertEqual(job.content_type, 'text/markdown')
+        self.assertEqual((job.courses_done, job.courses_total), (1, 1))
+
+    def test_all_courses_matching_one_archived(self):
+        job = self._run_job(self.course_keys[:1])
+        self.assertEqual(job.status, ExportJob.SUCCEEDED, job.error)
+        self.assertTrue(job.filename.endswith('.tar'))
+        self.assertEqual(job.content_type, 'application/tar')
+        with tarfile.open(storage.get_local_path(job.storage_path)) as archive:
+            self.assertEqual(archive.getnames(), [core._get_output_filename(self.course_keys[0], 'md')])
+
+    def test_all_courses(self):
+        job = self._run_job(self.course_keys, archive_format='zip')
+        self.assertEqual(job.status, ExportJob.SUCCEEDED, job.error)
+        self.assertEqual(job.content_type, 'application/zip')
+        self.assertEqual((job.courses_done, job.courses_total), (3, 3))
+        with zipfile.ZipFile(storage.get_local_path(job.storage_path)) as archive:
+            self.assertEqual(len(archive.namelist()), 3)
+
+
+class CleanUpExportJobsTest(DjangoTestCase):
+    """
+    Test failing stale export jobs and deleting expired ones.
+    """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.user = User.objects.create(username='author')
+        for patcher in (
+            mock.patch.object(storage, 'COURSE_EXPORT_PLUGIN_STORAGE_DIR', self.tempdir),
+            mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_STORAGE_TYPE', 'local'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _job(self, status, seconds_ago, stored=False):
+        job = ExportJob.objects.create(user=self.user, plugin='fake', course_ids='[]', status=status)
+        if stored:
+            job.storage_path = 'jobs/{}/courses.tar'.format(job.id)
+            os.makedirs(os.path.dirname(storage.get_local_path(job.storage_path)))
+            with open(storage.get_local_path(job.storage_path), 'w') as f:
+                f.write('archive')
+            job.save()
+        ExportJob.objects.filter(id=job.id).update(modified=timezone.now() - datetime.timedelta(seconds=seconds_ago))
+        return job
+
+    def _status(self, job):
+        return ExportJob.objects.get(id=job.id).status
+
+    def test_stale_jobs_failed(self):
+        stale_after = app_settings.COURSE_EXPORT_PLUGIN_JOB_STALE_AFTER
+        stale_running = self._job(ExportJob.RUNNING, stale_after + 60)
+        stale_pending = self._job(ExportJob.PENDING, stale_after + 60)
+        running = self._job(ExportJob.RUNNING, stale_after - 60)
+        with self.assertLogs(tasks.logger, 'WARNING'):
+            tasks.clean_up_export_jobs()
+        self.assertEqual(self._status(stale_running), ExportJob.FAILED)
+        self.assertIn('no progress', ExportJob.objects.get(id=stale_running.id).error)
+        self.assertEqual(self._status(stale_pending), ExportJob.FAILED)
+        self.assertEqual(self._status(running), ExportJob.RUNNING)
+
+    def test_expired_jobs_deleted(self):
+        expires = app_settings.COURSE_EXPORT_PLUGIN_JOB_EXPIRES
+        expired = self._job(ExportJob.SUCCEEDED, expires + 60, stored=True)
+        expired_failed = self._job(ExportJob.FAILED, expires + 60)
+        recent = self._job(ExportJob.SUCCEEDED, expires - 60, stored=True)
+        tasks.clean_up_export_jobs()
+        self.assertEqual(list(ExportJob.objects.values_list('id', flat=True)), [recent.id])
+        self.assertFalse(os.path.exists(os.path.dirname(storage.get_local_path(expired.storage_path))))
+        self.assertTrue(os.path.exists(storage.get_local_path(recent.storage_path)))
+        self.assertFalse(ExportJob.objects.filter(id=expired_failed.id).exists())
+
+    def test_expired_s3_artifacts_deleted(self):
+        expired = self._job(ExportJob.SUCCEEDED, app_settings.COURSE_EXPORT_PLUGIN_JOB_EXPIRES + 60)
+        ExportJob.objects.filter(id=expired.id).update(storage_path='jobs/{}/courses.tar'.format(expired.id))
+        with mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_STORAGE_TYPE', 's3'), \
+                mock.patch.object(storage, 'do_delete_s3') as do_delete_s3:
+            tasks.clean_up_export_jobs()
+        do_delete_s3.assert_called_once_with('jobs/{}/courses.tar'.format(expired.id))
+        self.assertFalse(ExportJob.objects.exists())
+
+    def test_expiry_disabled(self):
+        self._job(ExportJob.SUCCEEDED, app_settings.COURSE_EXPORT_PLUGIN_JOB_EXPIRES + 60)
+        with mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_JOB_EXPIRES', 0):
+            tasks.clean_up_export_jobs()
+        self.assertTrue(ExportJob.objects.exists())
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tests for the `openedx-export-plugins` views module.
+"""
+
+import datetime
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.test import TestCase
+from django.utils import timezone
+
+from opaque_keys.edx.keys import CourseKey
+
+from openedx_export_plugins import app_settings, core, storage, tasks, views
+from openedx_export_plugins.models import ExportJob
+
+
+class FakePlugin(object):
+    name = 'fake'
+    filename_extension = 'md'
+    http_content_type = 'text/markdown'
+
+
+class ExportJobViewsTest(TestCase):
+    """
+    Test enqueueing asynchronous export jobs and reporting and downloading them.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create(username='author')
+        self.client.force_login(self.user)
+        self.course_key = CourseKey.from_string('course-v1:Org+Course+Run')
+        store = mock.Mock()
+        store.get_course.return_value = mock.Mock(id=self.course_key)
+        for patcher in (
+            mock.patch.object(views.CourseExporterPluginManager, 'get_plugin', return_value=FakePlugin),
+            mock.patch.object(views, 'modulestore', return_value=store),
+            mock.patch.object(core, 'get_course_keys', return_value=[self.course_key]),
+            mock.patch.object(tasks.run_export_job, 'apply_async'),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _create_job(self, user=None, **kwargs):
+        job = ExportJob(user=user or self.user, plugin='fake', **kwargs)
+        job.course_keys = [self.course_key]
+        job.save()
+        return job
+
+    def test_post_enqueues_job(self):
+        with mock.patch.object(transaction, 'on_commit', side_effect=lambda func: func()):
+            response = self.client.post('/export/all/fake')
+        self.assertEqual(response.status_code, 202)
+        job = ExportJob.objects.get()
+        self.assertEqual(response.json()['id'], str(job.id))
+        self.assertEqual(response.json()['status'], ExportJob.PENDING)
+        self.assertEqual(response['Location'], 'http://testserver/export/jobs/{}'.format(job.id))
+        tasks.run_export_job.apply_async.assert_called_once_with((str(job.id),), queue=tasks.QUEUE)
+
+    def test_post_all_courses_matching_one_is_archived(self):
+        self.client.post('/export/all/fake')
+        self.assertFalse(ExportJob.objects.get().single_course)
+
+    def test_post_course_url_is_single_course(self):
+        response = self.client.post('/export/{}/fake'.format(self.course_key))
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(ExportJob.objects.get().single_course)
+
+    def test_post_modified_since(self):
+        self.client.post('/export/all/fake', {'modified_since': '2021-08-01', 'org': ['OrgA', 'OrgB']})
+        core.get_course_keys.assert_called_once_with(
+            orgs=['OrgA', 'OrgB'], modified_since=datetime.datetime(2021, 8, 1, tzinfo=timezone.utc)
+        )
+
+    def test_post_unparsable_modified_since(self):
+        response = self.client.post('/export/all/fake', {'modified_since': 'last week'})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ExportJob.objects.exists())
+
+    def test_status(self):
+        job = self._create_job()
+        job.start(1)
+        response = self.client.get('/export/jobs/{}'.format(job.id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], ExportJob.RUNNING)
+        self.assertEqual(response.json()['courses_total'], 1)
+
+    def test_other_users_job_not_found(self):
+        job = self._create_job(user=User.objects.create(username='other'))
+        self.assertEqual(self.client.get('/export/jobs/{}'.format(job.id)).status_code, 404)
+        self.assertEqual(self.client.get('/export/jobs/{}/download'.format(job.id)).status_code, 404)
+
+    def test_download_before_success_conflicts(self):
+        job = self._create_job()
+        job.start(1)
+        response = self.client.get('/export/jobs/{}/download'.format(job.id))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['status'], ExportJob.RUNNING)
+
+    def test_local_download(self):
+        storage_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, storage_dir)
+        job = self._create_job()
+        storage_path = 'jobs/{}/course.md'.format(job.id)
+        with mock.patch.object(storage, 'COURSE_EXPORT_PLUGIN_STORAGE_DIR', storage_dir), \
+                mock.patch.object(app_settings, 'COURSE_EXPORT_PLUGIN_STORAGE_TYPE', 'local'):
+            os.makedirs(os.path.dirname(storage.get_local_path(storage_path)))
+            with open(storage.get_local_path(storage_path), 'w') as f:
+                f.write('# Course\n')
+            job.succeed(storage_path, 'course.md', 'text/markdown')
+            response = self.client.get('/export/jobs/{}/download'.format(job.id))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(b''.join(response.streaming_content), b'# Course\n')
+            response.close()
+        self.assertEqual(response['Content-Type'], 'text/markdown')
+        self.assertIn('filename="course.md"', response['Content-Disposition'])
+
+
+class ParseModifiedSinceTest(TestCase):
+    """
+    Test parsing the modified_since parameter of all-courses exports.
+    """
+
+    def test_aware_datetime(self):
+        self.assertEqual(
+            views._parse_modified_since('2021-08-01T12:30:00+02:00'),
+            datetime.datetime(2021, 8, 1, 10, 30, tzinfo=timezone.utc)
+        )
+
+    def test_naive_datetime_is_utc(self):
+        self.assertEqual(
+            views._parse_modified_since('2021-08-01T12:30:00'),
+            datetime.datetime(2021, 8, 1, 12, 30, tzinfo=timezone.utc)
+        )
+
+    def test_date_is_midnight_utc(self):
+        self.assertEqual(
+            views._parse_modified_since('2021-08-01'), datetime.datetime(2021, 8, 1, tzinfo=timezone.utc)
+        )
+
+    def test_unparsable(self):
+        for value in ('last week', '2021-13-01', '2021-02-30T10:00:00', ''):
+            with self.subTest(value=value):
+                self.assertIsNone(views._parse_modified_since(value))